@@ -25,12 +25,14 @@ from .console import Console
 from .cache import Cache
 from .mail import MailServer
 from .sites import Sites
-from .context import Context
+from .context import Context, Expression
 from .filtercontainer import FilterContainer
 from . import namespaces
 from .containers import OrderedDict, LRUCache
 from .elements.dataelement import DataElement
 from .library import FailedDocument
+from .parser import Parser
+from .urlmapper import URLMapper
 from .elements.registry import ElementRegistry
 from .tools import url_join
 from .compat import text_type, iteritems, itervalues, zip_longest
@@ -84,6 +86,15 @@ class Signals(object):
     def add_handler(self, signal_name, element_ref, sender):
         self.handlers.append((signal_name, element_ref, sender))
 
+    def get_cache_stats(self):
+        """Get statistics for the cache of matching handlers"""
+        return self._cache.get_stats()
+
+    def set_handlers(self, handlers):
+        """Replace all handlers"""
+        self.handlers = handlers
+        self._cache.clear()
+
     @classmethod
     def _compare_signal(cls, signal_name, compare_signal_name):
         """Compare signal names, potentially with a wildcard"""
@@ -239,6 +250,8 @@ class Archive(object):
         self.app_settings = defaultdict(SettingsContainer)
         self.app_system_settings = defaultdict(SettingsContainer)
         self.cfg = None
+        self.expression_cache_path = None
+        self.compile_templates = False
         self.settings = SettingsContainer()
         self.templates_fs = MultiFS()
         self.data_fs = MultiFS()
@@ -249,6 +262,8 @@ class Archive(object):
         self.template_engines = {}
         self.database_engines = {}
         self.caches = {}
+        # Maps cache name on to the next time it should be evicted
+        self._cache_evict_times = {}
         self.mail_servers = {}
         self.default_mail_server = None
         self.default_db_engine = None
@@ -279,6 +294,7 @@ class Archive(object):
         self.enum = {}
         self.enum_by_lib = {}
         self.signals = Signals()
+        self._template_lib_cache = LRUCache()
 
         self._moyarc = None
         self.console = self.create_console()
@@ -328,6 +344,30 @@ class Archive(object):
             lib_fs = base_fs.opendir(dir_name)
             return lib_fs
 
+    def get_expression_cache_path(self):
+        """Get the system path to the expression cache file, or None"""
+        path = self.expression_cache_path
+        if not path:
+            return None
+        if os.path.isabs(path):
+            return path
+        base = self.project_fs.getsyspath("/", allow_none=True)
+        if base is None:
+            return None
+        return os.path.join(base, path)
+
+    def load_expression_cache(self):
+        """Load compiled expressions from the parser cache and the expression cache file"""
+        if self.has_cache("parser"):
+            if Expression.load(self.get_cache("parser")):
+                startup_log.debug("expression cache loaded")
+        expression_cache_path = self.get_expression_cache_path()
+        if expression_cache_path is not None:
+            if Expression.load_file(expression_cache_path):
+                startup_log.debug(
+                    "expression cache file '%s' mapped", expression_cache_path
+                )
+
     def get_relative_path(self, path):
         """Get a relative path from the project base"""
         base = self.project_fs.getsyspath("/", allow_none=True)
@@ -702,6 +742,179 @@ class Archive(object):
                     if not model.abstract:
                         model.get_table_and_class(app)
 
+    _remapped_types = (
+        (namespaces.default, "url"),
+        (namespaces.default, "middleware"),
+        (namespaces.default, "handle"),
+    )
+
+    def rebuild_documents(self, locations, server=None):
+        """Re-parse and rebuild modified documents, without rebuilding the project.
+
+        Returns True if the documents were rebuilt, or False if they contain
+        elements that can't be rebuilt in place (such as models or custom tags), and
+        the project should be rebuilt in full.
+
+        """
+        start = time()
+        documents = []
+        for location in locations:
+            for lib in itervalues(self.libs):
+                document = lib.get_document(location) if lib.finalized else None
+                if document is not None:
+                    break
+            else:
+                # A new document, or not part of a library
+                return False
+            if not self._can_rebuild_elements(lib, itervalues(document.elements)):
+                return False
+            documents.append(document)
+
+        # Parse first, so nothing is changed if the new documents can't be rebuilt
+        new_documents = []
+        for document in documents:
+            # The filesystem the library was imported from is closed, but the
+            # document location is a system path
+            dir_path, filename = os.path.split(document.location)
+            try:
+                with open_fs(dir_path) as dir_fs:
+                    parser = Parser(self, dir_fs, filename, library=document.lib)
+                    new_document = parser.parse()
+            except (FSError, errors.ParseError, errors.ElementError):
+                return False
+            if new_document is None or not self._can_rebuild_structure(
+                document, new_document.structure
+            ):
+                return False
+            new_document.path = document.path
+            new_documents.append(new_document)
+
+        mountpoints = {}
+        for document, new_document in zip(documents, new_documents):
+            lib = document.lib
+            for element in itervalues(document.elements):
+                if element._element_type == (namespaces.default, "mountpoint"):
+                    mountpoints[(lib.long_name, element.name)] = element
+            index = lib.documents.index(document)
+            lib.remove_document(document)
+            lib.documents.insert(index, new_document)
+
+        if self.build(new_documents, log_time=False) is False:
+            return False
+
+        for new_document in new_documents:
+            lib = new_document.lib
+            if not self._can_rebuild_elements(lib, itervalues(new_document.elements)):
+                return False
+            for element in itervalues(new_document.elements):
+                if element._element_type == (namespaces.default, "mountpoint"):
+                    # Mounted by the server, so the url mappers must be kept
+                    old_mountpoint = mountpoints[(lib.long_name, element.name)]
+                    element.urlmapper = old_mountpoint.urlmapper
+                    element.middleware = old_mountpoint.middleware
+            new_document.lib_finalize(
+                lib.get_finalize_context(), exclude=self._remapped_types
+            )
+            del new_document.structure
+            lib.sort_elements()
+
+        self._remap_urls(server)
+        self._remap_signals()
+
+        startup_log.debug(
+            "%s rebuilt %s %0.1fms",
+            self,
+            ", ".join(text_type(document) for document in new_documents),
+            (time() - start) * 1000.0,
+        )
+        return True
+
+    def _can_rebuild_elements(self, lib, elements):
+        """Check elements may be rebuilt in place."""
+        for element in elements:
+            if not element.can_rebuild_in_place():
+                return False
+            if element.libid is not None and not element.libid.startswith(
+                lib.long_name + "#"
+            ):
+                # Replaces an element in another library
+                return False
+        return True
+
+    def _can_rebuild_structure(self, document, structure):
+        """Check the elements in a parsed document may be rebuilt in place."""
+        default = namespaces.default
+        mountpoint_names = set()
+        for node in itervalues(structure.nodes):
+            if node.text_node:
+                continue
+            element_type = self.registry.get_element_type(node.xmlns, node.tag_name)
+            if element_type is None or not element_type.can_rebuild_in_place():
+                return False
+            attrs = node.attrs.get(default, {})
+            if "#" in attrs.get("libname", ""):
+                return False
+            if node.tag_type == (default, "mountpoint"):
+                mountpoint_names.add(attrs.get("name", "main"))
+        old_mountpoint_names = set(
+            element.name
+            for element in itervalues(document.elements)
+            if element._element_type == (default, "mountpoint")
+        )
+        # The server mounts mountpoints by name
+        return mountpoint_names == old_mountpoint_names
+
+    def _iter_finalized_elements(self, element_type):
+        """Yield (<finalize context>, <element>) in the order libraries are built"""
+        for lib in itervalues(self.libs):
+            if lib.finalized:
+                context = lib.get_finalize_context()
+                for element in lib.get_elements_by_type(element_type):
+                    yield context, element
+
+    def _remap_urls(self, server=None):
+        """Map the routes from url and middleware tags again."""
+        mountpoints = [
+            mountpoint
+            for _, mountpoint in self._iter_finalized_elements("mountpoint")
+        ]
+        mappers = {}
+        # Map in to new mappers, so requests never see partial routes
+        for mountpoint in mountpoints:
+            urlmapper = URLMapper(mountpoint.urlmapper.name)
+            mappers[urlmapper] = mountpoint.urlmapper
+            mountpoint.urlmapper = urlmapper
+            middleware = {}
+            for stage, stage_mapper in iteritems(mountpoint.middleware):
+                middleware[stage] = urlmapper = URLMapper(stage_mapper.name)
+                mappers[urlmapper] = stage_mapper
+            mountpoint.middleware = middleware
+        try:
+            for element_type in ("url", "middleware"):
+                for context, element in self._iter_finalized_elements(element_type):
+                    element.lib_finalize(context)
+        finally:
+            for mountpoint in mountpoints:
+                urlmapper = mountpoint.urlmapper
+                mountpoint.urlmapper = mappers[urlmapper]
+                mountpoint.middleware = {
+                    stage: mappers[stage_mapper]
+                    for stage, stage_mapper in iteritems(mountpoint.middleware)
+                }
+        for new_mapper, mapper in iteritems(mappers):
+            mapper.replace_routes(new_mapper, mappers)
+        if server is not None:
+            server.urlmapper.clear_cache()
+            for urlmapper in itervalues(server.middleware):
+                urlmapper.clear_cache()
+
+    def _remap_signals(self):
+        """Add the handlers from handle tags again."""
+        handlers = []
+        for context, element in self._iter_finalized_elements("handle"):
+            handlers.extend(element.get_handlers(context))
+        self.signals.set_handlers(handlers)
+
     def create_app(self, name, lib_name):
         if name in self.apps:
             raise errors.ArchiveError(
@@ -958,6 +1171,54 @@ class Archive(object):
         )
         return cache
 
+    def get_cache_evict_interval(self):
+        """Get the shortest evict interval of all caches (in seconds), or None"""
+        intervals = [
+            cache.evict_interval
+            for cache in self.caches.values()
+            if getattr(cache, "evict_interval", 0)
+        ]
+        if not intervals:
+            return None
+        return min(intervals) / 1000.0
+
+    def evict_caches(self):
+        """Evict expired values from caches that are due to be evicted"""
+        now = time()
+        evict_times = self._cache_evict_times
+        for name, cache in list(self.caches.items()):
+            evict_interval = getattr(cache, "evict_interval", 0)
+            if not evict_interval:
+                continue
+            if now < evict_times.get(name, 0):
+                continue
+            evict_times[name] = now + evict_interval / 1000.0
+            try:
+                removed = cache.evict()
+            except Exception:
+                log.exception("failed to evict cache '%s'", name)
+            else:
+                if removed:
+                    cache.stats.evictions += removed
+
+    def get_cache_stats(self, top=10):
+        """Get a dict that maps cache names on to their statistics"""
+        return {
+            name: cache.get_stats(top=top)
+            for name, cache in sorted(self.caches.items())
+            if cache.enabled and hasattr(cache, "get_stats")
+        }
+
+    def get_lru_stats(self, server=None):
+        """Get statistics for the in-memory caches used internally"""
+        stats = OrderedDict()
+        if server is not None:
+            stats["routes"] = server.urlmapper.get_cache_stats()
+        stats["signals"] = self.signals.get_cache_stats()
+        stats["sites"] = self.sites.get_cache_stats()
+        stats["template_libs"] = self._template_lib_cache.get_stats()
+        return stats
+
     def get_mailserver(self, name=None):
         name = name or self.default_mail_server or "default"
         try:
@@ -993,6 +1254,14 @@ class Archive(object):
         self.lib_paths = cfg.get_list("project", "paths", "./local\n./external")
 
         self.lib_paths = self.lib_paths[:] + [MOYA_LIBS_PATH]
+        Expression.compile_python = cfg.get_bool(
+            "project", "compile_expressions", True
+        )
+        expression_cache_size = cfg.get_int("project", "expression_cache_size")
+        if expression_cache_size is not None:
+            Expression.set_cache_size(expression_cache_size)
+        self.expression_cache_path = cfg.get("project", "expression_cache", None)
+        self.compile_templates = cfg.get_bool("project", "compile_templates", False)
 
         if "console" in cfg:
             self.log_logger = cfg.get("console", "logger", None)
@@ -1139,7 +1408,7 @@ class Archive(object):
             else:
                 startup_log.warn("unknown settings section, [%s]", section_name)
 
-        self.init_template_engine("moya", {})
+        self.init_template_engine("moya", {"compile": self.compile_templates})
 
     def init_media(self):
         if "media" not in self.filesystems:
@@ -1251,10 +1520,11 @@ class Archive(object):
         template_path = abspath(join(base_path, app.templates_directory, path))
         return template_path
 
-    def get_template_lib(self, path, _cache=LRUCache()):
-        if path in _cache:
-            return _cache[path]
-        lib = None
+    def get_template_lib(self, path):
+        _cache = self._template_lib_cache
+        lib = _cache.get(path, None)
+        if lib is not None:
+            return lib
         for app in itervalues(self.apps):
             if path.startswith(app.templates_directory):
                 lib = _cache[path] = app.lib.long_name
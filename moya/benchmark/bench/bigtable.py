@@ -130,6 +130,20 @@ def test_moya():
     moya_tmpl.render(data)
 
 
+from moya.template.environment import Environment
+
+moya_compiled_env = Environment.make_default()
+moya_compiled_env.compile = True
+moya_compiled_tmpl = Template(moya_tmpl.source)
+
+
+def test_moya_compiled():
+    """Moya template (compiled)"""
+
+    data = {"table": table}
+    moya_compiled_tmpl.render(data, environment=moya_compiled_env)
+
+
 if MakoTemplate:
     mako_tmpl = MakoTemplate(
         """
@@ -428,6 +442,7 @@ def run(which=None, number=10):
         "test_clearsilver",
         "test_django",
         "test_moya",
+        "test_moya_compiled",
         "test_cheetah",
         "test_spitfire",
         "test_spitfire_o1",
@@ -0,0 +1,99 @@
+# -*- encoding: utf-8 -*-
+# Cache benchmarks
+#
+# Objective: Measure get / set throughput of each cache backend with multiple threads.
+#
+# Each backend is also run with every call serialized by a single lock, which is
+# how backends that don't manage their own concurrency are called.
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from fs.memoryfs import MemoryFS
+
+from moya.cache.dictcache import DictCache
+from moya.cache.memorycache import MemoryCache
+from moya.cache.filecache import FileCache
+from moya.cache.sharedcache import SharedCache
+from moya.cache.sqlitecache import SQLiteCache
+
+
+KEYS = ["key{}".format(n) for n in range(1000)]
+VALUE = {"title": "Hello, World", "items": list(range(20))}
+
+
+def make_caches():
+    temp_dir = tempfile.mkdtemp()
+    yield "dict", lambda: DictCache("bench", "")
+    yield "memory", lambda: MemoryCache("bench", "")
+    yield "file", lambda: FileCache("bench", "", fs=MemoryFS())
+    yield "shared", lambda: SharedCache(
+        "bench", "", path=os.path.join(temp_dir, "bench.shm")
+    )
+    yield "sqlite", lambda: SQLiteCache(
+        "bench", "", path=os.path.join(temp_dir, "bench.sqlite")
+    )
+
+
+def serialize(cache):
+    """Make a cache serialize all calls"""
+    cache._call_lock = threading.Lock()
+    return cache
+
+
+def run(cache, num_threads, ops, writes_per_ten=1):
+    """Run `ops` operations per thread, return operations per second"""
+    for key in KEYS:
+        cache.set(key, VALUE)
+    start_event = threading.Event()
+
+    def worker(offset):
+        get = cache.get
+        set_ = cache.set
+        num_keys = len(KEYS)
+        start_event.wait()
+        for n in range(ops):
+            key = KEYS[(n + offset) % num_keys]
+            if n % 10 >= writes_per_ten:
+                get(key)
+            else:
+                set_(key, VALUE)
+
+    threads = [
+        threading.Thread(target=worker, args=(n * 7,)) for n in range(num_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    start = time.time()
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    taken = time.time() - start
+    return (ops * num_threads) / taken
+
+
+def main(ops=20000, thread_counts=(1, 4, 16)):
+    print("{:<10} {:<12} {:>8} {:>14}".format("backend", "locking", "threads", "ops/s"))
+    for name, make_cache in make_caches():
+        for locking in ("backend", "serialized"):
+            for num_threads in thread_counts:
+                cache = make_cache()
+                if locking == "serialized":
+                    cache = serialize(cache)
+                ops_per_second = run(cache, num_threads, ops)
+                print(
+                    "{:<10} {:<12} {:>8} {:>14,.0f}".format(
+                        name, locking, num_threads, ops_per_second
+                    )
+                )
+
+
+if __name__ == "__main__":
+    ops = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    main(ops)
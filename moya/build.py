@@ -50,6 +50,7 @@ def build(
     master_settings=None,
     test_build=False,
     develop=False,
+    load_expression_cache=False,
 ):
     """Build a project"""
     if isinstance(fs, string_types):
@@ -111,6 +112,9 @@ def build(
         docs_location = archive.cfg.get("project", "location")
 
         archive.init_settings()
+        if load_expression_cache:
+            # Load before the build, so expressions aren't parsed again at startup
+            archive.load_expression_cache()
         root["console"] = archive.console
         root["debug"] = archive.debug
         root["_rebuild"] = rebuild
@@ -228,6 +232,7 @@ def build_server(
     master_settings=None,
     test_build=False,
     develop=False,
+    load_expression_cache=False,
 ):
     """Build a server"""
     start = time()
@@ -244,6 +249,7 @@ def build_server(
                 master_settings=master_settings,
                 test_build=test_build,
                 develop=develop,
+                load_expression_cache=load_expression_cache,
             )
         console = archive.console
     except errors.ParseError as e:
@@ -5,3 +5,7 @@ from . import filecache
 from . import memcache
 from . import memorycache
 from . import disabledcache
+from . import tieredcache
+from . import sharedcache
+from . import sqlitecache
+from . import stats
@@ -2,11 +2,11 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 from .. import errors
-from ..tools import DummyLock
+from . import serializers
+from .stats import CacheStats
+from .stampede import TaggedValue
 from ..context.expressiontime import TimeSpan
-from ..containers import LRUCache
 from ..compat import (
-    pickle,
     text_type,
     binary_type,
     with_metaclass,
@@ -15,9 +15,9 @@ from ..compat import (
 )
 
 from threading import Lock
-from time import time
-import zlib
+from time import time as get_time
 import hashlib
+import uuid
 
 import logging
 
@@ -51,19 +51,42 @@ class CacheType(object):
 
     enabled = True
     max_key_length = 250
+    # Backends that manage their own concurrency should set this to True,
+    # otherwise calls to get / set / delete / contains are serialized
+    thread_safe = False
+    key_cache_size = 1000
+    # Prefix for keys that store the current generation of a tag
+    tag_key_prefix = "._tag."
+    # How often `evict` should be called (in milliseconds, 0 for never)
+    evict_interval = 0
+    # Maximum number of values to evict while holding the lock
+    evict_batch_size = 1000
 
     def __init__(
-        self, name, namespace, thread_safe=False, compress=False, compress_min=1024
+        self,
+        name,
+        namespace,
+        thread_safe=None,
+        compress=False,
+        compress_min=1024,
+        serializer="pickle",
+        compressor="zlib",
+        compress_level=None,
     ):
         self.name = name
         self.ns = namespace or ""
         self.compress = compress
         self.compress_min = compress_min
-        if thread_safe:
-            self.lock = DummyLock()
-        else:
-            self.lock = Lock()
-        self._key_cache = LRUCache(1000)
+        self.set_format(serializer, compressor, compress_level)
+        if thread_safe is not None:
+            self.thread_safe = thread_safe
+        # For use by backends, to protect multi-step mutations
+        self.lock = Lock()
+        self._call_lock = None if self.thread_safe else Lock()
+        self._key_cache = {}
+        self.stats = CacheStats()
+        # Incremented after every write, so readers may detect changes
+        self.writes = 0
 
     def __repr__(self):
         return "<cache:%s '%s'>" % (self.cache_backend_name, self.name)
@@ -87,6 +110,20 @@ class CacheType(object):
             )
         debug = settings.get_bool("debug", False)
         cache = cache_cls.initialize(name, settings)
+        compress_level = settings.get("compress_level", "").strip()
+        try:
+            cache.set_format(
+                settings.get("serializer", "pickle"),
+                settings.get("compressor", "zlib"),
+                int(compress_level) if compress_level else None,
+            )
+        except ValueError as e:
+            raise errors.StartupFailedError(
+                "Cache '{}' is incorrectly configured ({})".format(name, e)
+            )
+        evict_interval = settings.get("evict_interval", None)
+        if evict_interval is not None:
+            cache.evict_interval = TimeSpan.to_ms(evict_interval)
         if debug:
             cache = DebugCacheWrapper(cache)
         return cache
@@ -118,10 +155,15 @@ class CacheType(object):
         # Key calculation is cached here
         # In most cases this will be over-kill,
         # but it is possible _get_key may be slow for some implementations
+        # A plain dict (cleared when full) is used so that lookups don't need a lock
+        key_cache = self._key_cache
         try:
-            bytes_key = self._key_cache[(self.ns, key)]
+            return key_cache[key]
         except KeyError:
-            bytes_key = self._key_cache[(self.ns, key)] = self._get_key(key)
+            pass
+        if len(key_cache) >= self.key_cache_size:
+            key_cache.clear()
+        bytes_key = key_cache[key] = self._get_key(key)
         return bytes_key
 
     def _get_key(self, key):
@@ -130,52 +172,157 @@ class CacheType(object):
         key = self.shorten_key(key.encode("utf-8"))
         return key
 
+    def set_format(self, serializer="pickle", compressor="zlib", compress_level=None):
+        """Set the serializer and compressor used to encode values (by name)"""
+        self.serializer = serializers.get_serializer(serializer)
+        self.compressor = serializers.get_compressor(compressor, compress_level)
+
     def encode_value(self, value):
         """Encodes a value in to a binary string"""
-        dump = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
-        if self.compress and len(dump) >= self.compress_min:
-            return zlib.compress(dump) + b"ZZ"
-        return dump + b"XX" if dump.endswith(b"XX") else dump
+        data = serializers.encode(
+            value,
+            self.serializer,
+            self.compressor if self.compress else None,
+            self.compress_min,
+        )
+        self.stats.bytes_written += len(data)
+        return data
 
     def decode_value(self, value):
         """Decodes a value encoded by `encode_value`"""
-        if value.endswith(b"ZZ"):
-            value = zlib.decompress(value[:-2])
-        elif value.endswith(b"XX"):
-            value = value[:-2]
-        return pickle.loads(value)
-
-    def set(self, k, value, time=0):
-        """Set key `k` to `value`, with a max lifespan of `time` milliseconds"""
+        self.stats.bytes_read += len(value)
+        return serializers.decode(value)
+
+    def get_stats(self, top=10):
+        """Get statistics for this cache as a dict (see `CacheStats`)"""
+        stats = self.stats.to_dict(top=top)
+        stats["name"] = self.name
+        stats["type"] = self.cache_backend_name
+        return stats
+
+    def reset_stats(self):
+        self.stats.reset()
+
+    def __moyaconsole__(self, console):
+        stats = self.get_stats()
+        console.text(repr(self), bold=True)
+        console.table(
+            [
+                [name, stats[name]]
+                for name in ("hit_ratio",) + CacheStats.counters
+            ],
+            header_row=["stat", "value"],
+        )
+
+    def set(self, k, value, time=0, tags=None, generations=None):
+        """Set key `k` to `value`, with a max lifespan of `time` milliseconds
+
+        If `tags` is given, it should be a sequence of strings. The value will no longer
+        be returned if any of the tags are invalidated (see `invalidate_tags`).
+
+        If `generations` is given, it should be the return value of
+        `get_tag_generations`, read before the value was computed. Otherwise tags are
+        read when the value is set, and an invalidation while the value was being
+        computed would be missed.
+
+        """
         time = max(0, time)
         if value is None:
             raise ValueError("value may not be None")
-        with self.lock:
-            try:
-                self._set(k, value, time=time)
-            except Exception as e:
-                log.exception("{} SET failed ({})".format(self, e))
+        start = get_time()
+        lock = self._call_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            if generations is None and tags:
+                generations = self._get_tag_generations(tags)
+            if generations:
+                value = TaggedValue(value, generations)
+            self._set(k, value, time=time)
+            self.stats.record_set(1, start)
+        except Exception as e:
+            self.stats.errors += 1
+            log.exception("{} SET failed ({})".format(self, e))
+        finally:
+            self.writes += 1
+            if lock is not None:
+                lock.release()
 
     def _set(self, k, value, time):
         """Implementation specifics for `set` method"""
         raise NotImplementedError
 
+    def add(self, k, value, time=0):
+        """Set key `k` to `value` only if it isn't already set, return True if it was set"""
+        time = max(0, time)
+        if value is None:
+            raise ValueError("value may not be None")
+        lock = self._call_lock
+        if lock is not None:
+            lock.acquire()
+        start = get_time()
+        try:
+            added = self._add(k, value, time=time)
+            if added:
+                self.writes += 1
+                self.stats.record_set(1, start)
+            return added
+        except Exception as e:
+            self.stats.errors += 1
+            log.exception("{} ADD failed ({})".format(self, e))
+            # Allow the caller to proceed as if it was set
+            return True
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def _add(self, k, value, time):
+        """Implementation specifics for `add` method"""
+        # Atomic within a process, backends that share storage should override this
+        with self.lock:
+            if self._get(k, None) is not None:
+                return False
+            self._set(k, value, time)
+            return True
+
     def get(self, k, default=None):
         """Get value for key `k`, or return `default` if the key could not be read"""
-        with self.lock:
-            try:
-                return self._get(k, default)
-            except Exception as e:
-                log.error("{} GET failed ({})".format(self, e))
+        lock = self._call_lock
+        if lock is not None:
+            lock.acquire()
+        start = get_time()
+        try:
+            value = self._get(k, _not_present)
+            if type(value) is TaggedValue:
+                value = self._check_tags({k: value}, _not_present)[k]
+            if value is _not_present:
+                self.stats.record_get((k,), 0, start)
                 return default
+            self.stats.record_get((k,), 1, start)
+            return value
+        except Exception as e:
+            self.stats.errors += 1
+            log.error("{} GET failed ({})".format(self, e))
+            return default
+        finally:
+            if lock is not None:
+                lock.release()
 
     def delete(self, k):
         """Delete the value indexed by `k`"""
-        with self.lock:
-            try:
-                return self._delete(k)
-            except Exception as e:
-                log.error("{} DELETE failed ({})".format(self, e))
+        lock = self._call_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            self.stats.deletes += 1
+            return self._delete(k)
+        except Exception as e:
+            self.stats.errors += 1
+            log.error("{} DELETE failed ({})".format(self, e))
+        finally:
+            self.writes += 1
+            if lock is not None:
+                lock.release()
 
     def _delete(self, k):
         raise NotImplementedError
@@ -186,17 +333,189 @@ class CacheType(object):
 
     def contains(self, k):
         """Check if a given key `k` exists in the cache"""
-        with self.lock:
-            try:
-                return self._contains(k)
-            except Exception as e:
-                log.error("{} CONTAINS failed ({})".format(self, e))
-                return False
+        lock = self._call_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            return self._contains(k)
+        except Exception as e:
+            self.stats.errors += 1
+            log.error("{} CONTAINS failed ({})".format(self, e))
+            return False
+        finally:
+            if lock is not None:
+                lock.release()
 
     def _contains(self, k):
         """Implementation specifics for `contains` method"""
         return self._get(k, None) is not None
 
+    def get_many(self, keys, default=None):
+        """Get values for a sequence of keys, returns a dict that maps each key on to its value
+        (or `default` if the key could not be read)
+
+        """
+        keys = list(keys)
+        lock = self._call_lock
+        if lock is not None:
+            lock.acquire()
+        start = get_time()
+        try:
+            values = self._get_many(keys, _not_present)
+            tagged = {k: v for k, v in values.items() if type(v) is TaggedValue}
+            if tagged:
+                values.update(self._check_tags(tagged, _not_present))
+            hits = 0
+            for k, value in values.items():
+                if value is _not_present:
+                    values[k] = default
+                else:
+                    hits += 1
+            self.stats.record_get(keys, hits, start)
+            return values
+        except Exception as e:
+            self.stats.errors += 1
+            log.error("{} GET_MANY failed ({})".format(self, e))
+            return {k: default for k in keys}
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def _get_many(self, keys, default):
+        """Implementation specifics for `get_many` method"""
+        _get = self._get
+        return {k: _get(k, default) for k in keys}
+
+    def set_many(self, values, time=0, tags=None, generations=None):
+        """Set keys to values from a mapping, with a max lifespan of `time` milliseconds
+
+        See `set` for `tags` and `generations`.
+
+        """
+        time = max(0, time)
+        if hasattr(values, "items"):
+            values = values.items()
+        values = list(values)
+        if any(value is None for _, value in values):
+            raise ValueError("value may not be None")
+        lock = self._call_lock
+        if lock is not None:
+            lock.acquire()
+        start = get_time()
+        try:
+            if generations is None and tags:
+                generations = self._get_tag_generations(tags)
+            if generations:
+                values = [(k, TaggedValue(value, generations)) for k, value in values]
+            self._set_many(values, time=time)
+            self.stats.record_set(len(values), start)
+        except Exception as e:
+            self.stats.errors += 1
+            log.exception("{} SET_MANY failed ({})".format(self, e))
+        finally:
+            self.writes += 1
+            if lock is not None:
+                lock.release()
+
+    def _set_many(self, values, time):
+        """Implementation specifics for `set_many` method"""
+        _set = self._set
+        for k, value in values:
+            _set(k, value, time=time)
+
+    def delete_many(self, keys):
+        """Delete the values indexed by a sequence of keys"""
+        keys = list(keys)
+        lock = self._call_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            self.stats.deletes += len(keys)
+            self._delete_many(keys)
+        except Exception as e:
+            self.stats.errors += 1
+            log.error("{} DELETE_MANY failed ({})".format(self, e))
+        finally:
+            self.writes += 1
+            if lock is not None:
+                lock.release()
+
+    def _delete_many(self, keys):
+        """Implementation specifics for `delete_many` method"""
+        _delete = self._delete
+        for k in keys:
+            _delete(k)
+
+    def invalidate_tags(self, tags):
+        """Invalidate all values stored with any of the given tags"""
+        tag_keys = [self.tag_key_prefix + tag for tag in tags]
+        lock = self._call_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            # Values are stored with a generation, which won't match a new tag
+            self._delete_many(tag_keys)
+        except Exception as e:
+            log.error("{} INVALIDATE_TAGS failed ({})".format(self, e))
+        finally:
+            self.writes += 1
+            if lock is not None:
+                lock.release()
+
+    def invalidate_tag(self, tag):
+        """Invalidate all values stored with a tag"""
+        self.invalidate_tags([tag])
+
+    def get_tag_generations(self, tags):
+        """Get the current generations of tags, to pass to `set` once a value is computed
+
+        Returns None if the generations could not be read.
+
+        """
+        lock = self._call_lock
+        if lock is not None:
+            lock.acquire()
+        try:
+            return self._get_tag_generations(tags)
+        except Exception as e:
+            self.stats.errors += 1
+            log.error("{} GET_TAG_GENERATIONS failed ({})".format(self, e))
+            return None
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def _get_tag_generations(self, tags):
+        """Get the current generation of tags, creating new generations if required"""
+        tag_keys = [self.tag_key_prefix + tag for tag in tags]
+        generations = self._get_many(tag_keys, None)
+        for tag_key in tag_keys:
+            if generations.get(tag_key, None) is None:
+                generation = uuid.uuid4().hex
+                if not self._add(tag_key, generation, 0):
+                    # Created by another thread or process
+                    generation = self._get(tag_key, None)
+                generations[tag_key] = generation
+        return tuple((tag_key, generations[tag_key]) for tag_key in tag_keys)
+
+    def _check_tags(self, tagged, default):
+        """Replace tagged values with their value, or `default` if a tag was invalidated"""
+        tag_keys = {
+            tag_key for value in tagged.values() for tag_key, _ in value.generations
+        }
+        current = self._get_many(list(tag_keys), None)
+        return {
+            k: (
+                value.value
+                if all(
+                    generation is not None and current.get(tag_key) == generation
+                    for tag_key, generation in value.generations
+                )
+                else default
+            )
+            for k, value in tagged.items()
+        }
+
     def __contains__(self, k):
         """Enables 'in' operator"""
         return self.contains(k)
@@ -219,10 +538,16 @@ class DebugCacheWrapper(object):
         self.cache = cache
         self.enabled = cache.enabled
         self.ns = cache.ns
+        self.evict_interval = cache.evict_interval
+        self.stats = cache.stats
 
     def __repr__(self):
         return "{} (debug)".format(self.cache)
 
+    @property
+    def writes(self):
+        return self.cache.writes
+
     def _get_debug_value(self, value, size=50):
         debug_value = value
         try:
@@ -240,19 +565,23 @@ class DebugCacheWrapper(object):
             debug_value = "<unprintable value>"
         return debug_value
 
-    def set(self, k, value, time=0):
+    def set(self, k, value, time=0, tags=None, generations=None):
         log_msg = "{} SET '{}' = {}".format(
             self.cache, self._get_debug_value(k, 100), self._get_debug_value(value)
         )
         if time:
             log_msg += " ({})".format(TimeSpan(time).text)
+        if tags:
+            log_msg += " tags {}".format(", ".join(tags))
         log.debug(log_msg)
-        return self.cache.set(k, value, time=time)
+        return self.cache.set(
+            k, value, time=time, tags=tags, generations=generations
+        )
 
     def get(self, k, default=None):
-        start = time()
+        start = get_time()
         value = self.cache.get(k, default)
-        taken = (time() - start) * 1000.0
+        taken = (get_time() - start) * 1000.0
         log_msg = "{} GET '{}' = {} {:.2f}ms".format(
             self.cache,
             self._get_debug_value(k, 100),
@@ -267,6 +596,70 @@ class DebugCacheWrapper(object):
         log.debug(log_msg)
         return self.cache.delete(k)
 
+    def get_many(self, keys, default=None):
+        keys = list(keys)
+        start = get_time()
+        values = self.cache.get_many(keys, default)
+        taken = (get_time() - start) * 1000.0
+        for k in keys:
+            log.debug(
+                "{} GET_MANY '{}' = {}".format(
+                    self.cache,
+                    self._get_debug_value(k, 100),
+                    self._get_debug_value(values.get(k, default)),
+                )
+            )
+        log.debug("{} GET_MANY {} keys {:.2f}ms".format(self.cache, len(keys), taken))
+        return values
+
+    def set_many(self, values, time=0, tags=None, generations=None):
+        if hasattr(values, "items"):
+            values = values.items()
+        values = list(values)
+        for k, value in values:
+            log.debug(
+                "{} SET_MANY '{}' = {}".format(
+                    self.cache,
+                    self._get_debug_value(k, 100),
+                    self._get_debug_value(value),
+                )
+            )
+        return self.cache.set_many(
+            values, time=time, tags=tags, generations=generations
+        )
+
+    def add(self, k, value, time=0):
+        added = self.cache.add(k, value, time=time)
+        log.debug(
+            "{} ADD '{}' = {} ({})".format(
+                self.cache,
+                self._get_debug_value(k, 100),
+                self._get_debug_value(value),
+                added,
+            )
+        )
+        return added
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        log.debug(
+            "{} DELETE_MANY {}".format(
+                self.cache, ", ".join(self._get_debug_value(k, 100) for k in keys)
+            )
+        )
+        return self.cache.delete_many(keys)
+
+    def invalidate_tags(self, tags):
+        tags = list(tags)
+        log.debug("{} INVALIDATE_TAGS {}".format(self.cache, ", ".join(tags)))
+        return self.cache.invalidate_tags(tags)
+
+    def invalidate_tag(self, tag):
+        return self.invalidate_tags([tag])
+
+    def get_tag_generations(self, tags):
+        return self.cache.get_tag_generations(tags)
+
     def contains(self, k):
         contains = self.cache.contains(k)
         log_msg = "{} CONTAINS {} ({})".format(
@@ -277,3 +670,16 @@ class DebugCacheWrapper(object):
 
     def __contains__(self, k):
         return self.contains(k)
+
+    def evict(self):
+        log.debug("{} EVICT".format(self.cache))
+        return self.cache.evict()
+
+    def get_stats(self, top=10):
+        return self.cache.get_stats(top=top)
+
+    def reset_stats(self):
+        self.cache.reset_stats()
+
+    def __moyaconsole__(self, console):
+        self.cache.__moyaconsole__(console)
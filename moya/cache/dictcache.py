@@ -2,21 +2,33 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 from ..cache import Cache
-from ..compat import iteritems
 
+from heapq import heappush, heappop
+from threading import Lock
 from time import time as get_time
 
 
 class DictCache(Cache):
-    """A local memory based cache"""
+    """A local memory based cache
+
+    Single dict operations are atomic, so reads and writes don't need a lock.
+
+    Expire times are kept in a heap, so that `evict` only visits expired values.
+
+    """
 
     cache_backend_name = "dict"
+    thread_safe = True
+    evict_interval = 60 * 1000
 
     def __init__(self, name, namespace, compress=False, compress_min=1024):
         super(DictCache, self).__init__(
             name, namespace, compress=compress, compress_min=compress_min
         )
         self.values = {}
+        # Heap of (<expire time>, <key>)
+        self.expire_heap = []
+        self._expire_lock = Lock()
 
     def encode_value(self, value):
         return value
@@ -26,18 +38,41 @@ class DictCache(Cache):
 
     def _get(self, key, default):
         key = self.get_key(key)
-        if key not in self.values:
+        try:
+            expire_time, value = self.values[key]
+        except KeyError:
             return default
-        expire_time, value = self.values.get(key, default)
         if expire_time and expire_time <= get_time():
-            del self.values[key]
+            self.values.pop(key, None)
             return default
         return self.decode_value(value)
 
+    def _get_many(self, keys, default):
+        values = self.values
+        get_key = self.get_key
+        decode_value = self.decode_value
+        now = get_time()
+        result = {}
+        for k in keys:
+            key = get_key(k)
+            try:
+                expire_time, value = values[key]
+            except KeyError:
+                result[k] = default
+                continue
+            if expire_time and expire_time <= now:
+                values.pop(key, None)
+                result[k] = default
+            else:
+                result[k] = decode_value(value)
+        return result
+
     def _set(self, key, value, time):
         key = self.get_key(key)
         if time:
             expire = get_time() + time / 1000.0
+            with self._expire_lock:
+                heappush(self.expire_heap, (expire, key))
         else:
             expire = None
         value = self.encode_value(value)
@@ -45,22 +80,37 @@ class DictCache(Cache):
 
     def _delete(self, key):
         key = self.get_key(key)
-        try:
-            del self.values[key]
-        except KeyError:
-            return False
-        else:
-            return True
+        return self.values.pop(key, None) is not None
 
     def evict(self):
+        """Remove expired values, return the number removed"""
         t = get_time()
-        with self.lock:
-            delete_keys = []
-            for k, (expire_time, v) in iteritems(self.values):
-                if expire_time and expire_time <= t:
-                    delete_keys.append(k)
-            for k in delete_keys:
-                del self.values[k]
+        values = self.values
+        expire_heap = self.expire_heap
+        removed = 0
+        done = False
+        while not done:
+            # Remove in batches, so the lock isn't held for long
+            with self._expire_lock:
+                for _ in range(self.evict_batch_size):
+                    if not expire_heap or expire_heap[0][0] > t:
+                        done = True
+                        break
+                    expire_time, key = heappop(expire_heap)
+                    # The value may have been set again since
+                    value = values.get(key, None)
+                    if value is not None and value[0] == expire_time:
+                        values.pop(key, None)
+                        removed += 1
+        with self._expire_lock:
+            if len(expire_heap) > len(values) * 2 + self.evict_batch_size:
+                # Discard entries for values that were deleted or set again
+                expire_heap[:] = sorted(
+                    (expire_time, key)
+                    for key, (expire_time, _) in list(values.items())
+                    if expire_time
+                )
+        return removed
 
 
 if __name__ == "__main__":
@@ -10,8 +10,26 @@ class DisabledCache(Cache):
     def get(self, key, default=None):
         return default
 
-    def set(self, key, value, time=0):
+    def set(self, key, value, time=0, tags=None, generations=None):
         pass
 
     def delete(self, key):
         pass
+
+    def add(self, key, value, time=0):
+        return True
+
+    def get_many(self, keys, default=None):
+        return {key: default for key in keys}
+
+    def set_many(self, values, time=0, tags=None, generations=None):
+        pass
+
+    def invalidate_tags(self, tags):
+        pass
+
+    def get_tag_generations(self, tags):
+        return None
+
+    def delete_many(self, keys):
+        pass
@@ -3,20 +3,45 @@ from __future__ import print_function
 
 from ..cache import Cache
 from ..compat import text_type, string_types
+from ..containers import LRUCache
 
 from fs.opener import open_fs
-from fs.errors import FSError
+from fs.errors import FSError, ResourceNotFound
+from fs.path import basename, dirname
 
 from time import time as get_time
 import codecs
+import hashlib
+import uuid
+
+import logging
+
+log = logging.getLogger("moya.runtime")
 
 
 class FileCache(Cache):
-    """Caches in the filesystem"""
+    """Caches in the filesystem
+
+    Files are stored in two levels of directories named from a hash of the key, so
+    that no single directory grows too large. Values are written to a temporary file
+    which is then renamed, so a partially written value is never read.
+
+    Keys with an expire time are also recorded in a directory per expiry period, so
+    that `evict` only needs to look at keys that have expired. If a maximum size is
+    set, `evict` also removes the least recently used files.
+
+    """
 
     cache_backend_name = "file"
+    expire_dir = "_expire"
+    # Width of the expiry periods (seconds)
+    expire_period = 60
+    # Minimum time between updates to the access time of a file (seconds)
+    touch_interval = 60
 
-    def __init__(self, name, namespace, fs=None, compress=False, compress_min=1024):
+    def __init__(
+        self, name, namespace, fs=None, compress=False, compress_min=1024, max_size=0
+    ):
         super(FileCache, self).__init__(
             name,
             namespace,
@@ -35,6 +60,8 @@ class FileCache(Cache):
             fs = fs.opendir(sub_dir)
         self.fs = fs
         self.max_key_length = 80
+        self.max_size = max_size
+        self._touched = LRUCache(10000)
 
     @classmethod
     def initialize(cls, name, settings):
@@ -44,6 +71,7 @@ class FileCache(Cache):
             fs=settings["location"],
             compress=settings.get_bool("compress", False),
             compress_min=settings.get_int("compress_min", 1024 * 16),
+            max_size=settings.get_int("size", 0) * 1024,
         )
 
     def _get_key(self, key):
@@ -53,63 +81,205 @@ class FileCache(Cache):
         return key
 
     def make_path(self, key):
-        return "{}.cache".format(codecs.encode(key, "hex").decode("utf-8"))
+        shard = hashlib.md5(key).hexdigest()
+        return "{}/{}/{}.cache".format(
+            shard[:2], shard[2:4], codecs.encode(key, "hex").decode("utf-8")
+        )
+
+    def _path_from_filename(self, filename):
+        """Get the path to a cache file from its filename."""
+        key = codecs.decode(filename[: -len(".cache")].encode("utf-8"), "hex")
+        return self.make_path(key)
+
+    def _read(self, path):
+        """Read (<expire time>, <encoded value>) from a cache file."""
+        with self.fs.open(path, "rb") as f:
+            expire_time = f.readline().strip()
+            expire_time = float(expire_time) if expire_time else None
+            return expire_time, f.read()
+
+    def _encode_file(self, value, time):
+        if time:
+            expire = get_time() + time / 1000.0
+            header = text_type(expire).encode("utf-8") + b"\n"
+        else:
+            expire = None
+            header = b"\n"
+        return expire, header + self.encode_value(value)
+
+    def _open_new(self, path, mode):
+        try:
+            return self.fs.open(path, mode)
+        except ResourceNotFound:
+            self.fs.makedirs(dirname(path), recreate=True)
+            return self.fs.open(path, mode)
+
+    def _index_expire(self, path, expire):
+        """Record the expire time of a cache file."""
+        period = int(expire // self.expire_period)
+        marker_path = "{}/{}/{}".format(self.expire_dir, period, basename(path))
+        with self._open_new(marker_path, "wb"):
+            pass
+
+    def _touch(self, path):
+        """Update the access time, used to find the least recently used files."""
+        if not self.max_size:
+            return
+        now = get_time()
+        if now - self._touched.get(path, 0) < self.touch_interval:
+            return
+        self._touched[path] = now
+        try:
+            self.fs.setinfo(path, {"details": {"accessed": now, "modified": now}})
+        except FSError:
+            pass
 
     def _get(self, key, default):
         path = self.make_path(self.get_key(key))
         try:
-            with self.fs.open(path, "rb") as f:
-                expire_time = f.readline().strip()
-                if expire_time and float(expire_time) <= get_time():
-                    self.fs.remove(path)
-                    return default
-                value = self.decode_value(f.read())
-                return value
+            expire_time, data = self._read(path)
         except FSError:
             return default
+        if expire_time is not None and expire_time <= get_time():
+            try:
+                self.fs.remove(path)
+            except FSError:
+                pass
+            return default
+        self._touch(path)
+        return self.decode_value(data)
 
     def _set(self, key, value, time):
         path = self.make_path(self.get_key(key))
-        if time:
-            expire = get_time() + time / 1000.0
-        else:
-            expire = None
-        value = self.encode_value(value)
+        expire, data = self._encode_file(value, time)
+        temp_path = "{}.{}.tmp".format(path, uuid.uuid4().hex)
         try:
-            with self.fs.open(path, "wb") as f:
-                if expire is None:
-                    f.write(b"\n")
-                else:
-                    f.write(text_type(expire).encode("utf-8") + b"\n")
-                f.write(value)
+            with self._open_new(temp_path, "wb") as f:
+                f.write(data)
+            # Atomic on filesystems that support rename
+            self.fs.move(temp_path, path, overwrite=True)
+            if expire is not None:
+                self._index_expire(path, expire)
         except FSError:
-            pass
+            try:
+                self.fs.remove(temp_path)
+            except FSError:
+                pass
+
+    def _add(self, key, value, time):
+        path = self.make_path(self.get_key(key))
+        expire, data = self._encode_file(value, time)
+        for _ in range(2):
+            try:
+                # Exclusive create, so only one process can add a key
+                # Values are written with a single write, as they can't be renamed
+                with self._open_new(path, "xb") as f:
+                    f.write(data)
+            except FSError:
+                # Already exists, but may have expired (in which case _get removes it)
+                if self._get(key, None) is not None:
+                    return False
+            else:
+                if expire is not None:
+                    self._index_expire(path, expire)
+                return True
+        return False
 
     def _delete(self, key):
         path = self.make_path(self.get_key(key))
         self.fs.remove(path)
 
+    def _delete_many(self, keys):
+        for key in keys:
+            try:
+                self._delete(key)
+            except FSError:
+                # Key not present
+                pass
+
     def _contains(self, key):
         path = self.make_path(self.get_key(key))
         return self.fs.isfile(path)
 
     def evict(self):
+        """Remove expired files, and trim the cache to its maximum size."""
         t = get_time()
-        for path in self.fs.listdir():
-            if not path.endswith(".cache"):
+        current_period = int(t // self.expire_period)
+        try:
+            periods = self.fs.listdir(self.expire_dir)
+        except FSError:
+            periods = []
+        for period in periods:
+            try:
+                if int(period) >= current_period:
+                    continue
+            except ValueError:
+                continue
+            period_path = "{}/{}".format(self.expire_dir, period)
+            try:
+                filenames = self.fs.listdir(period_path)
+            except FSError:
                 continue
+            for filename in filenames:
+                path = self._path_from_filename(filename)
+                try:
+                    # The file may have been set again with a later expire time
+                    expire_time, _ = self._read(path)
+                    if expire_time is not None and expire_time <= t:
+                        self.fs.remove(path)
+                except (FSError, ValueError):
+                    # Other processes may be evicting keys, so an FSError may not indicate a real problem
+                    pass
+                try:
+                    self.fs.remove("{}/{}".format(period_path, filename))
+                except FSError:
+                    pass
             try:
-                with self.fs.open(path, "rb") as f:
-                    try:
-                        expire_time = float(f.readline().strip())
-                    except (TypeError, ValueError):
-                        # No expire time present, or format error
-                        continue
-                if expire_time and expire_time <= t:
-                    self.fs.remove(path)
+                self.fs.removedir(period_path)
             except FSError:
-                # Other processes may be evicting keys, so an FSError may not indicate a real problem
                 pass
+        if self.max_size:
+            self.trim()
+
+    def _iter_files(self):
+        """Yield (<access time>, <size>, <path>) for every cache file."""
+        for shard in self.fs.scandir("/"):
+            # Shard directories are named with two hex digits
+            if not shard.is_dir or len(shard.name) != 2:
+                continue
+            for sub_shard in self.fs.scandir(shard.name):
+                if not sub_shard.is_dir:
+                    continue
+                dir_path = "{}/{}".format(shard.name, sub_shard.name)
+                for info in self.fs.scandir(dir_path, namespaces=["details"]):
+                    if info.name.endswith(".cache"):
+                        yield (
+                            info.get("details", "modified", 0) or 0,
+                            info.size,
+                            "{}/{}".format(dir_path, info.name),
+                        )
+
+    def trim(self):
+        """Remove the least recently used files, if the cache is over its maximum size."""
+        files = list(self._iter_files())
+        total_size = sum(size for _, size, _ in files)
+        if total_size <= self.max_size:
+            return 0
+        # Trim to below the maximum, so that it isn't exceeded again immediately
+        target_size = self.max_size * 0.9
+        files.sort()
+        removed = 0
+        for _, size, path in files:
+            if total_size <= target_size:
+                break
+            try:
+                self.fs.remove(path)
+            except FSError:
+                continue
+            total_size -= size
+            removed += 1
+        log.debug("%r trimmed %s file(s)", self, removed)
+        return removed
 
 
 if __name__ == "__main__":
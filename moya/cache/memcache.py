@@ -86,3 +86,36 @@ class MemCache(Cache):
         key = self.get_key(key)
         with self.pool.reserve() as mc:
             return mc.delete(key)
+
+    def _add(self, key, value, time):
+        time_sec = int(ceil(time / 1000.0))
+        key = self.get_key(key)
+        with self.pool.reserve() as mc:
+            return mc.add(
+                key,
+                value,
+                time=time_sec,
+                min_compress_len=self.memcache_min_compress_len,
+            )
+
+    def _get_many(self, keys, default):
+        get_key = self.get_key
+        cache_keys = {k: get_key(k) for k in keys}
+        with self.pool.reserve() as mc:
+            found = mc.get_multi(list(set(cache_keys.values())))
+        return {k: found.get(cache_key, default) for k, cache_key in cache_keys.items()}
+
+    def _set_many(self, values, time):
+        time_sec = int(ceil(time / 1000.0))
+        get_key = self.get_key
+        mapping = {get_key(k): value for k, value in values}
+        with self.pool.reserve() as mc:
+            mc.set_multi(
+                mapping, time=time_sec, min_compress_len=self.memcache_min_compress_len
+            )
+
+    def _delete_many(self, keys):
+        get_key = self.get_key
+        cache_keys = list({get_key(k) for k in keys})
+        with self.pool.reserve() as mc:
+            mc.delete_multi(cache_keys)
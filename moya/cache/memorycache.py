@@ -2,8 +2,11 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 from ..cache import Cache
+from ..compat import move_to_end
 
 from collections import OrderedDict, namedtuple
+from heapq import heappush, heappop
+from threading import RLock
 from time import time as get_time
 import logging
 
@@ -15,19 +18,29 @@ CacheEntry = namedtuple("CacheEntry", "value,expire_time")
 
 
 class MemoryCache(Cache):
-    """Caches in a memcached server"""
+    """Caches in local memory, up to a maximum size in bytes
+
+    Values are encoded and decoded outside of the lock, which is only held while the
+    entries and total size are updated.
+
+    Expire times are kept in a heap, so that `evict` only visits expired entries.
+
+    """
 
     cache_backend_name = "memory"
+    thread_safe = True
+    evict_interval = 60 * 1000
 
     def __init__(
         self, name, namespace, compress=True, compress_min=1024, size=1024 * 1024
     ):
-        super(MemoryCache, self).__init__(
-            name, namespace, compress=compress, thread_safe=False
-        )
+        super(MemoryCache, self).__init__(name, namespace, compress=compress)
+        self.lock = RLock()
         self.max_size = size
         self.entries = OrderedDict()
         self.size = 0
+        # Heap of (<expire time>, <key>)
+        self.expire_heap = []
 
     @classmethod
     def initialize(cls, name, settings):
@@ -41,46 +54,65 @@ class MemoryCache(Cache):
 
     def evict_entry(self, key):
         """Evict a single key."""
-        if key in self.entries:
-            entry = self.entries.pop(key)
-            self.size -= len(entry.value)
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry.value)
 
     def reclaim(self, num_bytes):
         """Reclaim at least `num_bytes`"""
-        log.debug("%r size=%s bytes", self, self.size)
-        log.debug("%r reclaiming %s bytes", self, num_bytes)
-        reclaimed = 0
-        while self.entries and reclaimed < num_bytes:
-            key, entry = self.entries.popitem(last=False)
-            log.debug("%r evicting %r", self, key)
-            deleted_bytes_count = len(entry.value)
-            self.size -= deleted_bytes_count
-            reclaimed += deleted_bytes_count
-        return reclaimed >= num_bytes
+        with self.lock:
+            log.debug("%r size=%s bytes", self, self.size)
+            log.debug("%r reclaiming %s bytes", self, num_bytes)
+            reclaimed = 0
+            while self.entries and reclaimed < num_bytes:
+                key, entry = self.entries.popitem(last=False)
+                log.debug("%r evicting %r", self, key)
+                deleted_bytes_count = len(entry.value)
+                self.size -= deleted_bytes_count
+                reclaimed += deleted_bytes_count
+                self.stats.evictions += 1
+            return reclaimed >= num_bytes
 
     def _get(self, key, default):
-        try:
-            entry = self.entries.pop(key)
-        except KeyError:
-            return default
-
-        # Remove entry from cache
-        value_bytes = entry.value
-        value_size = len(value_bytes)
-        self.size -= value_size
-
-        # If it has expired return the default
-        if entry.expire_time and get_time() > entry.expire_time:
-            return default
-
-        # Otherwise put it back in to the cache at first position
-        self.entries[key] = entry
-        self.size += value_size
-
-        return self.decode_value(value_bytes)
-
-    def _set(self, key, value, time):
-        value_bytes = self.encode_value(value)
+        with self.lock:
+            try:
+                entry = self.entries[key]
+            except KeyError:
+                return default
+
+            # If it has expired return the default
+            if entry.expire_time and get_time() > entry.expire_time:
+                self.evict_entry(key)
+                return default
+
+            # Otherwise move it to the most recently used position
+            move_to_end(self.entries, key)
+
+        return self.decode_value(entry.value)
+
+    def _get_many(self, keys, default):
+        found = {}
+        now = get_time()
+        with self.lock:
+            entries = self.entries
+            for key in keys:
+                entry = entries.get(key, None)
+                if entry is None:
+                    continue
+                if entry.expire_time and now > entry.expire_time:
+                    self.evict_entry(key)
+                    continue
+                move_to_end(entries, key)
+                found[key] = entry.value
+        decode_value = self.decode_value
+        return {
+            key: decode_value(found[key]) if key in found else default
+            for key in keys
+        }
+
+    def _store(self, key, value_bytes, expire_time):
+        """Store an encoded value, must be called with the lock held."""
         value_size = len(value_bytes)
         if value_size > self.max_size:
             return
@@ -88,13 +120,62 @@ class MemoryCache(Cache):
         if self.size + value_size > self.max_size:
             if not self.reclaim(self.size + value_size - self.max_size):
                 return
-        expire_time = None if time == 0 else get_time() + time / 1000.0
         self.entries[key] = CacheEntry(value_bytes, expire_time)
         self.size += value_size
+        if expire_time is not None:
+            heappush(self.expire_heap, (expire_time, key))
+
+    def _set(self, key, value, time):
+        value_bytes = self.encode_value(value)
+        expire_time = None if time == 0 else get_time() + time / 1000.0
+        with self.lock:
+            self._store(key, value_bytes, expire_time)
+
+    def _set_many(self, values, time):
+        encode_value = self.encode_value
+        encoded = [(key, encode_value(value)) for key, value in values]
+        expire_time = None if time == 0 else get_time() + time / 1000.0
+        with self.lock:
+            for key, value_bytes in encoded:
+                self._store(key, value_bytes, expire_time)
 
     def _delete(self, key):
-        if key in self.entries:
-            self.size -= len(self.entries.pop(key).value)
+        self.evict_entry(key)
+
+    def _delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.evict_entry(key)
+
+    def evict(self):
+        """Remove expired entries, return the number removed"""
+        t = get_time()
+        entries = self.entries
+        expire_heap = self.expire_heap
+        removed = 0
+        done = False
+        while not done:
+            # Remove in batches, so the lock isn't held for long
+            with self.lock:
+                for _ in range(self.evict_batch_size):
+                    if not expire_heap or expire_heap[0][0] > t:
+                        done = True
+                        break
+                    expire_time, key = heappop(expire_heap)
+                    # The entry may have been set again since
+                    entry = entries.get(key, None)
+                    if entry is not None and entry.expire_time == expire_time:
+                        self.evict_entry(key)
+                        removed += 1
+        with self.lock:
+            if len(expire_heap) > len(entries) * 2 + self.evict_batch_size:
+                # Discard entries that were deleted, set again, or reclaimed
+                expire_heap[:] = sorted(
+                    (entry.expire_time, key)
+                    for key, entry in entries.items()
+                    if entry.expire_time is not None
+                )
+        return removed
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+"""
+Prefetch cache keys in batches
+
+Templates and tags that read from a cache remember the keys they read. Keys that
+were read on several consecutive renders are considered stable, and the next time
+they run those keys are read with a single call to `get_many` per cache (a single
+round trip for memcache). Keys that vary between renders (e.g. keys that contain a
+user id) are not prefetched.
+
+Prefetched values are stored in the context, and are checked before the cache is
+read. They are discarded if the cache was written to (set, delete or invalidate)
+after they were read.
+
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+from ..containers import LRUCache
+
+from collections import defaultdict
+
+import logging
+
+log = logging.getLogger("moya.cache")
+
+
+def get_prefetched(context, cache_name, cache, key, default=None):
+    """Get a value from a cache, which may have been prefetched."""
+    prefetched = context.root.get("_cache_prefetch", None)
+    if prefetched:
+        writes, value = prefetched.pop((cache_name, key), (None, None))
+        if writes is not None and writes == cache.writes:
+            return default if value is None else value
+    return cache.get(key, default)
+
+
+class CacheKeys(object):
+    """Remembers the most recently read cache keys.
+
+    Each call to `prefetch` starts a new render. Keys read on at least `min_renders`
+    consecutive renders are prefetched.
+
+    """
+
+    def __init__(self, max_keys=100, min_renders=3):
+        self._keys = LRUCache(max_keys)
+        self.min_renders = min_renders
+        self._render = 0
+
+    def __repr__(self):
+        return "<cachekeys {}>".format(len(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, cache_name, key):
+        render = self._render
+        last_render, renders = self._keys.get((cache_name, key), (None, 0))
+        if last_render != render:
+            renders = renders + 1 if last_render == render - 1 else 1
+        self._keys[(cache_name, key)] = (render, renders)
+
+    def prefetch(self, context, get_cache):
+        """Start a render, and read stable keys in to the context, return the number of keys read."""
+        self._render += 1
+        if not self._keys:
+            return 0
+        previous_render = self._render - 1
+        min_renders = self.min_renders
+        prefetched = context.root.setdefault("_cache_prefetch", {})
+        cache_keys = defaultdict(list)
+        for (cache_name, key), (last_render, renders) in self._keys.items():
+            if (
+                last_render == previous_render
+                and renders >= min_renders
+                and (cache_name, key) not in prefetched
+            ):
+                cache_keys[cache_name].append(key)
+        count = 0
+        for cache_name, keys in cache_keys.items():
+            try:
+                cache = get_cache(cache_name)
+            except Exception as e:
+                log.debug("unable to prefetch from cache '%s' (%s)", cache_name, e)
+                continue
+            # Writes after this point make the values stale
+            writes = cache.writes
+            values = cache.get_many(keys, None)
+            for key in keys:
+                prefetched[(cache_name, key)] = (writes, values.get(key, None))
+            count += len(keys)
+        return count
@@ -0,0 +1,250 @@
+"""
+Serializers and compressors for cache values
+
+Encoded values start with a header that identifies the serializer and compressor,
+so that values written with different settings may be read by any cache. Values
+written before the header was introduced (pickle, with an optional zlib suffix) are
+also read.
+
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+from ..compat import pickle, text_type
+from .stampede import CachedValue, TaggedValue
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+import marshal
+import struct
+import zlib
+
+# First byte of values with a header
+FORMAT_MARKER = b"\x01"
+
+
+class Serializer(object):
+    """Converts values to and from bytes"""
+
+    name = None
+    code = None
+
+    def dumps(self, value):
+        """Serialize a value, or return None if it isn't supported"""
+        raise NotImplementedError
+
+    def loads(self, data):
+        raise NotImplementedError
+
+
+class PickleSerializer(Serializer):
+    """Serializes any value that can be pickled"""
+
+    name = "pickle"
+    code = b"p"
+
+    def dumps(self, value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class MarshalSerializer(Serializer):
+    """Serializes plain data (numbers, strings, lists, dicts etc.)
+
+    Faster than pickle, but the format may change between Python versions.
+
+    """
+
+    name = "marshal"
+    code = b"m"
+
+    def dumps(self, value):
+        try:
+            return marshal.dumps(value, 2)
+        except ValueError:
+            return None
+
+    def loads(self, data):
+        return marshal.loads(data)
+
+
+class TextSerializer(Serializer):
+    """Stores text (such as rendered HTML) as UTF-8
+
+    Also stores text with an expiry time, as written by `CacheFill`, and either of
+    those stored with tags.
+
+    """
+
+    name = "text"
+    code = b"t"
+    _times = struct.Struct(b"<dd")
+    _size = struct.Struct(b"<I")
+
+    def dumps(self, value):
+        if type(value) is text_type:
+            return b"T" + value.encode("utf-8")
+        if type(value) is TaggedValue:
+            return self._dumps_tagged(value)
+        if isinstance(value, CachedValue) and type(value.value) is text_type:
+            expire_time = value.expire_time
+            times = self._times.pack(
+                -1.0 if expire_time is None else expire_time, value.delta
+            )
+            return b"C" + times + value.value.encode("utf-8")
+        return None
+
+    def _dumps_tagged(self, value):
+        data = self.dumps(value.value)
+        if data is None:
+            return None
+        parts = [part for generation in value.generations for part in generation]
+        if not all(type(part) is text_type and "\0" not in part for part in parts):
+            return None
+        # Tag keys and generations separated by nulls, followed by the tagged value
+        header = "\0".join(parts).encode("utf-8")
+        return b"G" + self._size.pack(len(header)) + header + data
+
+    def loads(self, data):
+        if data[:1] == b"T":
+            return data[1:].decode("utf-8")
+        if data[:1] == b"G":
+            (size,) = self._size.unpack_from(data, 1)
+            start = 1 + self._size.size
+            parts = data[start : start + size].decode("utf-8").split("\0")
+            generations = tuple(zip(parts[::2], parts[1::2]))
+            return TaggedValue(self.loads(data[start + size :]), generations)
+        expire_time, delta = self._times.unpack_from(data, 1)
+        text = data[1 + self._times.size :].decode("utf-8")
+        return CachedValue(text, None if expire_time < 0 else expire_time, delta)
+
+
+class Compressor(object):
+    """Compresses encoded values"""
+
+    name = None
+    code = None
+    available = True
+
+    def __init__(self, level=None):
+        self.level = level
+
+    def compress(self, data):
+        raise NotImplementedError
+
+    def decompress(self, data):
+        raise NotImplementedError
+
+
+class NoCompressor(Compressor):
+    name = "none"
+    code = b"n"
+
+    def compress(self, data):
+        return data
+
+    def decompress(self, data):
+        return data
+
+
+class ZlibCompressor(Compressor):
+    name = "zlib"
+    code = b"z"
+
+    def compress(self, data):
+        return zlib.compress(data, 6 if self.level is None else self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+class LZ4Compressor(Compressor):
+    """Faster than zlib, requires the lz4 package"""
+
+    name = "lz4"
+    code = b"4"
+    available = lz4 is not None
+
+    def compress(self, data):
+        return lz4.frame.compress(data, compression_level=self.level or 0)
+
+    def decompress(self, data):
+        return lz4.frame.decompress(data)
+
+
+serializers = {
+    serializer.name: serializer
+    for serializer in (PickleSerializer, MarshalSerializer, TextSerializer)
+}
+compressors = {
+    compressor.name: compressor
+    for compressor in (NoCompressor, ZlibCompressor, LZ4Compressor)
+}
+
+_pickle_serializer = PickleSerializer()
+_no_compressor = NoCompressor()
+_serializers_by_code = {
+    serializer.code: serializer() for serializer in serializers.values()
+}
+_compressors_by_code = {
+    compressor.code: compressor() for compressor in compressors.values()
+}
+
+
+def get_serializer(name):
+    """Get a serializer from its name, or raise a ValueError"""
+    try:
+        return serializers[name]()
+    except KeyError:
+        raise ValueError(
+            "serializer should be one of {} (not '{}')".format(
+                ", ".join(sorted(serializers)), name
+            )
+        )
+
+
+def get_compressor(name, level=None):
+    """Get a compressor from its name, or raise a ValueError"""
+    try:
+        compressor_cls = compressors[name]
+    except KeyError:
+        raise ValueError(
+            "compressor should be one of {} (not '{}')".format(
+                ", ".join(sorted(compressors)), name
+            )
+        )
+    if not compressor_cls.available:
+        raise ValueError("compressor '{}' is not installed".format(name))
+    return compressor_cls(level)
+
+
+def encode(value, serializer, compressor=None, compress_min=0):
+    """Encode a value with a header"""
+    data = serializer.dumps(value)
+    if data is None:
+        # Not supported by the serializer
+        serializer = _pickle_serializer
+        data = serializer.dumps(value)
+    if compressor is None or len(data) < compress_min:
+        compressor = _no_compressor
+    else:
+        data = compressor.compress(data)
+    return FORMAT_MARKER + serializer.code + compressor.code + data
+
+
+def decode(value):
+    """Decode a value encoded with `encode` (or the previous format)"""
+    if value[:1] == FORMAT_MARKER:
+        serializer = _serializers_by_code[value[1:2]]
+        compressor = _compressors_by_code[value[2:3]]
+        return serializer.loads(compressor.decompress(value[3:]))
+    if value.endswith(b"ZZ"):
+        value = zlib.decompress(value[:-2])
+    elif value.endswith(b"XX"):
+        value = value[:-2]
+    return pickle.loads(value)
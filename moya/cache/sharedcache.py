@@ -0,0 +1,368 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+
+from ..cache import Cache
+from .. import errors
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from threading import Lock
+from time import time as get_time
+import hashlib
+import logging
+import mmap
+import os
+import struct
+
+
+log = logging.getLogger("moya.runtime")
+
+
+class SharedCache(Cache):
+    """Caches in a memory mapped file, shared by all processes on a host
+
+    The file is divided in to fixed size slots. A key is hashed to a slot, and
+    subsequent slots are probed (up to `max_probe`) to find the key or a free slot.
+    When there is no free slot, one is chosen with the clock algorithm; each slot has
+    a reference bit which is set when it is read, and cleared when it is passed over
+    for eviction.
+
+    Slots contain the encoded value (see `encode_value`), so values that don't fit
+    in a slot are not cached.
+
+    Threads are serialized with a lock, processes with a lock on the file (where the
+    platform supports it). The file is only initialized when it is new; a file that
+    was created with a different size or slot size is never truncated, because other
+    processes may have it mapped.
+
+    """
+
+    cache_backend_name = "shared"
+    thread_safe = True
+
+    magic = b"MOYASHM1"
+    # magic, slot count, slot size
+    header_struct = struct.Struct(b"<8sII")
+    header_size = 64
+    # state, reference bit, key hash, expire time, key length, value length
+    slot_struct = struct.Struct(b"<BBQdHI")
+
+    SLOT_EMPTY = 0
+    SLOT_USED = 1
+    SLOT_DELETED = 2
+
+    max_probe = 8
+
+    def __init__(
+        self,
+        name,
+        namespace,
+        path,
+        size=16 * 1024 * 1024,
+        slot_size=4096,
+        compress=True,
+        compress_min=1024,
+    ):
+        super(SharedCache, self).__init__(
+            name, namespace, compress=compress, compress_min=compress_min
+        )
+        self.path = path
+        self.slot_size = slot_size
+        self.slot_count = max(1, size // slot_size)
+        self.max_value_size = slot_size - self.slot_struct.size
+        self.lock = Lock()
+        self._fd = None
+        self._map = None
+        self._open()
+
+    def __repr__(self):
+        return "<cache:shared '{}' '{}'>".format(self.name, self.path)
+
+    @classmethod
+    def initialize(cls, name, settings):
+        location = settings.get("location", None)
+        if not location:
+            # A default location would be shared by every project on the host
+            raise errors.StartupFailedError(
+                "cache '{}' requires a 'location' setting (a directory for the shared file)".format(
+                    name
+                )
+            )
+        return cls(
+            name,
+            settings.get("namespace", ""),
+            path=os.path.join(location, "{}.shm".format(name)),
+            size=settings.get_int("size", 16 * 1024) * 1024,
+            slot_size=settings.get_int("slot_size", 4096),
+            compress=settings.get_bool("compress", True),
+            compress_min=settings.get_int("compress_min", 1024),
+        )
+
+    def _open(self):
+        map_size = self.header_size + self.slot_count * self.slot_size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            self._lock_file(fd, exclusive=True)
+            try:
+                expected = self.header_struct.pack(
+                    self.magic, self.slot_count, self.slot_size
+                )
+                if not os.fstat(fd).st_size:
+                    log.debug("%r initializing %s bytes", self, map_size)
+                    os.write(fd, expected)
+                    os.ftruncate(fd, map_size)
+                else:
+                    header = os.read(fd, self.header_struct.size)
+                    if header != expected or os.fstat(fd).st_size != map_size:
+                        # Resizing would crash processes that have the file mapped
+                        raise errors.StartupFailedError(
+                            "shared cache file '{}' was created with a different size or slot_size; "
+                            "stop all servers that use it and delete it, or change 'location'".format(
+                                self.path
+                            )
+                        )
+                self._map = mmap.mmap(fd, map_size)
+            finally:
+                self._unlock_file(fd)
+        except:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def close(self):
+        """Close the memory map."""
+        with self.lock:
+            if self._map is not None:
+                self._map.close()
+                os.close(self._fd)
+                self._map = None
+                self._fd = None
+
+    def _lock_file(self, fd, exclusive=False):
+        # lockf locks belong to the process, so they are not shared by forked workers
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    def _unlock_file(self, fd):
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
+
+    def _locked(self, exclusive=False):
+        return _FileLock(self, exclusive)
+
+    def _hash(self, key):
+        return struct.unpack(b"<Q", hashlib.md5(key).digest()[:8])[0]
+
+    def _offset(self, slot):
+        return self.header_size + slot * self.slot_size
+
+    def _probe(self, key_hash):
+        slot_count = self.slot_count
+        start = key_hash % slot_count
+        for n in range(min(self.max_probe, slot_count)):
+            yield (start + n) % slot_count
+
+    def _read_slot(self, slot):
+        return self.slot_struct.unpack_from(self._map, self._offset(slot))
+
+    def _find(self, key, key_hash):
+        """Find the slot containing a key, or None."""
+        _map = self._map
+        slot_struct = self.slot_struct
+        for slot in self._probe(key_hash):
+            offset = self._offset(slot)
+            state, _ref, slot_hash, _expire, key_length, _ = slot_struct.unpack_from(
+                _map, offset
+            )
+            if state == self.SLOT_EMPTY:
+                break
+            if state == self.SLOT_USED and slot_hash == key_hash:
+                key_start = offset + slot_struct.size
+                if _map[key_start : key_start + key_length] == key:
+                    return slot
+        return None
+
+    def _read_value(self, key, now):
+        """Read the encoded value for a key, or None if not present."""
+        key_hash = self._hash(key)
+        slot = self._find(key, key_hash)
+        if slot is None:
+            return None
+        offset = self._offset(slot)
+        _state, ref, _hash, expire, key_length, value_length = self._read_slot(slot)
+        if expire and expire <= now:
+            return None
+        if not ref:
+            # Setting a single byte is safe under a shared lock
+            self._map[offset + 1 : offset + 2] = b"\x01"
+        value_start = offset + self.slot_struct.size + key_length
+        return self._map[value_start : value_start + value_length]
+
+    def _choose_slot(self, key, key_hash, now):
+        """Choose a slot to write a key to."""
+        free_slot = None
+        candidates = []
+        for slot in self._probe(key_hash):
+            state, ref, slot_hash, expire, key_length, _ = self._read_slot(slot)
+            if state == self.SLOT_USED and slot_hash == key_hash:
+                key_start = self._offset(slot) + self.slot_struct.size
+                if self._map[key_start : key_start + key_length] == key:
+                    return slot
+            if free_slot is not None:
+                if state == self.SLOT_EMPTY:
+                    break
+                continue
+            if state != self.SLOT_USED or (expire and expire <= now):
+                free_slot = slot
+                if state == self.SLOT_EMPTY:
+                    # The key can't be in later slots
+                    break
+            else:
+                candidates.append((slot, ref))
+        if free_slot is not None:
+            return free_slot
+        # Clock eviction; clear reference bits until a slot with a clear bit is found
+        self.stats.evictions += 1
+        for slot, ref in candidates:
+            if not ref:
+                return slot
+            offset = self._offset(slot)
+            self._map[offset + 1 : offset + 2] = b"\x00"
+        return candidates[0][0]
+
+    def _write_value(self, key, value, time, now, add=False):
+        key_hash = self._hash(key)
+        if len(key) + len(value) > self.max_value_size:
+            # Too large for a slot, make sure an old value isn't returned
+            log.debug("%r value for '%s' too large to cache", self, key)
+            self._remove(key, key_hash)
+            return False
+        slot = self._choose_slot(key, key_hash, now)
+        offset = self._offset(slot)
+        if add:
+            state, _ref, slot_hash, expire, key_length, _ = self._read_slot(slot)
+            if (
+                state == self.SLOT_USED
+                and slot_hash == key_hash
+                and not (expire and expire <= now)
+            ):
+                key_start = offset + self.slot_struct.size
+                if self._map[key_start : key_start + key_length] == key:
+                    return False
+        expire = (now + time / 1000.0) if time else 0.0
+        header = self.slot_struct.pack(
+            self.SLOT_USED, 0, key_hash, expire, len(key), len(value)
+        )
+        data_start = offset + len(header)
+        _map = self._map
+        # Write the state last, so a partial write is never read as a valid slot
+        _map[offset : offset + 1] = struct.pack(b"<B", self.SLOT_DELETED)
+        _map[data_start : data_start + len(key)] = key
+        _map[data_start + len(key) : data_start + len(key) + len(value)] = value
+        _map[offset + 1 : data_start] = header[1:]
+        _map[offset : offset + 1] = header[:1]
+        return True
+
+    def _remove(self, key, key_hash):
+        slot = self._find(key, key_hash)
+        if slot is not None:
+            offset = self._offset(slot)
+            self._map[offset : offset + 1] = struct.pack(b"<B", self.SLOT_DELETED)
+
+    def _get(self, key, default):
+        key = self.get_key(key)
+        with self._locked():
+            value = self._read_value(key, get_time())
+        if value is None:
+            return default
+        return self.decode_value(value)
+
+    def _get_many(self, keys, default):
+        bytes_keys = [(k, self.get_key(k)) for k in keys]
+        now = get_time()
+        with self._locked():
+            encoded = [(k, self._read_value(key, now)) for k, key in bytes_keys]
+        decode_value = self.decode_value
+        return {
+            k: default if value is None else decode_value(value) for k, value in encoded
+        }
+
+    def _set(self, key, value, time):
+        key = self.get_key(key)
+        value = self.encode_value(value)
+        with self._locked(exclusive=True):
+            self._write_value(key, value, time, get_time())
+
+    def _set_many(self, values, time):
+        encoded = [
+            (self.get_key(k), self.encode_value(value)) for k, value in values
+        ]
+        now = get_time()
+        with self._locked(exclusive=True):
+            for key, value in encoded:
+                self._write_value(key, value, time, now)
+
+    def _add(self, key, value, time):
+        key = self.get_key(key)
+        value = self.encode_value(value)
+        with self._locked(exclusive=True):
+            return self._write_value(key, value, time, get_time(), add=True)
+
+    def _delete(self, key):
+        key = self.get_key(key)
+        with self._locked(exclusive=True):
+            self._remove(key, self._hash(key))
+
+    def _delete_many(self, keys):
+        bytes_keys = [self.get_key(k) for k in keys]
+        with self._locked(exclusive=True):
+            for key in bytes_keys:
+                self._remove(key, self._hash(key))
+
+    def _contains(self, key):
+        key = self.get_key(key)
+        with self._locked():
+            return self._read_value(key, get_time()) is not None
+
+    def evict(self):
+        """Remove expired values, return the number removed"""
+        now = get_time()
+        deleted = struct.pack(b"<B", self.SLOT_DELETED)
+        removed = 0
+        with self._locked(exclusive=True):
+            for slot in range(self.slot_count):
+                state, _ref, _hash, expire, _, _ = self._read_slot(slot)
+                if state == self.SLOT_USED and expire and expire <= now:
+                    offset = self._offset(slot)
+                    self._map[offset : offset + 1] = deleted
+                    removed += 1
+        return removed
+
+
+class _FileLock(object):
+    """Acquires the thread lock and the file lock of a shared cache."""
+
+    def __init__(self, cache, exclusive):
+        self.cache = cache
+        self.exclusive = exclusive
+
+    def __enter__(self):
+        cache = self.cache
+        cache.lock.acquire()
+        try:
+            if cache._map is None:
+                raise ValueError("cache is closed")
+            cache._lock_file(cache._fd, exclusive=self.exclusive)
+        except:
+            cache.lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.cache._unlock_file(self.cache._fd)
+        finally:
+            self.cache.lock.release()
@@ -0,0 +1,275 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+
+from ..cache import Cache
+from .. import errors
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from threading import local
+from time import time as get_time
+import logging
+import os
+
+
+log = logging.getLogger("moya.runtime")
+
+
+class SQLiteCache(Cache):
+    """Caches in an SQLite database, shared by all processes on a host
+
+    Each thread has its own connection. The database uses write-ahead logging, so
+    readers don't block writers.
+
+    The expire time is indexed, so `evict` deletes expired values without scanning
+    the table. If a maximum size is set, `evict` also deletes the least recently
+    used values.
+
+    """
+
+    cache_backend_name = "sqlite"
+    thread_safe = True
+    evict_interval = 60 * 1000
+    # Minimum time between updates to the access time of a value (seconds)
+    touch_interval = 60
+    # Maximum number of parameters in a single query
+    max_parameters = 500
+
+    create_sql = [
+        """CREATE TABLE IF NOT EXISTS cache (
+            key BLOB PRIMARY KEY,
+            value BLOB NOT NULL,
+            expire REAL,
+            accessed REAL NOT NULL,
+            size INTEGER NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS cache_expire ON cache (expire)",
+        "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)",
+    ]
+    get_sql = "SELECT value, expire, accessed FROM cache WHERE key = ?"
+    get_many_sql = "SELECT key, value, expire FROM cache WHERE key IN ({})"
+    set_sql = "INSERT OR REPLACE INTO cache (key, value, expire, accessed, size) VALUES (?, ?, ?, ?, ?)"
+    add_sql = "INSERT OR IGNORE INTO cache (key, value, expire, accessed, size) VALUES (?, ?, ?, ?, ?)"
+    delete_sql = "DELETE FROM cache WHERE key = ?"
+    delete_expired_key_sql = "DELETE FROM cache WHERE key = ? AND expire <= ?"
+    contains_sql = "SELECT 1 FROM cache WHERE key = ? AND (expire IS NULL OR expire > ?)"
+    touch_sql = "UPDATE cache SET accessed = ? WHERE key = ?"
+    evict_sql = "DELETE FROM cache WHERE key IN (SELECT key FROM cache WHERE expire <= ? LIMIT ?)"
+    size_sql = "SELECT COALESCE(SUM(size), 0) FROM cache"
+    trim_sql = "SELECT key, size FROM cache ORDER BY accessed LIMIT ?"
+
+    def __init__(
+        self,
+        name,
+        namespace,
+        path,
+        max_size=0,
+        compress=True,
+        compress_min=1024,
+        timeout=5000,
+    ):
+        super(SQLiteCache, self).__init__(
+            name, namespace, compress=compress, compress_min=compress_min
+        )
+        if sqlite3 is None:
+            raise errors.StartupFailedError(
+                "'sqlite3' module is required for cache type 'sqlite'"
+            )
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._local = local()
+        # Create the table on startup, so errors are reported early
+        self._get_connection()
+
+    def __repr__(self):
+        return "<cache:sqlite '{}' '{}'>".format(self.name, self.path)
+
+    @classmethod
+    def initialize(cls, name, settings):
+        location = settings.get("location", "").strip()
+        if not location:
+            # A default location would be shared by every project on the host
+            raise errors.StartupFailedError(
+                "cache '{}' requires a 'location' setting (a directory for the database)".format(
+                    name
+                )
+            )
+        if not os.path.isdir(location):
+            os.makedirs(location)
+        return cls(
+            name,
+            settings.get("namespace", ""),
+            path=os.path.join(location, "{}.sqlite".format(name)),
+            max_size=settings.get_int("size", 0) * 1024,
+            compress=settings.get_bool("compress", True),
+            compress_min=settings.get_int("compress_min", 1024),
+        )
+
+    def _get_connection(self):
+        """Get a connection for the current thread (and process)."""
+        _local = self._local
+        pid = os.getpid()
+        connection = getattr(_local, "connection", None)
+        if connection is not None and _local.pid == pid:
+            return connection
+        # Connections can't be shared with a forked process
+        connection = sqlite3.connect(
+            self.path, timeout=self.timeout / 1000.0, isolation_level=None
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        for sql in self.create_sql:
+            connection.execute(sql)
+        _local.connection = connection
+        _local.pid = pid
+        return connection
+
+    def close(self):
+        """Close the connection for the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _row(self, key, value, expire_time, now):
+        return (sqlite3.Binary(key), sqlite3.Binary(value), expire_time, now, len(value))
+
+    def _get(self, key, default):
+        key = self.get_key(key)
+        connection = self._get_connection()
+        row = connection.execute(self.get_sql, (sqlite3.Binary(key),)).fetchone()
+        if row is None:
+            return default
+        value, expire_time, accessed = row
+        now = get_time()
+        if expire_time is not None and expire_time <= now:
+            return default
+        if self.max_size and now - accessed > self.touch_interval:
+            connection.execute(self.touch_sql, (now, sqlite3.Binary(key)))
+        return self.decode_value(bytes(value))
+
+    def _get_many(self, keys, default):
+        get_key = self.get_key
+        cache_keys = {get_key(k): k for k in keys}
+        connection = self._get_connection()
+        now = get_time()
+        found = {}
+        bytes_keys = list(cache_keys)
+        for start in range(0, len(bytes_keys), self.max_parameters):
+            batch = bytes_keys[start : start + self.max_parameters]
+            sql = self.get_many_sql.format(", ".join("?" * len(batch)))
+            for key, value, expire_time in connection.execute(
+                sql, [sqlite3.Binary(key) for key in batch]
+            ):
+                if expire_time is None or expire_time > now:
+                    found[cache_keys[bytes(key)]] = value
+        decode_value = self.decode_value
+        return {
+            k: decode_value(bytes(found[k])) if k in found else default for k in keys
+        }
+
+    def _set(self, key, value, time):
+        key = self.get_key(key)
+        now = get_time()
+        expire_time = now + time / 1000.0 if time else None
+        self._get_connection().execute(
+            self.set_sql, self._row(key, self.encode_value(value), expire_time, now)
+        )
+
+    def _set_many(self, values, time):
+        now = get_time()
+        expire_time = now + time / 1000.0 if time else None
+        get_key = self.get_key
+        encode_value = self.encode_value
+        rows = [
+            self._row(get_key(k), encode_value(value), expire_time, now)
+            for k, value in values
+        ]
+        connection = self._get_connection()
+        # A single transaction is much faster than one per value
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(self.set_sql, rows)
+
+    def _add(self, key, value, time):
+        key = self.get_key(key)
+        now = get_time()
+        expire_time = now + time / 1000.0 if time else None
+        connection = self._get_connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            # An expired value may be replaced
+            connection.execute(
+                self.delete_expired_key_sql, (sqlite3.Binary(key), now)
+            )
+            cursor = connection.execute(
+                self.add_sql, self._row(key, self.encode_value(value), expire_time, now)
+            )
+            return cursor.rowcount == 1
+
+    def _delete(self, key):
+        key = self.get_key(key)
+        self._get_connection().execute(self.delete_sql, (sqlite3.Binary(key),))
+
+    def _delete_many(self, keys):
+        get_key = self.get_key
+        connection = self._get_connection()
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(
+                self.delete_sql, [(sqlite3.Binary(get_key(k)),) for k in keys]
+            )
+
+    def _contains(self, key):
+        key = self.get_key(key)
+        row = (
+            self._get_connection()
+            .execute(self.contains_sql, (sqlite3.Binary(key), get_time()))
+            .fetchone()
+        )
+        return row is not None
+
+    def evict(self):
+        """Delete expired values, and trim to the maximum size, return the number deleted"""
+        connection = self._get_connection()
+        now = get_time()
+        removed = 0
+        while True:
+            # Delete in batches, so that other processes aren't blocked for long
+            cursor = connection.execute(self.evict_sql, (now, self.evict_batch_size))
+            removed += cursor.rowcount
+            if cursor.rowcount < self.evict_batch_size:
+                break
+        if self.max_size:
+            removed += self.trim()
+        return removed
+
+    def trim(self):
+        """Delete the least recently used values, if the cache is over its maximum size"""
+        connection = self._get_connection()
+        (size,) = connection.execute(self.size_sql).fetchone()
+        if size <= self.max_size:
+            return 0
+        # Trim to below the maximum, so that it isn't exceeded again immediately
+        target_size = self.max_size * 0.9
+        removed = 0
+        while size > target_size:
+            rows = connection.execute(self.trim_sql, (self.evict_batch_size,)).fetchall()
+            if not rows:
+                break
+            delete_keys = []
+            for key, value_size in rows:
+                if size <= target_size:
+                    break
+                delete_keys.append((key,))
+                size -= value_size
+            with connection:
+                connection.execute("BEGIN")
+                connection.executemany(self.delete_sql, delete_keys)
+            removed += len(delete_keys)
+        log.debug("%r trimmed %s value(s)", self, removed)
+        return removed
@@ -0,0 +1,204 @@
+"""
+Protection against cache stampedes
+
+When a popular cached value expires, every request that reads it would recompute it at
+the same time. `CacheFill` makes sure that only one request (per key) recomputes a value.
+Within a process this is coordinated with an event, across processes with a lock key
+stored in the cache itself (see `CacheType.add`).
+
+Values are stored with the time they expire and the time they took to compute. A value
+may be recomputed a little before it expires, with a probability that increases as the
+expiry time approaches ("probabilistic early expiration"), while other requests continue
+to use the current value. If a `stale` period is given, an expired value will be
+served for that long while it is being recomputed.
+
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+from collections import namedtuple
+from math import log as _log
+from random import random
+from threading import Lock, Event
+from time import time as get_time, sleep
+
+import logging
+
+log = logging.getLogger("moya.cache")
+
+
+CachedValue = namedtuple("CachedValue", ["value", "expire_time", "delta"])
+
+# A value stored with the generations of its tags, as ((<tag key>, <generation>), ...)
+TaggedValue = namedtuple("TaggedValue", ["value", "generations"])
+
+
+# Maps (<cache id>, <key>) on to (<event>, <lock expire time>)
+_fills_lock = Lock()
+_fills = {}
+
+
+class CacheFill(object):
+    """Read a value from a cache, and coordinate recomputing it.
+
+    Call `get`, which returns the cached value or `default`. If `default` is returned,
+    the caller should compute the value and call `set` (or `release` on error).
+
+    """
+
+    lock_suffix = "._lock"
+
+    def __init__(
+        self,
+        cache,
+        key,
+        time=0,
+        stale=0,
+        read=None,
+        beta=1.0,
+        lock_time=30000,
+        wait_time=5000,
+        tags=None,
+    ):
+        self.cache = cache
+        self.key = key
+        self.time = time or 0
+        self.stale = stale or 0
+        self.read = read
+        self.beta = beta
+        self.lock_time = lock_time
+        self.wait_time = wait_time
+        self.tags = tags
+        self._generations = None
+        self._locked = False
+        self._event = None
+        self._start = None
+
+    def __repr__(self):
+        return "<cachefill '{}'>".format(self.key)
+
+    @property
+    def _fill_key(self):
+        return (id(self.cache), self.key)
+
+    @property
+    def _lock_key(self):
+        return self.key + self.lock_suffix
+
+    def _read(self):
+        if self.read is None:
+            stored = self.cache.get(self.key, None)
+        else:
+            stored = self.read()
+        if stored is None:
+            return None
+        if not isinstance(stored, CachedValue):
+            # Stored without an expiry time
+            return CachedValue(stored, None, 0)
+        return stored
+
+    def acquire(self):
+        """Try to acquire the right to recompute the value, return True if successful."""
+        fill_key = self._fill_key
+        now = get_time()
+        with _fills_lock:
+            fill = _fills.get(fill_key, None)
+            # Locks expire, in case the value was never set
+            if fill is not None and fill[1] > now:
+                return False
+            event = Event()
+            _fills[fill_key] = (event, now + self.lock_time / 1000.0)
+        if not self.cache.add(self._lock_key, 1, time=self.lock_time):
+            self._remove_fill(event)
+            return False
+        self._event = event
+        self._locked = True
+        self._start = get_time()
+        return True
+
+    def release(self):
+        """Release the lock acquired with `acquire`."""
+        if not self._locked:
+            return
+        self._locked = False
+        self.cache.delete(self._lock_key)
+        self._remove_fill(self._event)
+
+    def _remove_fill(self, event):
+        fill_key = self._fill_key
+        with _fills_lock:
+            fill = _fills.get(fill_key, None)
+            if fill is not None and fill[0] is event:
+                del _fills[fill_key]
+        event.set()
+
+    def _wait(self, default):
+        """Wait for another thread or process to compute a value."""
+        end_time = get_time() + self.wait_time / 1000.0
+        with _fills_lock:
+            fill = _fills.get(self._fill_key, None)
+        if fill is not None:
+            fill[0].wait(self.wait_time / 1000.0)
+        while True:
+            cached = self._read()
+            if cached is not None:
+                return cached.value
+            if get_time() >= end_time or not self.cache.contains(self._lock_key):
+                break
+            sleep(0.05)
+        # Give up waiting and compute it ourselves
+        self.acquire()
+        return self._compute(default)
+
+    def _compute(self, default):
+        """Prepare for the caller to compute the value, and return `default`."""
+        if self.tags:
+            # Read before computing, so that an invalidation while computing isn't missed
+            self._generations = self.cache.get_tag_generations(self.tags)
+        return default
+
+    def get(self, default=None):
+        """Get the cached value, or `default` if the caller should compute it."""
+        cached = self._read()
+        if cached is None:
+            if self.acquire():
+                return self._compute(default)
+            return self._wait(default)
+
+        value, expire_time, delta = cached
+        if expire_time is None:
+            return value
+
+        now = get_time()
+        if now >= expire_time:
+            # Expired, but within the stale period
+            if self.acquire():
+                return self._compute(default)
+            return value
+
+        if delta and now - delta * self.beta * _log(random() or 1e-10) >= expire_time:
+            # Refresh early
+            if self.acquire():
+                return self._compute(default)
+        return value
+
+    def set(self, value):
+        """Store a newly computed value, and release the lock."""
+        now = get_time()
+        delta = (now - self._start) if self._start is not None else 0
+        if self.time:
+            expire_time = now + self.time / 1000.0
+            cache_time = self.time + self.stale
+        else:
+            expire_time = None
+            cache_time = 0
+        try:
+            self.cache.set(
+                self.key,
+                CachedValue(value, expire_time, delta),
+                cache_time,
+                tags=self.tags,
+                generations=self._generations,
+            )
+        finally:
+            self.release()
@@ -0,0 +1,171 @@
+"""
+Lightweight statistics for caches
+
+Every cache keeps a `CacheStats` object, which counts hits, misses etc., keeps
+histograms of get / set latency, and estimates the most frequently read keys.
+Recording a call is cheap enough to leave on in production; no lock is taken for the
+counters, so they may be very slightly out under heavy concurrency.
+
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+
+from bisect import bisect_left
+from threading import Lock
+from time import time as get_time
+
+
+class LatencyHistogram(object):
+    """Counts call times (in milliseconds) in fixed buckets"""
+
+    # Upper bound of each bucket, the last bucket is everything slower
+    buckets = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 1000.0)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms):
+        self.counts[bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """Get the upper bound of the bucket containing a percentile (or max)"""
+        if not self.count:
+            return 0.0
+        target = self.count * percent / 100.0
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            if running >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        labels = ["<={:g}ms".format(bound) for bound in self.buckets]
+        labels.append(">{:g}ms".format(self.buckets[-1]))
+        return {
+            "count": self.count,
+            "mean": round(self.mean, 3),
+            "max": round(self.max, 3),
+            "p50": round(self.percentile(50), 3),
+            "p90": round(self.percentile(90), 3),
+            "p99": round(self.percentile(99), 3),
+            "buckets": [
+                [label, count] for label, count in zip(labels, self.counts) if count
+            ],
+        }
+
+
+class HotKeys(object):
+    """Estimates the most frequently read keys (the 'space saving' algorithm)
+
+    Only one in every `sample_interval` keys is counted, and at most `capacity` keys
+    are tracked. When a new key is seen and the table is full, the least counted key
+    is replaced and the new key inherits its count, so counts are over-estimates.
+
+    """
+
+    def __init__(self, capacity=64, sample_interval=16):
+        self.capacity = capacity
+        self.sample_interval = sample_interval
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.counts = {}
+        self._countdown = self.sample_interval
+
+    def sample(self, key):
+        """Count a key, if it is sampled"""
+        self._countdown -= 1
+        if self._countdown > 0:
+            return
+        self._countdown = self.sample_interval
+        with self.lock:
+            counts = self.counts
+            if key in counts:
+                counts[key] += 1
+            elif len(counts) < self.capacity:
+                counts[key] = 1
+            else:
+                min_key = min(counts, key=counts.__getitem__)
+                counts[key] = counts.pop(min_key) + 1
+
+    def top(self, count=10):
+        """Get a list of (<key>, <estimated reads>), most read first"""
+        with self.lock:
+            items = list(self.counts.items())
+        items.sort(key=lambda item: (-item[1], item[0]))
+        return [(key, hits * self.sample_interval) for key, hits in items[:count]]
+
+
+class CacheStats(object):
+    """Counters, latency histograms and hot keys for a cache"""
+
+    counters = (
+        "hits",
+        "misses",
+        "sets",
+        "deletes",
+        "evictions",
+        "errors",
+        "bytes_read",
+        "bytes_written",
+    )
+
+    def __init__(self):
+        self.get_latency = LatencyHistogram()
+        self.set_latency = LatencyHistogram()
+        self.hot_keys = HotKeys()
+        self.reset()
+
+    def reset(self):
+        """Reset all statistics to zero"""
+        for name in self.counters:
+            setattr(self, name, 0)
+        self.get_latency.reset()
+        self.set_latency.reset()
+        self.hot_keys.reset()
+        self.start_time = get_time()
+
+    @property
+    def hit_ratio(self):
+        reads = self.hits + self.misses
+        return float(self.hits) / reads if reads else 0.0
+
+    def record_get(self, keys, hits, start):
+        """Record a get of one or more keys, started at time `start`"""
+        self.get_latency.record((get_time() - start) * 1000.0)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        sample = self.hot_keys.sample
+        for key in keys:
+            sample(key)
+
+    def record_set(self, count, start):
+        """Record a set of `count` values, started at time `start`"""
+        self.set_latency.record((get_time() - start) * 1000.0)
+        self.sets += count
+
+    def to_dict(self, top=10):
+        """Get statistics as a dict, that may be serialized as JSON"""
+        stats = {name: getattr(self, name) for name in self.counters}
+        stats["hit_ratio"] = round(self.hit_ratio, 4)
+        stats["uptime"] = round(get_time() - self.start_time, 1)
+        stats["get_latency"] = self.get_latency.to_dict()
+        stats["set_latency"] = self.set_latency.to_dict()
+        stats["hot_keys"] = [[key, reads] for key, reads in self.hot_keys.top(top)]
+        return stats
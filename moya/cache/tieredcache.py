@@ -0,0 +1,182 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+
+from ..cache import Cache
+from .stampede import CacheFill
+from ..containers import LRUCache
+from ..context.expressiontime import TimeSpan
+from ..settings import SettingsSectionContainer
+from .. import errors
+
+from time import time as get_time
+import uuid
+
+import logging
+
+log = logging.getLogger("moya.runtime")
+
+
+class TieredCache(Cache):
+    """Caches in local memory (L1), in front of another cache (L2)
+
+    Values read from L2 are kept in L1 for a short time. Deleting a key changes a
+    generation value stored in L2; every cache that shares L2 checks the generation
+    periodically and clears its L1 if it has changed.
+
+    A value set in another process may be read from L1 for up to `l1_time` after it
+    was changed or expired.
+
+    """
+
+    cache_backend_name = "tiered"
+    thread_safe = True
+    generation_key = "._generation"
+
+    def __init__(
+        self,
+        name,
+        namespace,
+        l2=None,
+        l1_size=1000,
+        l1_time=5000,
+        generation_check=1000,
+        compress=False,
+        compress_min=1024,
+    ):
+        super(TieredCache, self).__init__(
+            name, namespace, compress=compress, compress_min=compress_min
+        )
+        if l2 is None:
+            l2 = Cache.create(name, SettingsSectionContainer({"type": "dict"}))
+        self.l2 = l2
+        self.l1_time = l1_time
+        self.l1 = LRUCache(l1_size, ttl=(l1_time / 1000.0) if l1_time else None)
+        self.generation_check = generation_check / 1000.0
+        self._generation = None
+        self._next_check = 0.0
+
+    def __repr__(self):
+        return "<cache:tiered '{}' {!r}>".format(self.name, self.l2)
+
+    @classmethod
+    def initialize(cls, name, settings):
+        l2_type = settings.get("l2", "dict")
+        if l2_type == cls.cache_backend_name:
+            raise errors.StartupFailedError(
+                "L2 cache for cache '{}' may not be '{}'".format(name, l2_type)
+            )
+        # The L2 cache is configured from the same section
+        l2_settings = SettingsSectionContainer(
+            (k, v) for k, v in settings.items() if k not in ("l2", "type", "debug")
+        )
+        l2_settings["type"] = l2_type
+        l2 = Cache.create(name, l2_settings)
+        return cls(
+            name,
+            settings.get("namespace", ""),
+            l2=l2,
+            l1_size=settings.get_int("l1_size", 1000),
+            l1_time=TimeSpan.to_ms(settings.get("l1_time", "5s")),
+            generation_check=TimeSpan.to_ms(settings.get("generation_check", "1s")),
+        )
+
+    def check_generation(self):
+        """Clear L1 if another cache has invalidated keys in L2."""
+        now = get_time()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.generation_check
+        generation = self.l2.get(self.generation_key, None)
+        if generation != self._generation:
+            self.l1.clear()
+            self._generation = generation
+
+    def _new_generation(self):
+        generation = uuid.uuid4().hex
+        self.l2.set(self.generation_key, generation)
+        self._generation = generation
+
+    def _store_l1(self, key, value, time):
+        # L1 stores (<value>, <expire time>), the expire time is only required
+        # for values that expire before the L1 time
+        if not time or not self.l1_time or time >= self.l1_time:
+            self.l1[key] = (value, None)
+        else:
+            self.l1[key] = (value, get_time() + time / 1000.0)
+
+    def _get_l1(self, key):
+        value, expire_time = self.l1[key]
+        if expire_time is not None and get_time() >= expire_time:
+            self.l1.pop(key, None)
+            raise KeyError(key)
+        return value
+
+    def _get(self, key, default):
+        self.check_generation()
+        try:
+            return self._get_l1(key)
+        except KeyError:
+            pass
+        value = self.l2.get(key, None)
+        if value is None:
+            return default
+        self.l1[key] = (value, None)
+        return value
+
+    def _get_many(self, keys, default):
+        self.check_generation()
+        get_l1 = self._get_l1
+        result = {}
+        missing = []
+        for key in keys:
+            try:
+                result[key] = get_l1(key)
+            except KeyError:
+                missing.append(key)
+        if missing:
+            for key, value in self.l2.get_many(missing, None).items():
+                if value is None:
+                    result[key] = default
+                else:
+                    result[key] = value
+                    self.l1[key] = (value, None)
+        return result
+
+    def _set(self, key, value, time):
+        self.l2.set(key, value, time=time)
+        self._store_l1(key, value, time)
+
+    def _set_many(self, values, time):
+        self.l2.set_many(values, time=time)
+        for key, value in values:
+            self._store_l1(key, value, time)
+
+    def _add(self, key, value, time):
+        # Used for locks, which should be visible to other processes immediately
+        return self.l2.add(key, value, time=time)
+
+    def _delete(self, key):
+        if key.endswith(CacheFill.lock_suffix):
+            # Locks are never stored in L1, so there is no need to invalidate
+            self.l2.delete(key)
+            return
+        self.l1.pop(key, None)
+        self.l2.delete(key)
+        self._new_generation()
+
+    def _delete_many(self, keys):
+        for key in keys:
+            self.l1.pop(key, None)
+        self.l2.delete_many(keys)
+        self._new_generation()
+
+    def _contains(self, key):
+        self.check_generation()
+        try:
+            self._get_l1(key)
+        except KeyError:
+            return self.l2.contains(key)
+        return True
+
+    def evict(self):
+        return self.l2.evict()
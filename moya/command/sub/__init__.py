@@ -23,6 +23,7 @@ __all__ = [
     "init",
     "showini",
     "precache",
+    "cachestats",
     "show",
     "showform",
 ]
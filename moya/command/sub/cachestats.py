@@ -0,0 +1,171 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+
+from ...command import SubCommand
+from ...compat import text_type
+from ... import moyajson
+
+import requests
+
+
+def _format_bytes(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024:
+            return "{:.0f}{}".format(num_bytes, unit)
+        num_bytes /= 1024.0
+    return "{:.1f}TB".format(num_bytes)
+
+
+class CacheStats(SubCommand):
+    """Show cache statistics from a running server (requires moya.diagnostics to be mounted)"""
+
+    help = "show cache statistics from a running server"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            dest="url",
+            metavar="URL",
+            help="URL of cache stats view (e.g. http://127.0.0.1:8000/diagnostics/cache-stats/)",
+        )
+        parser.add_argument(
+            "-k",
+            "--key",
+            dest="key",
+            default=None,
+            metavar="KEY",
+            help="value of the diagnostics 'stats_key' setting",
+        )
+        parser.add_argument(
+            "-c",
+            "--cache",
+            dest="cache",
+            default=None,
+            metavar="CACHE NAMES",
+            help="comma separated list of caches to show",
+        )
+        parser.add_argument(
+            "-t",
+            "--top",
+            dest="top",
+            type=int,
+            default=10,
+            metavar="COUNT",
+            help="number of hot keys to show",
+        )
+        parser.add_argument(
+            "--reset",
+            dest="reset",
+            action="store_true",
+            default=False,
+            help="reset statistics after reading them",
+        )
+        parser.add_argument(
+            "--json",
+            dest="json",
+            action="store_true",
+            default=False,
+            help="write statistics as JSON",
+        )
+
+    def run(self):
+        args = self.args
+        console = self.console
+        params = {"top": args.top}
+        if args.key:
+            params["key"] = args.key
+        if args.cache:
+            params["cache"] = args.cache
+        if args.reset:
+            params["reset"] = "yes"
+        try:
+            response = requests.get(args.url, params=params)
+        except Exception as e:
+            self.error("unable to get cache stats ({})".format(e))
+            return -1
+        if response.status_code != 200:
+            self.error(
+                "unable to get cache stats (status code {})".format(
+                    response.status_code
+                )
+            )
+            return -1
+        try:
+            stats = response.json()
+        except ValueError:
+            self.error("response was not JSON, is the URL correct?")
+            return -1
+
+        if args.json:
+            console.text(moyajson.dumps(stats, indent=4, sort_keys=True))
+            return 0
+        if not stats:
+            console.text("no caches have been used")
+            return 0
+
+        table = []
+        latency_table = []
+        for name, cache_stats in sorted(stats.items()):
+            table.append(
+                [
+                    name,
+                    cache_stats["type"],
+                    "{:.1%}".format(cache_stats["hit_ratio"]),
+                    cache_stats["hits"],
+                    cache_stats["misses"],
+                    cache_stats["sets"],
+                    cache_stats["evictions"],
+                    cache_stats["errors"],
+                    _format_bytes(cache_stats["bytes_read"]),
+                    _format_bytes(cache_stats["bytes_written"]),
+                ]
+            )
+            get_latency = cache_stats["get_latency"]
+            set_latency = cache_stats["set_latency"]
+            latency_table.append(
+                [name]
+                + [
+                    "{:.2f}ms".format(latency[stat])
+                    for latency in (get_latency, set_latency)
+                    for stat in ("mean", "p50", "p99", "max")
+                ]
+            )
+        console.table(
+            table,
+            header_row=[
+                "cache",
+                "type",
+                "hit ratio",
+                "hits",
+                "misses",
+                "sets",
+                "evictions",
+                "errors",
+                "read",
+                "written",
+            ],
+        )
+        console.table(
+            latency_table,
+            header_row=[
+                "cache",
+                "get mean",
+                "get p50",
+                "get p99",
+                "get max",
+                "set mean",
+                "set p50",
+                "set p99",
+                "set max",
+            ],
+        )
+
+        for name, cache_stats in sorted(stats.items()):
+            hot_keys = cache_stats["hot_keys"]
+            if not hot_keys:
+                continue
+            console.text("hot keys in '{}' (estimated reads)".format(name), bold=True)
+            console.table(
+                [[text_type(key), reads] for key, reads in hot_keys],
+                header_row=["key", "reads"],
+            )
+        return 0
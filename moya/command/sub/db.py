@@ -51,6 +51,29 @@ class DB(SubCommand):
         )
         add_common(parser)
 
+        parser = subparsers.add_parser(
+            "pool",
+            help="show connection pools",
+            description="show connection pool settings and state, or the live state from a running server (with --url)",
+        )
+        add_common(parser)
+        parser.add_argument(
+            "-u",
+            "--url",
+            dest="url",
+            default=None,
+            metavar="URL",
+            help="URL of the moya.diagnostics db-pools view (e.g. http://127.0.0.1:8000/diagnostics/db-pools/)",
+        )
+        parser.add_argument(
+            "-k",
+            "--key",
+            dest="key",
+            default=None,
+            metavar="KEY",
+            help="value of the diagnostics 'stats_key' setting",
+        )
+
         return parser
 
     def run(self):
@@ -97,3 +120,72 @@ class DB(SubCommand):
         else:
             self.console.text("models validated successfully", fg="green", bold=True)
         return fails
+
+    def sub_pool(self):
+        args = self.args
+        if args.url:
+            import requests
+
+            params = {"key": args.key} if args.key else {}
+            try:
+                response = requests.get(args.url, params=params)
+                response.raise_for_status()
+                pools = response.json()
+            except Exception as e:
+                self.console.error("unable to get pool state ({})".format(e))
+                return -1
+        else:
+            application = WSGIApplication(
+                self.location,
+                self.get_settings(),
+                validate_db=False,
+                disable_autoreload=True,
+                master_settings=self.master_settings,
+            )
+            engines = application.archive.database_engines
+            pools = {}
+            for _name, engine in engines.items():
+                for state in engine.get_pool_state():
+                    pools[state["name"]] = state
+
+        if not pools:
+            self.console.text("no databases")
+            return 0
+        table = []
+        activity_table = []
+        for name, state in sorted(pools.items()):
+            saturation = state.get("saturation")
+            table.append(
+                [
+                    name,
+                    state["pool"],
+                    state.get("size", ""),
+                    state.get("checked_out", ""),
+                    state.get("overflow", ""),
+                    "" if saturation is None else "{:.0%}".format(saturation),
+                    state["peak"],
+                ]
+            )
+            latency = state["checkout_latency"]
+            activity_table.append(
+                [name]
+                + [state[counter] for counter in ("checkouts", "connects", "timeouts")]
+                + ["{:.2f}ms".format(latency[stat]) for stat in ("mean", "p99", "max")]
+            )
+        self.console.table(
+            table,
+            header_row=["pool", "type", "size", "out", "overflow", "saturation", "peak"],
+        )
+        self.console.table(
+            activity_table,
+            header_row=[
+                "pool",
+                "checkouts",
+                "connects",
+                "timeouts",
+                "wait mean",
+                "wait p99",
+                "wait max",
+            ],
+        )
+        return 0
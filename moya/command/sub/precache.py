@@ -6,6 +6,8 @@ from ...wsgi import WSGIApplication
 from ...compat import text_type
 from ...context.expression import Expression
 
+import os
+
 
 class PreCache(SubCommand):
     """Load resources in to cache in advance"""
@@ -62,9 +64,10 @@ class PreCache(SubCommand):
                     except Exception as e:
                         failed_templates.append((path, text_type(e)))
 
-        if archive.has_cache("parser"):
-            parser_cache = archive.get_cache("parser")
+        expression_cache_path = archive.get_expression_cache_path()
+        has_parser_cache = archive.has_cache("parser")
 
+        if has_parser_cache or expression_cache_path is not None:
             console.text("pre-caching expressions", bold=True)
 
             elements = []
@@ -78,7 +81,19 @@ class PreCache(SubCommand):
                     progress.step(msg=getattr(el, "libid", ""))
                     el.compile_expressions()
 
-            Expression.dump(parser_cache)
+            if has_parser_cache:
+                Expression.dump(archive.get_cache("parser"))
+
+            if expression_cache_path is not None:
+                dirname = os.path.dirname(expression_cache_path)
+                if dirname and not os.path.exists(dirname):
+                    os.makedirs(dirname)
+                count = Expression.dump_file(expression_cache_path)
+                console.text(
+                    "wrote {} expression(s) to '{}'".format(
+                        count, expression_cache_path
+                    )
+                )
         else:
             console.error("no 'parser' cache available to store expressions")
 
@@ -232,7 +232,7 @@ location = ./static
 # -------------------------------------------------------------
 
 [cache:parser]
-# Cache used to store parsed expressions
+# Cache used to store parsed documents and expressions
 type = dict
 namespace = parser
 location = ./__moyacache__
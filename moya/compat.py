@@ -131,6 +131,19 @@ else:
             return +1
 
 
+if PY2:
+
+    def move_to_end(ordered_dict, key):
+        """Move a key to the end of an OrderedDict."""
+        ordered_dict[key] = ordered_dict.pop(key)
+
+
+else:
+    from collections import OrderedDict as _OrderedDict
+
+    move_to_end = _OrderedDict.move_to_end
+
+
 class string(object):
     lowercase = "abcdefghijklmnopqrstuvwxyz"
     uppercase = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
@@ -1,10 +1,11 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
-from .compat import PY2, text_type, implements_to_string
+from .compat import PY2, text_type, implements_to_string, move_to_end
 from .urltools import urlencode
 
 from threading import Lock
+from time import time
 
 if PY2:
     from urlparse import parse_qsl
@@ -15,36 +16,180 @@ else:
 from collections import OrderedDict
 
 
-class LRUCache(OrderedDict):
+class _LRUShard(object):
+    """A portion of an LRUCache, with its own lock."""
+
+    __slots__ = ["items", "lock", "hits", "misses", "evictions", "expired"]
+
+    def __init__(self):
+        self.items = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+
+class LRUCache(object):
     """A dictionary-like container that stores a given maximum items.
 
     If an additional item is added when the LRUCache is full, the least recently used key is
     discarded to make room for the new item.
 
+    Keys are distributed across a number of shards (by hash), each with its own lock, so
+    threads only contend when they access keys in the same shard. If `ttl` is given,
+    items expire after that many seconds.
+
     """
 
-    def __init__(self, cache_size=None):
+    default_size = 1000
+
+    def __init__(self, cache_size=None, shards=None, ttl=None):
+        if cache_size is None:
+            cache_size = self.default_size
+        if cache_size < 1:
+            raise ValueError("cache_size must be at least 1")
+        if shards is None:
+            shards = 8 if cache_size >= 256 else 1
+        shards = max(1, min(shards, cache_size))
         self.cache_size = cache_size
-        self.lock = Lock()
-        super(LRUCache, self).__init__()
+        self.ttl = ttl
+        self._shard_size = -(-cache_size // shards)
+        self._shards = tuple(_LRUShard() for _ in range(shards))
 
     def __reduce__(self):
-        return self.__class__, (self.cache_size,)
+        return self.__class__, (self.cache_size, len(self._shards), self.ttl)
+
+    def __repr__(self):
+        return "<lrucache {}/{}>".format(len(self), self.cache_size)
+
+    def _get_shard(self, key):
+        shards = self._shards
+        if len(shards) == 1:
+            return shards[0]
+        return shards[hash(key) % len(shards)]
+
+    def __len__(self):
+        return sum(len(shard.items) for shard in self._shards)
+
+    def __bool__(self):
+        return any(shard.items for shard in self._shards)
+
+    __nonzero__ = __bool__
+
+    def __contains__(self, key):
+        shard = self._get_shard(key)
+        with shard.lock:
+            try:
+                value, expire_time = shard.items[key]
+            except KeyError:
+                return False
+            if expire_time is not None and expire_time <= time():
+                del shard.items[key]
+                shard.expired += 1
+                return False
+            return True
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, key):
+        shard = self._get_shard(key)
+        with shard.lock:
+            items = shard.items
+            try:
+                value, expire_time = items[key]
+            except KeyError:
+                shard.misses += 1
+                raise
+            if expire_time is not None and expire_time <= time():
+                del items[key]
+                shard.expired += 1
+                shard.misses += 1
+                raise KeyError(key)
+            move_to_end(items, key)
+            shard.hits += 1
+            return value
+
+    lookup = __getitem__
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
 
     def __setitem__(self, key, value):
-        with self.lock:
-            if self.cache_size is not None and key not in self:
-                if len(self) >= self.cache_size:
-                    self.popitem(last=False)
-            OrderedDict.__setitem__(self, key, value)
-
-    def lookup(self, key):
-        with self.lock:
-            value = OrderedDict.__getitem__(self, key)
-            del self[key]
-            OrderedDict.__setitem__(self, key, value)
+        shard = self._get_shard(key)
+        expire_time = None if self.ttl is None else time() + self.ttl
+        with shard.lock:
+            items = shard.items
+            if key in items:
+                move_to_end(items, key)
+            else:
+                while len(items) >= self._shard_size:
+                    items.popitem(last=False)
+                    shard.evictions += 1
+            items[key] = (value, expire_time)
+
+    def __delitem__(self, key):
+        shard = self._get_shard(key)
+        with shard.lock:
+            del shard.items[key]
+
+    def pop(self, key, *default):
+        shard = self._get_shard(key)
+        with shard.lock:
+            try:
+                value, _expire_time = shard.items.pop(key)
+            except KeyError:
+                if default:
+                    return default[0]
+                raise
             return value
 
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.items.clear()
+
+    def keys(self):
+        keys = []
+        for shard in self._shards:
+            with shard.lock:
+                keys.extend(shard.items.keys())
+        return keys
+
+    def items(self):
+        items = []
+        for shard in self._shards:
+            with shard.lock:
+                items.extend((k, v) for k, (v, _) in shard.items.items())
+        return items
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def get_stats(self):
+        """Get a dict of cache statistics."""
+        stats = {
+            "size": len(self),
+            "max_size": self.cache_size,
+            "shards": len(self._shards),
+            "ttl": self.ttl,
+            "hits": sum(shard.hits for shard in self._shards),
+            "misses": sum(shard.misses for shard in self._shards),
+            "evictions": sum(shard.evictions for shard in self._shards),
+            "expired": sum(shard.expired for shard in self._shards),
+        }
+        total = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["hits"] / float(total)) if total else 0.0
+        return stats
+
+    def __moyaconsole__(self, console):
+        console.text(repr(self), fg="green", bold=True)
+        console.table(sorted(self.get_stats().items()), header_row=["stat", "value"])
+
 
 @implements_to_string
 class QueryData(OrderedDict):
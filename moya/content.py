@@ -125,6 +125,8 @@ class Content(interface.AttributeExposer):
         # self.section_stack = [self.new_section("body", "base.html")]
         self.section_stack = []
         self.http_status = None
+        self.stream = False
+        self.stream_chunk_size = None
         super(Content, self).__init__()
 
     def __repr__(self):
@@ -266,8 +268,7 @@ class Content(interface.AttributeExposer):
     def add_markup(self, name, markup):
         self.current_section.add_markup(name, markup)
 
-    def moya_render(self, archive, context, target, options):
-        engine = archive.get_template_engine("moya")
+    def _get_template_data(self):
         td = self.td.copy()
         td.update(sections=self.sections, include=self._include)
 
@@ -275,10 +276,26 @@ class Content(interface.AttributeExposer):
             template = self.app.resolve_template(self.template)
         else:
             template = self.template
+        return template, td
+
+    def moya_render(self, archive, context, target, options):
+        engine = archive.get_template_engine("moya")
+        template, td = self._get_template_data()
         rendered = engine.render(template, td, base_context=context, app=self.app)
 
         return HTML(rendered)
 
+    def moya_render_iter(self, archive, context, target, options):
+        engine = archive.get_template_engine("moya")
+        template, td = self._get_template_data()
+        return engine.render_iter(
+            template,
+            td,
+            base_context=context,
+            app=self.app,
+            chunk_size=options.get("chunk_size"),
+        )
+
     def print_tree(self):
         pprint(self.td)
         for name, section in self.sections.items():
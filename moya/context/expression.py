@@ -47,6 +47,8 @@ from ..compat import implements_to_string, text_type, string_types
 from ..context.modifiers import ExpressionModifiers
 from ..moyaexceptions import MoyaException
 from ..errors import LogicError
+from .expressioncompiler import compile_evaluator
+from .expressioncache import ExpressionCache
 from operator import methodcaller
 
 import logging
@@ -122,6 +124,10 @@ class Evaluator(object):
     def eval(self, context):
         raise NotImplementedError
 
+    def compile_python(self, compiler):
+        """Get Python source for this node (defaults to calling eval)"""
+        return compiler.call(self.eval)
+
     def __getstate__(self):
         return self.tokens
 
@@ -141,6 +147,9 @@ class EvalConstant(Evaluator):
         value = self.value = self.constants[self.key]
         self.eval = lambda context: value
 
+    def compile_python(self, compiler):
+        return compiler.const(self.value)
+
 
 class EvalVariable(Evaluator):
     """Class to evaluate a parsed variable"""
@@ -155,6 +164,13 @@ class EvalVariable(Evaluator):
         else:
             self.eval = methodcaller("get_simple", self.key)
 
+    def compile_python(self, compiler):
+        index = self._index
+        if index.from_root or len(index) > 1:
+            return "context[{}]".format(compiler.bind(index, "_i"))
+        else:
+            return "context.get_simple({})".format(compiler.bind(self.key, "_k"))
+
 
 class EvalLiteralIndex(Evaluator):
     __slots__ = ["scope", "indices"]
@@ -164,11 +180,14 @@ class EvalLiteralIndex(Evaluator):
         self.indices = [dataindex.parse(t[1:]) for t in tokens[0][1:]]
 
     def eval(self, context):
-        obj = self.scope(context)
-        for index in self.indices:
-            with context.data_frame(obj):
-                obj = context[index]
-        return obj
+        return _literal_index(context, self.scope(context), self.indices)
+
+    def compile_python(self, compiler):
+        return "{}(context, {}, {})".format(
+            compiler.bind(_literal_index),
+            self.tokens[0][0].compile_python(compiler),
+            compiler.bind(self.indices, "_i"),
+        )
 
 
 @implements_to_string
@@ -191,6 +210,9 @@ class EvalRegExp(Evaluator):
     def eval(self, context):
         return self
 
+    def compile_python(self, compiler):
+        return compiler.const(self)
+
 
 @implements_to_string
 class EvalTimespan(Evaluator):
@@ -207,6 +229,9 @@ class EvalTimespan(Evaluator):
     def eval(self, context):
         return self.ts
 
+    def compile_python(self, compiler):
+        return compiler.const(self.ts)
+
 
 class EvalCurrentScope(Evaluator):
     """Class to eval the current scope"""
@@ -217,6 +242,9 @@ class EvalCurrentScope(Evaluator):
         return context.obj
         # return context.capture_scope()
 
+    def compile_python(self, compiler):
+        return "context.obj"
+
 
 class EvalExplicitVariable(Evaluator):
     """Class to evaluate a parsed constant or explicit variable (beginning with $)"""
@@ -229,6 +257,9 @@ class EvalExplicitVariable(Evaluator):
     def eval(self, context):
         return context[self.index]
 
+    def compile_python(self, compiler):
+        return "context[{}]".format(compiler.bind(self.index, "_i"))
+
 
 class EvalInteger(Evaluator):
     """Class to evaluate an integer value"""
@@ -239,6 +270,9 @@ class EvalInteger(Evaluator):
         value = self.value = int(tokens[0])
         self.eval = lambda context: value
 
+    def compile_python(self, compiler):
+        return compiler.const(self.value)
+
 
 class EvalReal(Evaluator):
     """Class to evaluate a real number value"""
@@ -249,6 +283,9 @@ class EvalReal(Evaluator):
         value = self.value = float(tokens[0])
         self.eval = lambda context: value
 
+    def compile_python(self, compiler):
+        return compiler.const(self.value)
+
 
 class EvalTripleString(Evaluator):
     """Class to evaluate a triple quoted string"""
@@ -259,6 +296,9 @@ class EvalTripleString(Evaluator):
         value = self.value = _decode(tokens[0][3:-3])
         self.eval = lambda context: value
 
+    def compile_python(self, compiler):
+        return compiler.const(self.value)
+
 
 class EvalString(Evaluator):
     """Class to evaluate a string"""
@@ -269,6 +309,9 @@ class EvalString(Evaluator):
         value = self.value = _decode(tokens[0][1:-1])
         self.eval = lambda context: value
 
+    def compile_python(self, compiler):
+        return compiler.const(self.value)
+
 
 class EvalSignOp(Evaluator):
     """Class to evaluate expressions with a leading + or - sign"""
@@ -286,6 +329,13 @@ class EvalSignOp(Evaluator):
     def eval(self, context):
         return self.eval_func(self._eval(context))
 
+    def compile_python(self, compiler):
+        sign, value = self.tokens[0]
+        value_source = value.compile_python(compiler)
+        return compiler.fold(self.eval_func, value_source) or "({}{})".format(
+            sign, value_source
+        )
+
 
 class EvalNotOp(Evaluator):
     """Class to evaluate expressions with logical NOT"""
@@ -297,6 +347,12 @@ class EvalNotOp(Evaluator):
         _eval = self._eval = value.eval
         self.eval = lambda context: not _eval(context)
 
+    def compile_python(self, compiler):
+        value_source = self.tokens[0][1].compile_python(compiler)
+        return compiler.fold(operator.not_, value_source) or "(not {})".format(
+            value_source
+        )
+
 
 class EvalList(Evaluator):
     """Class to evaluate a parsed variable"""
@@ -309,6 +365,9 @@ class EvalList(Evaluator):
     def eval(self, context):
         return [_eval(context) for _eval in self.list_tokens]
 
+    def compile_python(self, compiler):
+        return "[{}]".format(", ".join(t.compile_python(compiler) for t in self.tokens))
+
 
 class EvalSimpleList(Evaluator):
     """Class to evaluate a parsed variable"""
@@ -321,6 +380,9 @@ class EvalSimpleList(Evaluator):
     def eval(self, context):
         return [_eval(context) for _eval in self.list_tokens]
 
+    def compile_python(self, compiler):
+        return "[{}]".format(", ".join(t.compile_python(compiler) for t in self.tokens))
+
 
 class EvalEmptyList(Evaluator):
     __slots__ = []
@@ -331,6 +393,9 @@ class EvalEmptyList(Evaluator):
     def eval(self, context):
         return []
 
+    def compile_python(self, compiler):
+        return "[]"
+
 
 class EvalDict(Evaluator):
     __slots__ = ["_item_eval"]
@@ -341,6 +406,14 @@ class EvalDict(Evaluator):
     def eval(self, context):
         return {k(context): v(context) for k, v in self._item_eval}
 
+    def compile_python(self, compiler):
+        return "{{{}}}".format(
+            ", ".join(
+                "{}: {}".format(k.compile_python(compiler), v.compile_python(compiler))
+                for k, v in self.tokens[0]
+            )
+        )
+
 
 class ExpFunction(object):
     __slots__ = ["context", "text", "_eval", "_context"]
@@ -368,6 +441,11 @@ class EvalFunction(Evaluator):
     def eval(self, context):
         return ExpFunction(context, "", self._eval)
 
+    def compile_python(self, compiler):
+        return '{}(context, "", lambda context: {})'.format(
+            compiler.bind(ExpFunction), self.tokens[0][0].compile_python(compiler)
+        )
+
 
 class EvalKeyPairDict(Evaluator):
     __slots__ = ["_item_eval"]
@@ -378,6 +456,14 @@ class EvalKeyPairDict(Evaluator):
     def eval(self, context):
         return {k: v(context) for k, v in self._item_eval}
 
+    def compile_python(self, compiler):
+        return "{{{}}}".format(
+            ", ".join(
+                "{}: {}".format(compiler.const(k), v.compile_python(compiler))
+                for k, v in self.tokens
+            )
+        )
+
 
 class EvalEmptyDict(Evaluator):
     __slots__ = []
@@ -388,6 +474,9 @@ class EvalEmptyDict(Evaluator):
     def eval(self, context):
         return {}
 
+    def compile_python(self, compiler):
+        return "{}"
+
 
 class EvalModifierOp(Evaluator):
     """Class to evaluate expressions with a leading filter function"""
@@ -410,6 +499,87 @@ class EvalModifierOp(Evaluator):
     # def eval(self, context):
     #     return self.filter_func(context, self._eval(context))
 
+    def compile_python(self, compiler):
+        return "{}(context, {})".format(
+            compiler.bind(self.filter_func, "_m"), self.value.compile_python(compiler)
+        )
+
+
+def _literal_index(context, obj, indices):
+    """Look up literal indices (e.g. `(foo).bar`) on an object"""
+    for index in indices:
+        with context.data_frame(obj):
+            obj = context[index]
+    return obj
+
+
+def _apply_filter(context, app, value, filter_obj):
+    """Apply a filter to a value (the `|` operator)"""
+    if isinstance(filter_obj, text_type) and ".filters" in context:
+        filter_obj = context[".filters"].lookup(app, filter_obj)
+
+    if hasattr(filter_obj, "__moyafilter__"):
+        return filter_obj.__moyafilter__(context, app, value, {})
+    else:
+        if callable(filter_obj):
+            return filter_obj(value)
+        else:
+            raise ValueError(
+                "{} may not be used as a filter".format(
+                    to_expression(context, filter_obj)
+                )
+            )
+
+
+def _slice_value(context, obj, start, stop, step):
+    """Slice an object (the `[start:stop:step]` operator)"""
+    start, stop, step = (None if _s == "" else _s for _s in (start, stop, step))
+    try:
+        if hasattr(obj, "slice"):
+            return obj.slice(start, stop, step)
+        else:
+            return obj[start:stop:step]
+    except TypeError:
+        _vars = (
+            context.to_expr(start) if start is not None else "",
+            context.to_expr(stop) if stop is not None else "",
+            context.to_expr(step) if step is not None else "",
+        )
+        raise ValueError("unable to perform slice operation [{}:{}:{}]".format(*_vars))
+
+
+def _get_index(context, obj, index):
+    """Index an object (the `[index]` operator)"""
+    if getattr(index, "moya_missing", False):
+        raise ValueError("unable to look up missing index {!r}".format(index))
+    if hasattr(obj, "__moyacontext__"):
+        obj = obj.__moyacontext__(context)
+    if hasattr(index, "__moyacall__"):
+        for value in obj:
+            if index.__moyacall__(value):
+                return value
+        return Missing(text_type(index))
+    try:
+        if hasattr(obj, "__getitem__"):
+            return obj[index]
+        else:
+            return getattr(obj, index)
+    except Exception:
+        return Missing(text_type(index))
+
+
+def _call_object(context, obj, params):
+    """Call an object with parameters (the `(params)` operator)"""
+    if isinstance(obj, text_type) and ".filters" in context:
+        obj = context[".filters"].lookup(context.get(".app", None), obj)
+
+    if hasattr(obj, "__moyacall__"):
+        return obj.__moyacall__(params)
+    else:
+        raise ValueError(
+            "{} does not accept parameters".format(to_expression(context, obj))
+        )
+
 
 class EvalFilterOp(Evaluator):
     __slots__ = ["value", "_eval", "operator_eval"]
@@ -423,24 +593,18 @@ class EvalFilterOp(Evaluator):
         prod = self._eval(context)
         app = context.get(".app", None)
         for op, _eval in self.operator_eval:
-            filter_obj = _eval(context)
-
-            if isinstance(filter_obj, text_type) and ".filters" in context:
-                filter_obj = context[".filters"].lookup(app, filter_obj)
-
-            if hasattr(filter_obj, "__moyafilter__"):
-                prod = filter_obj.__moyafilter__(context, app, prod, {})
-            else:
-                if callable(filter_obj):
-                    prod = filter_obj(prod)
-                else:
-                    raise ValueError(
-                        "{} may not be used as a filter".format(
-                            to_expression(context, filter_obj)
-                        )
-                    )
+            prod = _apply_filter(context, app, prod, _eval(context))
         return prod
 
+    def compile_python(self, compiler):
+        apply_filter = compiler.bind(_apply_filter)
+        source = self.value[0].compile_python(compiler)
+        for op, val in pairs(self.value[1:]):
+            source = '{}(context, context.get(".app", None), {}, {})'.format(
+                apply_filter, source, val.compile_python(compiler)
+            )
+        return source
+
 
 class EvalSliceOp(Evaluator):
     __slots__ = ["value_eval", "slice_eval"]
@@ -459,22 +623,21 @@ class EvalSliceOp(Evaluator):
 
     def eval(self, context):
         obj = self.value_eval(context)
-        slice_indices = [_eval(context) for _eval in self.slice_eval]
-        start, stop, step = (None if _s == "" else _s for _s in slice_indices)
-        try:
-            if hasattr(obj, "slice"):
-                return obj.slice(start, stop, step)
-            else:
-                return obj[start:stop:step]
-        except TypeError:
-            _vars = (
-                context.to_expr(start) if start is not None else "",
-                context.to_expr(stop) if stop is not None else "",
-                context.to_expr(step) if step is not None else "",
-            )
-            raise ValueError(
-                "unable to perform slice operation [{}:{}:{}]".format(*_vars)
-            )
+        start, stop, step = [_eval(context) for _eval in self.slice_eval]
+        return _slice_value(context, obj, start, stop, step)
+
+    def compile_python(self, compiler):
+        slice_sources = [
+            t.compile_python(compiler) if t is not None else "None"
+            for t in self.tokens[0][1]
+        ]
+        if len(slice_sources) == 2:
+            slice_sources.append("None")
+        return "{}(context, {}, {})".format(
+            compiler.bind(_slice_value),
+            self.tokens[0][0].compile_python(compiler),
+            ", ".join(slice_sources),
+        )
 
 
 class EvalBraceOp(Evaluator):
@@ -489,44 +652,57 @@ class EvalBraceOp(Evaluator):
         for brace, eval in self.index_eval:
             index = eval(context)
             if brace == "[":
-                if getattr(index, "moya_missing", False):
-                    raise ValueError(
-                        "unable to look up missing index {!r}".format(index)
-                    )
-                if hasattr(obj, "__moyacontext__"):
-                    obj = obj.__moyacontext__(context)
+                obj = _get_index(context, obj, index)
                 if hasattr(index, "__moyacall__"):
-                    for value in obj:
-                        if index.__moyacall__(value):
-                            return value
-                    return Missing(text_type(index))
-                try:
-                    if hasattr(obj, "__getitem__"):
-                        obj = obj[index]
-                    else:
-                        obj = getattr(obj, index)
-                except Exception:
-                    obj = Missing(text_type(index))
+                    return obj
             else:
-                if isinstance(obj, text_type) and ".filters" in context:
-                    obj = context[".filters"].lookup(context.get(".app", None), obj)
-
-                if hasattr(obj, "__moyacall__"):
-                    obj = obj.__moyacall__(index)
-                else:
-                    raise ValueError(
-                        "{} does not accept parameters".format(
-                            to_expression(context, obj)
-                        )
-                    )
+                obj = _call_object(context, obj, index)
         return obj
 
+    def compile_python(self, compiler):
+        braces = self.tokens[0][1:]
+        if len(braces) > 1 and any(brace == "[" for brace, _ in braces):
+            # A callable index stops evaluation of the chain, which doesn't map to
+            # nested calls
+            return compiler.call(self.eval)
+        source = self.tokens[0][0].compile_python(compiler)
+        for brace, index in braces:
+            op = _get_index if brace == "[" else _call_object
+            source = "{}(context, {}, {})".format(
+                compiler.bind(op), source, index.compile_python(compiler)
+            )
+        return source
+
 
 def pairs(tokenlist):
     """Converts a list in to a sequence of paired values"""
     return zip(tokenlist[::2], tokenlist[1::2])
 
 
+_python_operators = {
+    "+": "+",
+    "-": "-",
+    "*": "*",
+    "/": "/",
+    "//": "//",
+    "%": "%",
+    "bitand": "&",
+    "bitor": "|",
+    "bitxor": "^",
+}
+
+
+def _compile_arithmetic(compiler, tokens, ops):
+    """Compile a chain of binary operators, folding constants from the left"""
+    source = tokens[0].compile_python(compiler)
+    for op, val in pairs(tokens[1:]):
+        rhs_source = val.compile_python(compiler)
+        source = compiler.fold(ops[op], source, rhs_source) or "({} {} {})".format(
+            source, _python_operators[op], rhs_source
+        )
+    return source
+
+
 class EvalMultOp(Evaluator):
     "Class to evaluate multiplication and division expressions"
 
@@ -563,6 +739,9 @@ class EvalMultOp(Evaluator):
 
             self.eval = eval
 
+    def compile_python(self, compiler):
+        return _compile_arithmetic(compiler, self.value, self.ops)
+
     # def eval(self, context):
     #     prod = self._eval(context)
     #     for op_func, _eval in self.operator_eval:
@@ -597,6 +776,9 @@ class EvalAddOp(Evaluator):
 
             self.eval = eval
 
+    def compile_python(self, compiler):
+        return _compile_arithmetic(compiler, self.value, self.ops)
+
     # def eval(self, context):
     #     sum = self._eval(context)
     #     for op_func, _eval in self.operator_eval:
@@ -614,6 +796,14 @@ class EvalRangeOp(Evaluator):
         a, b = self._evals
         return ExpressionRange.create(context, a(context), b(context), inclusive=True)
 
+    def compile_python(self, compiler):
+        a, b = self.tokens[0][0::2]
+        return "{}(context, {}, {}, inclusive=True)".format(
+            compiler.bind(ExpressionRange.create),
+            a.compile_python(compiler),
+            b.compile_python(compiler),
+        )
+
 
 class EvalExclusiveRangeOp(Evaluator):
     __slots__ = ["_evals"]
@@ -625,6 +815,14 @@ class EvalExclusiveRangeOp(Evaluator):
         a, b = self._evals
         return ExpressionRange.create(context, a(context), b(context), inclusive=False)
 
+    def compile_python(self, compiler):
+        a, b = self.tokens[0][0::2]
+        return "{}(context, {}, {}, inclusive=False)".format(
+            compiler.bind(ExpressionRange.create),
+            a.compile_python(compiler),
+            b.compile_python(compiler),
+        )
+
 
 class EvalTernaryOp(Evaluator):
     __slots__ = ["evals"]
@@ -639,6 +837,14 @@ class EvalTernaryOp(Evaluator):
         else:
             return falsey(context)
 
+    def compile_python(self, compiler):
+        condition, truthy, falsey = [
+            t.compile_python(compiler) for t in self.tokens[0][::2]
+        ]
+        if compiler.is_const(condition):
+            return truthy if compiler.constants[condition] else falsey
+        return "({} if {} else {})".format(truthy, condition, falsey)
+
 
 def _match_re(a, b):
     if isinstance(b, EvalRegExp):
@@ -705,6 +911,21 @@ class EvalComparisonOp(Evaluator):
             (self.opMap[op], val.eval) for op, val in pairs(self.value[1:])
         ]
 
+    python_operators = {
+        "<": "<",
+        "lt": "<",
+        "<=": "<=",
+        "lte": "<=",
+        ">": ">",
+        "gt": ">",
+        ">=": ">=",
+        "gte": ">=",
+        "!=": "!=",
+        "==": "==",
+        "is": "is",
+        "is not": "is not",
+    }
+
     def eval(self, context):
         val1 = self._eval(context)
         for op_func, _eval in self.operator_eval:
@@ -714,6 +935,36 @@ class EvalComparisonOp(Evaluator):
                 return False
         return True
 
+    def compile_python(self, compiler):
+        if len(self.operator_eval) > 1:
+            # Chained comparisons compare the previous *result*, unlike Python
+            return compiler.call(self.eval)
+        (op, rhs), = pairs(self.value[1:])
+        lhs_source = self.value[0].compile_python(compiler)
+        rhs_source = rhs.compile_python(compiler)
+        if op not in ("is", "is not"):
+            folded = compiler.fold(
+                lambda a, b: True if self.opMap[op](a, b) else False,
+                lhs_source,
+                rhs_source,
+            )
+            if folded:
+                return folded
+        if op in self.python_operators:
+            test = "{} {} {}".format(lhs_source, self.python_operators[op], rhs_source)
+        else:
+            test = "{}({}, {})".format(
+                compiler.bind(self.opMap[op], "_o"), lhs_source, rhs_source
+            )
+        return "(True if {} else False)".format(test)
+
+
+def _format_value(value, fmt):
+    """Format a value (the `::` operator)"""
+    if not isinstance(fmt, string_types):
+        raise ValueError("format should be a string, not {!r}".format(fmt))
+    return format(value, fmt)
+
 
 class EvalFormatOp(Evaluator):
     __slots__ = ["value", "_eval", "evals"]
@@ -726,13 +977,18 @@ class EvalFormatOp(Evaluator):
     def eval(self, context):
         val1 = self._eval(context)
         for _eval in self.evals:
-            fmt = _eval(context)
-            if not isinstance(fmt, string_types):
-                raise ValueError("format should be a string, not {!r}".format(fmt))
-            return format(val1, fmt)
+            return _format_value(val1, _eval(context))
 
         return val1
 
+    def compile_python(self, compiler):
+        lhs, op, fmt = self.value[:3]
+        lhs_source = lhs.compile_python(compiler)
+        fmt_source = fmt.compile_python(compiler)
+        return compiler.fold(_format_value, lhs_source, fmt_source) or "{}({}, {})".format(
+            compiler.bind(_format_value), lhs_source, fmt_source
+        )
+
 
 class EvalLogicOpOR(Evaluator):
     __slots__ = ["value", "_eval", "operator_eval"]
@@ -753,6 +1009,11 @@ class EvalLogicOpOR(Evaluator):
                 return val1
         return val1
 
+    def compile_python(self, compiler):
+        return "({})".format(
+            " or ".join(t.compile_python(compiler) for t in self.value[::2])
+        )
+
 
 class EvalLogicOpAND(Evaluator):
     __slots__ = ["value", "_eval", "operator_eval"]
@@ -773,6 +1034,11 @@ class EvalLogicOpAND(Evaluator):
                 return val1
         return val1
 
+    def compile_python(self, compiler):
+        return "({})".format(
+            " and ".join(t.compile_python(compiler) for t in self.value[::2])
+        )
+
 
 word_characters = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_0123456789"
 expr = Forward()
@@ -979,9 +1245,14 @@ class Function(object):
 class Expression(object):
     """Evaluate an arithmetic expression of context values"""
 
-    exp_cache = {}
-    new_expressions = set()
+    # Parsing isn't thread safe, so the parse cache shares the lock
     _lock = threading.RLock()
+    exp_cache = ExpressionCache(lock=_lock)
+    python_cache = ExpressionCache()
+    new_expressions = set()
+
+    # Compile expressions to Python functions, set to False to walk the evaluator tree
+    compile_python = True
 
     def __init__(self, exp):
         self.exp = exp
@@ -995,7 +1266,7 @@ class Expression(object):
 
     def compile(self):
         self.compiled_exp = self.compile_cache(self.exp)
-        self._eval = self.compiled_exp[0].eval
+        self._eval = self.get_compiled_eval(self.exp, self.compiled_exp)
         return self
 
     def eval(self, context):
@@ -1041,7 +1312,7 @@ class Expression(object):
         """Bit of magic to lazily compile expressions after unpickling"""
         self.exp, self.compiled_exp = state
         self.exp_cache[self.exp] = self.compiled_exp
-        self._eval = self.compiled_exp[0].eval
+        self._eval = self._lazy_compile_eval
 
     @classmethod
     def insert_expressions(cls, expressions):
@@ -1053,7 +1324,7 @@ class Expression(object):
     @classmethod
     def dump(cls, cache):
         name = "expcache.{}.{}".format(VERSION, __version__)
-        cache.set(name, cls.exp_cache)
+        cache.set(name, dict(cls.exp_cache.items()))
 
     @classmethod
     def load(cls, cache):
@@ -1064,43 +1335,58 @@ class Expression(object):
             return True
         return False
 
+    @classmethod
+    def dump_file(cls, path):
+        """Write parsed expressions to a cache file, return number of expressions"""
+        return cls.exp_cache.save_file(path, (VERSION, __version__))
+
+    @classmethod
+    def load_file(cls, path):
+        """Memory map a cache file written by `dump_file`"""
+        return cls.exp_cache.open_file(path, (VERSION, __version__))
+
+    @classmethod
+    def set_cache_size(cls, max_size):
+        """Set the maximum number of expressions to cache"""
+        cls.exp_cache.max_size = max_size
+        cls.python_cache.max_size = max_size
+
+    @classmethod
+    def get_cache_stats(cls):
+        """Get statistics for the expression caches"""
+        return {"parse": cls.exp_cache.get_stats(), "python": cls.python_cache.get_stats()}
+
+    @classmethod
+    def _parse(cls, exp):
+        try:
+            return expr.parseString(exp, parseAll=True).asList()
+        except ParseException as e:
+            raise ExpressionCompileError(
+                exp,
+                'unable to parse expression "{}"'.format(exp),
+                col=e.col,
+                original=e,
+            )
+
+    @classmethod
+    def get_compiled_eval(cls, exp, compiled_exp):
+        """Get a callable that evaluates a parsed expression"""
+        if not cls.compile_python:
+            return compiled_exp[0].eval
+
+        def build(exp):
+            return compile_evaluator(exp, compiled_exp[0]) or compiled_exp[0].eval
+
+        return cls.python_cache.get(exp, build)
+
     @classmethod
     def get_eval(cls, exp, context):
-        with cls._lock:
-            try:
-                compiled_exp = cls.exp_cache[exp]
-            except KeyError:
-                try:
-                    compiled_exp = cls.exp_cache[exp] = expr.parseString(
-                        exp, parseAll=True
-                    ).asList()
-                except ParseException as e:
-                    raise ExpressionCompileError(
-                        exp,
-                        'unable to parse expression "{}"'.format(exp),
-                        col=e.col,
-                        original=e,
-                    )
-            return compiled_exp[0].eval(context)
+        compiled_exp = cls.exp_cache.get(exp, cls._parse)
+        return cls.get_compiled_eval(exp, compiled_exp)(context)
 
     @classmethod
     def compile_cache(cls, exp):
-        with cls._lock:
-            try:
-                return cls.exp_cache[exp]
-            except KeyError:
-                try:
-                    compiled_exp = cls.exp_cache[exp] = expr.parseString(
-                        exp, parseAll=True
-                    ).asList()
-                    return compiled_exp
-                except ParseException as e:
-                    raise ExpressionCompileError(
-                        exp,
-                        'unable to parse expression "{}"'.format(exp),
-                        col=e.col,
-                        original=e,
-                    )
+        return cls.exp_cache.get(exp, cls._parse)
 
     @classmethod
     def get_new_expressions(cls):
@@ -1136,12 +1422,11 @@ class Expression(object):
         text = text_type(text)
         if not text:
             return
-        with cls._lock:
-            for exp in cls._re_substitute_context.findall(text):
-                try:
-                    cls.compile_cache(exp)
-                except:
-                    log.error("expression '%s' failed to parse", exp)
+        for exp in cls._re_substitute_context.findall(text):
+            try:
+                cls.compile_cache(exp)
+            except:
+                log.error("expression '%s' failed to parse", exp)
 
 
 class DefaultExpression(object):
@@ -0,0 +1,269 @@
+"""
+A bounded cache for compiled expressions
+
+Reads don't acquire a lock (a dict lookup is atomic under the GIL), so threads only
+contend when an expression is compiled for the first time.
+
+Compiled expressions may be saved to a versioned file, which is memory mapped when
+loaded so that expressions are only unpickled when they are first used.
+
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+from ..compat import pickle
+
+from collections import deque
+from threading import RLock
+
+import io
+import logging
+import mmap
+import os
+import struct
+
+
+log = logging.getLogger("moya.runtime")
+
+
+class ExpressionCacheFile(object):
+    """A memory mapped file of pickled compiled expressions.
+
+    The file consists of a fixed size header, followed by the pickled expressions,
+    followed by a pickled index of offsets.
+
+    """
+
+    MAGIC = b"MOYAEXPR"
+    FORMAT_VERSION = 1
+    _header = struct.Struct(str("<8sIQ"))
+
+    def __init__(self, path, version):
+        self.path = path
+        self.version = version
+        self._file = None
+        self._map = None
+        self.index = {}
+
+    def __repr__(self):
+        return "<expressioncachefile '{}'>".format(self.path)
+
+    def open(self):
+        """Map the file in to memory, return False if it is missing or out of date."""
+        try:
+            _file = io.open(self.path, "rb")
+        except IOError:
+            return False
+        try:
+            _map = mmap.mmap(_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            # Empty file
+            _file.close()
+            return False
+        header_size = self._header.size
+        try:
+            magic, format_version, index_offset = self._header.unpack(
+                _map[:header_size]
+            )
+            if magic != self.MAGIC or format_version != self.FORMAT_VERSION:
+                raise ValueError("not an expression cache file")
+            version, index = pickle.loads(_map[index_offset:])
+            if version != self.version:
+                raise ValueError("expression cache is out of date")
+        except Exception as e:
+            log.debug("unable to read expression cache '%s' (%s)", self.path, e)
+            _map.close()
+            _file.close()
+            return False
+        self._file = _file
+        self._map = _map
+        self.index = index
+        return True
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        self._map = None
+        self._file = None
+        self.index = {}
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def read(self, key):
+        """Get raw pickled data."""
+        offset, length = self.index[key]
+        return self._map[offset : offset + length]
+
+    def load(self, key):
+        """Unpickle a compiled expression."""
+        return pickle.loads(self.read(key))
+
+    @classmethod
+    def write(cls, path, version, items):
+        """Write a sequence of (<expression>, <pickled data>), atomically."""
+        index = {}
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        with io.open(temp_path, "wb") as f:
+            f.write(cls._header.pack(cls.MAGIC, cls.FORMAT_VERSION, 0))
+            for key, data in items:
+                index[key] = (f.tell(), len(data))
+                f.write(data)
+            index_offset = f.tell()
+            pickle.dump((version, index), f, pickle.HIGHEST_PROTOCOL)
+            f.seek(0)
+            f.write(cls._header.pack(cls.MAGIC, cls.FORMAT_VERSION, index_offset))
+        os.rename(temp_path, path)
+        return len(index)
+
+
+class ExpressionCache(object):
+    """A dictionary-like container for compiled expressions.
+
+    When more than `max_size` items are stored, the oldest items are discarded.
+    The hit and miss counters are updated without a lock, and may under-count
+    under heavy concurrency.
+
+    """
+
+    def __init__(self, max_size=50000, lock=None):
+        self.max_size = max_size
+        self._lock = lock or RLock()
+        self._cache = {}
+        self._keys = deque()
+        self._file = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return "<expressioncache {}/{}>".format(len(self._cache), self.max_size)
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def __iter__(self):
+        return iter(list(self._cache))
+
+    def __getitem__(self, key):
+        return self._cache[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        cache = self._cache
+        if key not in cache:
+            keys = self._keys
+            keys.append(key)
+            if self.max_size is not None:
+                while len(keys) > self.max_size:
+                    cache.pop(keys.popleft(), None)
+                    self.evictions += 1
+        cache[key] = value
+
+    def items(self):
+        return list(self._cache.items())
+
+    def update(self, items):
+        if hasattr(items, "items"):
+            items = items.items()
+        with self._lock:
+            for key, value in items:
+                self._set(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._keys.clear()
+
+    def get(self, key, build):
+        """Get a value, or call `build(key)` to create it if it isn't in the cache."""
+        try:
+            value = self._cache[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return value
+        with self._lock:
+            try:
+                # Another thread may have built it while we waited
+                return self._cache[key]
+            except KeyError:
+                pass
+            self.misses += 1
+            value = None
+            if self._file is not None and key in self._file:
+                try:
+                    value = self._file.load(key)
+                except Exception:
+                    log.exception("failed to load expression '%s' from cache file", key)
+                else:
+                    self.loads += 1
+            if value is None:
+                value = build(key)
+            self._set(key, value)
+            return value
+
+    def get_stats(self):
+        """Get a dict of cache statistics."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._cache),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / float(total)) if total else 0.0,
+            "file": self._file.path if self._file is not None else None,
+        }
+
+    def open_file(self, path, version):
+        """Memory map a cache file, return True if it was loaded."""
+        cache_file = ExpressionCacheFile(path, version)
+        if not cache_file.open():
+            return False
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = cache_file
+        return True
+
+    def close_file(self):
+        """Stop reading from a mapped cache file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def save_file(self, path, version):
+        """Write compiled expressions to a file, return the number of expressions."""
+
+        def iter_items():
+            saved = set()
+            for key, value in self.items():
+                try:
+                    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+                except Exception:
+                    log.debug("unable to pickle expression '%s'", key)
+                    continue
+                saved.add(key)
+                yield key, data
+            # Keep expressions in an existing file that were never used
+            cache_file = self._file
+            if cache_file is not None:
+                for key in list(cache_file.index):
+                    if key not in saved:
+                        yield key, cache_file.read(key)
+
+        with self._lock:
+            return ExpressionCacheFile.write(path, version, iter_items())
@@ -0,0 +1,115 @@
+"""
+Compile parsed Moya expressions to native Python functions
+
+The parser produces a tree of Evaluator objects. Evaluating that tree costs at least one
+Python call per node, which adds up when an expression is evaluated on every template
+substitution. The compiler here lowers the tree into a single Python function, so that
+operators become native Python operators and constant sub-expressions are evaluated once,
+at compile time.
+
+Evaluators that know how to lower themselves implement `compile_python`, anything else
+is called via its `eval` method, so the compiled function behaves exactly like the tree.
+
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import division
+from __future__ import absolute_import
+
+from ..compat import text_type, binary_type, int_types
+from ..sourcecompiler import SourceCompiler, compile_or_none
+
+import __future__
+import logging
+
+
+log = logging.getLogger("moya.runtime")
+
+# Values of these types may be shared between evaluations, so are safe to fold
+_immutable_types = int_types + (float, bool, text_type, binary_type, type(None))
+
+# Singletons that are safe to write as Python literals
+_literal_types = (bool, type(None))
+
+# Don't fold constants that would create large strings at compile time
+MAX_FOLD_SIZE = 4096
+
+_compile_flags = __future__.division.compiler_flag
+
+
+class PythonCompiler(SourceCompiler):
+    """Lowers an Evaluator tree to Python source and compiles it."""
+
+    def __init__(self, exp):
+        super(PythonCompiler, self).__init__()
+        self.exp = exp
+        self.constants = {}
+
+    def const(self, value):
+        """Get source for a constant value."""
+        if type(value) in _literal_types:
+            source = repr(value)
+        else:
+            source = self.bind(value, "_c")
+        self.constants[source] = value
+        return source
+
+    def is_const(self, source):
+        """Check if source was generated by `const`."""
+        return source in self.constants
+
+    def fold(self, func, *sources):
+        """Evaluate `func` at compile time if all the operands are constant.
+
+        Returns source for the folded value, or None if the operands couldn't
+        be folded.
+
+        """
+        constants = self.constants
+        if not all(source in constants for source in sources):
+            return None
+        try:
+            value = func(*[constants[source] for source in sources])
+        except Exception:
+            # Leave it for runtime, so errors are reported as usual
+            return None
+        if not isinstance(value, _immutable_types):
+            return None
+        if isinstance(value, (text_type, binary_type)) and len(value) > MAX_FOLD_SIZE:
+            return None
+        return self.const(value)
+
+    def call(self, eval_func):
+        """Get source that calls an eval function with the context."""
+        return "{}(context)".format(self.bind(eval_func, "_e"))
+
+    def build_source(self, evaluator):
+        """Generate the source for a function factory."""
+        source = evaluator.compile_python(self)
+        names = sorted(self.namespace)
+        lines = [
+            "def _make_expression({}):".format(", ".join(names)),
+            "    def _expression(context):",
+            "        return {}".format(source),
+            "    return _expression",
+        ]
+        return "\n".join(lines)
+
+    def compile(self, evaluator):
+        """Compile an evaluator to a function that takes a context."""
+        source = self.build_source(evaluator)
+        return self.exec_source(
+            source,
+            "<expression '{}'>".format(self.exp),
+            "_make_expression",
+            _compile_flags,
+        )
+
+
+def compile_evaluator(exp, evaluator):
+    """Get a Python function for an evaluator, or None if it could not be compiled."""
+    return compile_or_none(
+        lambda: PythonCompiler(exp).compile(evaluator),
+        "expression '{}' to Python".format(exp),
+        log,
+    )
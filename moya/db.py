@@ -2,9 +2,12 @@ from __future__ import unicode_literals
 from __future__ import print_function
 from __future__ import absolute_import
 
-from sqlalchemy import create_engine, MetaData
-from sqlalchemy.orm import sessionmaker
+import sqlalchemy
+from sqlalchemy import event, MetaData
+from sqlalchemy.orm import sessionmaker, Session, Mapper, object_mapper
+from sqlalchemy.orm.properties import RelationshipProperty
 from sqlalchemy.orm import scoped_session
+from sqlalchemy.sql.expression import UpdateBase
 from sqlalchemy.exc import (
     DatabaseError,
     IntegrityError,
@@ -16,8 +19,12 @@ from . import namespaces
 from .elements.utils import attr_bool
 from .compat import text_type, implements_to_string, itervalues
 from . import logic
+from . import errors
+from .dbpool import create_pooled_engine, read_pool_settings, get_pool_state
+from .dbcache import get_mapper_tables, table_tag
 from .console import Cell
 
+from itertools import count
 import weakref
 import logging
 
@@ -25,25 +32,117 @@ import logging
 startup_log = logging.getLogger("moya.startup")
 db_log = logging.getLogger("moya.db")
 
+# Lazy loads are detected from the path of the query that loads a relationship. Since
+# SQLAlchemy 1.2, lazy loads use baked queries which don't have a path.
+LAZY_LOAD_DETECTION = tuple(
+    int(part) for part in sqlalchemy.__version__.split(".")[:2]
+) < (1, 2)
+
 
 def dbobject(obj):
     return getattr(obj, "__moyadbobject__", lambda: obj)()
 
 
+class _RoutingSession(Session):
+    """A session that reads from a replica, until it is pinned to the primary."""
+
+    def get_bind(self, mapper=None, clause=None):
+        info = self.info
+        replica = info.get("replica", None)
+        if replica is not None and not info["primary"] and not self._flushing:
+            if not isinstance(clause, UpdateBase):
+                return replica
+            # Insert, update or delete (e.g. a bulk update)
+            info["writes"] = info["primary"] = True
+        return super(_RoutingSession, self).get_bind(mapper=mapper, clause=clause)
+
+
 @implements_to_string
 class DBEngine(object):
-    def __init__(self, name, engine_name, engine, default=False):
+    replica_selections = ("roundrobin", "leastload")
+
+    def __init__(
+        self,
+        name,
+        engine_name,
+        engine,
+        default=False,
+        replicas=None,
+        replica_select="roundrobin",
+        pool_stats=None,
+        query_cache=None,
+        get_cache=None,
+        lazy_load_warn=0,
+    ):
         self.name = name
         self.engine_name = engine_name
         self.engine = engine
         self.default = default
+        self.replicas = replicas or []
+        self.replica_select = replica_select
+        # List of PoolStats for the engine and replicas
+        self.pool_stats = pool_stats or []
+        # Name of the cache for query results, and a callable that gets a cache
+        self.query_cache = query_cache
+        self._get_cache = get_cache
+        # Warn if a relationship is lazy loaded this many times in a session
+        self.lazy_load_warn = lazy_load_warn
+        self._replica_count = count()
         # self.Session = sessionmaker(bind=engine)  # expire_on_commit
-        self.session_factory = sessionmaker(bind=engine)
+        self.session_factory = sessionmaker(
+            bind=engine, class_=_RoutingSession if self.replicas else Session
+        )
+        _listen_session_events(self.session_factory)
         self.metadata = MetaData()
         self.table_names = set()
 
     def get_session(self):
-        return DBSession(self.session_factory, self.engine)
+        return DBSession(
+            self.session_factory,
+            self.engine,
+            choose_replica=self.choose_replica if self.replicas else None,
+            name=self.name,
+            get_query_cache=self.get_query_cache,
+            invalidate_tables=self.invalidate_tables,
+            lazy_load_warn=self.lazy_load_warn,
+        )
+
+    def get_query_cache(self):
+        """Get the cache for query results, or None if there is no query cache."""
+        if self._get_cache is None or not self.query_cache:
+            return None
+        cache = self._get_cache(self.query_cache)
+        return cache if cache.enabled else None
+
+    def invalidate_tables(self, tables):
+        """Invalidate cached query results that read from any of the given tables."""
+        cache = self.get_query_cache()
+        if cache is None:
+            return
+        try:
+            cache.invalidate_tags([table_tag(self.name, table) for table in tables])
+        except Exception:
+            db_log.exception("unable to invalidate query cache for %r", self)
+        else:
+            db_log.debug("%r invalidated cached queries for %s", self, ", ".join(tables))
+
+    def get_pool_state(self):
+        """Get a list of the pool state for the engine and any replicas."""
+        return [
+            get_pool_state(engine, stats)
+            for engine, stats in zip([self.engine] + self.replicas, self.pool_stats)
+        ]
+
+    def choose_replica(self):
+        """Choose a replica engine for a new session."""
+        replicas = self.replicas
+        if self.replica_select == "leastload":
+            # Fewest connections in use (not all pools can report this)
+            return min(
+                replicas,
+                key=lambda replica: getattr(replica.pool, "checkedout", int)(),
+            )
+        return replicas[next(self._replica_count) % len(replicas)]
 
     def __str__(self):
         return "<dbengine %s>" % self.engine_name
@@ -98,6 +197,79 @@ def wrap_db_errors(f):
     return deco
 
 
+def _listen_session_events(session_factory):
+    """Track session activity in `session.info` (see `DBSession`)."""
+
+    def after_begin(session, transaction, connection):
+        info = session.info
+        info["active"] = True
+        info["begins"] += 1
+
+    def after_flush(session, flush_context):
+        info = session.info
+        # Subsequent reads go to the primary, so they see the writes
+        info["writes"] = info["primary"] = True
+        info["flushes"] += 1
+        # Tables to invalidate in the query cache, on commit
+        tables = info["tables"]
+        for obj in set(session.new) | set(session.dirty) | set(session.deleted):
+            tables.update(get_mapper_tables(object_mapper(obj)))
+
+    def after_bulk(query_context):
+        info = query_context.session.info
+        info["writes"] = info["primary"] = True
+        info["tables"].update(get_mapper_tables(query_context.mapper))
+
+    def after_commit(session):
+        info = session.info
+        info["commits"] += 1
+        # Also called when a savepoint is released, when the transaction continues
+        if session.transaction.nested:
+            return
+        info["active"] = info["writes"] = False
+        # Invalidate cached queries only once the changes are visible to others
+        tables = info["tables"]
+        if tables:
+            info["tables"] = set()
+            invalidate_tables = info.get("invalidate_tables", None)
+            if invalidate_tables is not None:
+                invalidate_tables(sorted(tables))
+
+    def after_rollback(session):
+        info = session.info
+        info["rollbacks"] += 1
+        # Writes before a savepoint that was rolled back should still be committed
+        if not session.transaction.nested:
+            info["active"] = info["writes"] = False
+            info["tables"] = set()
+
+    event.listen(session_factory, "after_begin", after_begin)
+    event.listen(session_factory, "after_flush", after_flush)
+    event.listen(session_factory, "after_bulk_update", after_bulk)
+    event.listen(session_factory, "after_bulk_delete", after_bulk)
+    event.listen(session_factory, "after_commit", after_commit)
+    event.listen(session_factory, "after_rollback", after_rollback)
+
+
+def _count_lazy_load(target, context):
+    """Count queries that load a relationship, to detect N+1 queries."""
+    session = getattr(context, "session", None)
+    if session is None or context.query is None:
+        return
+    lazy_loads = session.info.get("lazy_loads", None)
+    if lazy_loads is None or "_moya_lazy_load" in context.attributes:
+        return
+    # Called for every object loaded, but only count the query once
+    context.attributes["_moya_lazy_load"] = True
+    # The path of a query that loads a relationship ends with the relationship
+    path = context.query._current_path.path
+    if path and isinstance(path[-1], RelationshipProperty):
+        prop = path[-1]
+        model = getattr(prop.parent.class_, "_model", None)
+        key = "{}.{}".format(model.libid, prop.key) if model else text_type(prop)
+        lazy_loads[key] = lazy_loads.get(key, 0) + 1
+
+
 class _SessionContextManager(object):
     def __init__(self, session, element):
         self._session = session
@@ -113,9 +285,33 @@ class _SessionContextManager(object):
 
 
 class DBSession(object):
-    def __init__(self, session_factory, engine=None):
+    """A lazily created SQLAlchemy session, one per engine per request.
+
+    The session isn't created until it is used, and activity is tracked so that
+    sessions that weren't used (or only read) may be ended cheaply.
+
+    """
+
+    # Counters kept in session.info
+    counters = ("queries", "cache_hits", "begins", "flushes", "commits", "rollbacks")
+
+    def __init__(
+        self,
+        session_factory,
+        engine=None,
+        choose_replica=None,
+        name=None,
+        get_query_cache=None,
+        invalidate_tables=None,
+        lazy_load_warn=0,
+    ):
         self.session_factory = session_factory
         self._engine = weakref.ref(engine) if engine is not None else None
+        self._choose_replica = choose_replica
+        self.name = name
+        self._get_query_cache = get_query_cache
+        self._invalidate_tables = invalidate_tables
+        self.lazy_load_warn = lazy_load_warn
         self._session = None
         self._transaction_level = 0
 
@@ -126,12 +322,131 @@ class DBSession(object):
     @property
     def session(self):
         if self._session is None:
-            self._session = self.session_factory()
+            info = {name: 0 for name in self.counters}
+            info["active"] = info["writes"] = info["primary"] = False
+            info["tables"] = set()
+            if self._invalidate_tables is not None:
+                info["invalidate_tables"] = self._invalidate_tables
+            if self.lazy_load_warn:
+                if not event.contains(Mapper, "load", _count_lazy_load):
+                    event.listen(Mapper, "load", _count_lazy_load)
+                # Maps relationship on to number of queries that loaded it
+                info["lazy_loads"] = {}
+            if self._choose_replica is not None:
+                # The same replica is used for the lifetime of the session
+                info["replica"] = self._choose_replica()
+            self._session = self.session_factory(info=info)
         return self._session
 
+    def use_primary(self):
+        """Send all subsequent queries to the primary database (not a replica)."""
+        self.session.info["primary"] = True
+
+    @property
+    def using_primary(self):
+        """True if queries are sent to the primary database."""
+        if self._choose_replica is None:
+            return True
+        return self._session is not None and self._session.info["primary"]
+
+    @property
+    def used(self):
+        """True if the session was created."""
+        return self._session is not None
+
+    @property
+    def active(self):
+        """True if the session has a connection with a transaction in progress."""
+        return self._session is not None and self._session.info["active"]
+
+    @property
+    def has_writes(self):
+        """True if the session has changes that should be committed."""
+        session = self._session
+        if session is None:
+            return False
+        return session.info["writes"] or bool(
+            session.new or session.deleted or session.dirty
+        )
+
+    def get_query_cache(self):
+        """Get the cache for query results, or None."""
+        if self._get_query_cache is None:
+            return None
+        return self._get_query_cache()
+
+    @property
+    def use_query_cache(self):
+        """True if cached query results may be used.
+
+        Cached results won't reflect changes in the session that haven't been
+        committed, so the cache isn't used after a write, or in a transaction.
+
+        """
+        return not (self._transaction_level or self.has_writes)
+
+    def record_cache_hit(self):
+        self.session.info["cache_hits"] += 1
+
+    def get_stats(self):
+        """Get a dict of counters for this session."""
+        if self._session is None:
+            stats = {name: 0 for name in self.counters}
+        else:
+            info = self._session.info
+            stats = {name: info[name] for name in self.counters}
+        stats["used"] = self.used
+        return stats
+
+    def query(self, *args, **kwargs):
+        session = self.session
+        session.info["queries"] += 1
+        return session.query(*args, **kwargs)
+
+    def execute(self, clause, *args, **kwargs):
+        session = self.session
+        info = session.info
+        info["queries"] += 1
+        # Assume raw SQL writes, unless it is clearly a select
+        if not text_type(clause).lstrip()[:6].lower() == "select":
+            info["writes"] = info["primary"] = True
+        return session.execute(clause, *args, **kwargs)
+
+    def end(self):
+        """End the transaction; commit if there were writes, otherwise roll back.
+
+        Returns True if the session was committed.
+
+        """
+        if self.has_writes:
+            self._session.commit()
+            return True
+        if self.active:
+            # Cheaper than a commit, and releases any locks in the same way
+            self._session.rollback()
+        return False
+
+    def get_lazy_loads(self):
+        """Get a dict that maps relationships on to the number of loading queries."""
+        if self._session is None:
+            return {}
+        return dict(self._session.info.get("lazy_loads", {}))
+
+    def _warn_lazy_loads(self):
+        for relationship, queries in sorted(self.get_lazy_loads().items()):
+            if queries >= self.lazy_load_warn:
+                db_log.warning(
+                    "%s was loaded by %s queries (N+1 queries), "
+                    "consider prefetch or joinload attributes in <db:query>",
+                    relationship,
+                    queries,
+                )
+
     def close(self):
-        if self._session:
-            self.session.close()
+        if self._session is not None:
+            if self.lazy_load_warn:
+                self._warn_lazy_loads()
+            self._session.close()
             self._session = None
 
     def __moyacontext__(self, context):
@@ -142,14 +457,16 @@ class DBSession(object):
         return _SessionContextManager(self, element)
 
     def rollback(self):
-        self.session.rollback()
+        if self._session is not None:
+            self._session.rollback()
 
     def __repr__(self):
-        if self.session is not None:
+        if self._session is not None:
             return "<dbsession %s>" % self.engine
         return "<dbsession>"
 
     def enter_transaction(self):
+        self.use_primary()
         self._transaction_level += 1
 
     @wrap_db_errors
@@ -175,13 +492,50 @@ def add_engine(archive, name, section):
     echo = attr_bool(section.get("echo", "n"))
     default = attr_bool(section.get("default", "n"))
 
-    connect_args = {}
-    if engine_name.startswith("sqlite:"):
-        connect_args["check_same_thread"] = False
+    query_cache = section.get("query_cache", "runtime").strip()
+    try:
+        # Detect N+1 queries in develop mode
+        lazy_load_warn = section.get_int(
+            "lazy_load_warn", 10 if archive.develop else 0
+        )
+    except ValueError:
+        raise errors.StartupFailedError(
+            "db '{}' setting 'lazy_load_warn' should be a number".format(name)
+        )
+    if lazy_load_warn and not LAZY_LOAD_DETECTION:
+        startup_log.warning(
+            "db '%s' setting 'lazy_load_warn' requires SQLAlchemy earlier than 1.2 (installed version is %s), N+1 queries won't be detected",
+            name,
+            sqlalchemy.__version__,
+        )
+        lazy_load_warn = 0
+    pool_settings = read_pool_settings(name, section)
+    pool_stats = []
 
-    sqla_engine = create_engine(
-        engine_name, echo=echo, pool_recycle=3600, connect_args=connect_args
-    )
+    def make_engine(pool_name, engine_name):
+        try:
+            sqla_engine, stats = create_pooled_engine(
+                pool_name, engine_name, echo=echo, pool_settings=pool_settings
+            )
+        except (TypeError, ValueError) as e:
+            raise errors.StartupFailedError(
+                "unable to create db '{}' ({})".format(pool_name, e)
+            )
+        pool_stats.append(stats)
+        return sqla_engine
+
+    sqla_engine = make_engine(name, engine_name)
+    replicas = [
+        make_engine("{}:replica{}".format(name, index), replica)
+        for index, replica in enumerate(section.get_list("replicas"), 1)
+    ]
+    replica_select = section.get("replica_select", "roundrobin").strip()
+    if replica_select not in DBEngine.replica_selections:
+        raise errors.StartupFailedError(
+            "db '{}' setting 'replica_select' should be one of {} (not '{}')".format(
+                name, ", ".join(DBEngine.replica_selections), replica_select
+            )
+        )
 
     # if engine_name.startswith('sqlite:'):
     #     @event.listens_for(sqla_engine, "connect")
@@ -195,7 +549,18 @@ def add_engine(archive, name, section):
     #         # emit our own BEGIN
     #         conn.execute("BEGIN EXCLUSIVE")
 
-    engine = DBEngine(name, engine_name, sqla_engine, default)
+    engine = DBEngine(
+        name,
+        engine_name,
+        sqla_engine,
+        default,
+        replicas=replicas,
+        replica_select=replica_select,
+        pool_stats=pool_stats,
+        query_cache=query_cache,
+        get_cache=archive.get_cache,
+        lazy_load_warn=lazy_load_warn,
+    )
 
     if default or not archive.database_engines:
         archive.default_db_engine = name
@@ -213,53 +578,76 @@ def get_session_map(archive):
     return session_map
 
 
+def _used_sessions(context):
+    """Get the sessions that were used (the default session may appear twice)."""
+    sessions = []
+    for dbsession in context["._dbsessions"].values():
+        if dbsession.used and dbsession not in sessions:
+            sessions.append(dbsession)
+    return sessions
+
+
+def get_session_stats(context):
+    """Get a dict that maps db names on to session counters."""
+    return {
+        name: dbsession.get_stats()
+        for name, dbsession in context["._dbsessions"].items()
+        if name != "_default"
+    }
+
+
 def commit_sessions(context, close=True):
+    """Commit sessions with writes, and end read only sessions, return number committed."""
     count = 0
-    for dbsession in context["._dbsessions"].values():
-        if dbsession.session:
+    for dbsession in _used_sessions(context):
+        try:
+            committed = dbsession.end()
+        except:
+            db_log.exception("error committing session")
+            raise
+        if committed:
+            count += 1
+        if db_log.isEnabledFor(logging.DEBUG):
+            db_log.debug(
+                "%r %s (%s)",
+                dbsession,
+                "committed" if committed else "ended without writes",
+                ", ".join(
+                    "{}={}".format(k, v) for k, v in sorted(dbsession.get_stats().items())
+                ),
+            )
+        if close:
             try:
-                # db_log.debug('committing %s', dbsession)
-                dbsession.session.commit()
+                dbsession.close()
             except:
-                db_log.exception("error committing session")
-                raise
-            else:
-                count += 1
-            if close:
-                try:
-                    dbsession.close()
-                except:
-                    db_log.exception("error closing session")
+                db_log.exception("error closing session")
     return count
 
 
 def rollback_sessions(context, close=True):
     count = 0
-    for dbsession in context["._dbsessions"].values():
-        if dbsession.session:
+    for dbsession in _used_sessions(context):
+        try:
+            dbsession.rollback()
+        except:
+            db_log.exception("error rolling back session")
+        else:
+            count += 1
+        if close:
             try:
-                # db_log.debug('rolling back %s', dbsession)
-                dbsession.session.rollback()
+                dbsession.close()
             except:
-                db_log.exception("error rolling back session")
-            else:
-                count += 1
-            if close:
-                try:
-                    dbsession.close()
-                except:
-                    db_log.exception("error closing session")
+                db_log.exception("error closing session")
     return count
 
 
 def close_sessions(context):
     """Close db sessions."""
-    for dbsession in context["._dbsessions"].values():
-        if dbsession.session:
-            try:
-                dbsession.close()
-            except:
-                db_log.exception("error closing session")
+    for dbsession in _used_sessions(context):
+        try:
+            dbsession.close()
+        except:
+            db_log.exception("error closing session")
 
 
 def sync_all(archive, console, summary=True):
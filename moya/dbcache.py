@@ -0,0 +1,177 @@
+"""
+A cache for the results of database queries
+
+Query tags with the `cache` or `cachefor` attribute store their results in the cache
+named by the db's `query_cache` setting. Results are keyed on the SQL and its bound
+parameters, and stored as plain data (column values rather than objects), so they may
+be stored in any type of cache.
+
+Every cached result is tagged with the tables the query reads from. When a session
+commits changes to a table, the tag for that table is invalidated (see
+`get_mapper_tables` and `moya.db`). Only the query cache is invalidated, so with a
+per-process cache (such as the default `runtime` cache) other processes may return
+stale results, as may any process for changes not made through a session (e.g. raw
+SQL). Use `cachefor` to limit how long results may be stale.
+
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+from sqlalchemy import Table, inspect
+from sqlalchemy.orm import Mapper
+from sqlalchemy.orm.attributes import instance_state, set_committed_value
+from sqlalchemy.orm.session import make_transient_to_detached
+from sqlalchemy.sql import visitors
+from sqlalchemy.util import KeyedTuple
+
+from .compat import text_type
+
+import hashlib
+import logging
+
+log = logging.getLogger("moya.db")
+
+
+def table_tag(db_name, table_name):
+    """Get the cache tag for results that read from a table."""
+    return "db.{}.{}".format(db_name, table_name)
+
+
+def get_mapper_tables(mapper):
+    """Get the names of tables changed when an object is written (including many to many tables)."""
+    tables = {table.name for table in mapper.tables}
+    for prop in mapper.relationships:
+        secondary = prop.secondary
+        if secondary is not None and hasattr(secondary, "name"):
+            tables.add(secondary.name)
+    return tables
+
+
+def get_query_tables(statement):
+    """Get the names of all tables referenced in a statement (including subqueries)."""
+    return {
+        element.name
+        for element in visitors.iterate(statement, {})
+        if isinstance(element, Table)
+    }
+
+
+def make_query_key(db_name, statement, dialect, action=None):
+    """Make a cache key from the SQL and parameters of a query."""
+    compiled = statement.compile(dialect=dialect)
+    key_data = "{}\n{}\n{!r}".format(
+        action or "", compiled, sorted(compiled.params.items())
+    )
+    key_hash = hashlib.md5(key_data.encode("utf-8")).hexdigest()
+    return "db.query.{}.{}".format(db_name, key_hash)
+
+
+def _get_result_type(qs):
+    """Get ("objects", <mapper>) if a query returns objects, ("rows", <labels>) if
+    it returns rows of columns, or (None, None) if it can't be cached.
+
+    """
+    descriptions = qs.column_descriptions
+    mappers = [
+        inspect(description["expr"], raiseerr=False) for description in descriptions
+    ]
+    if len(mappers) == 1 and isinstance(mappers[0], Mapper):
+        return "objects", mappers[0]
+    if any(
+        isinstance(description["expr"], type) or description["aliased"]
+        for description in descriptions
+    ):
+        return None, None
+    return "rows", [description["name"] for description in descriptions]
+
+
+def dump_results(result_type, results):
+    """Convert query results to plain data."""
+    kind, _ = result_type
+    if kind == "objects":
+        rows = []
+        for obj in results:
+            # Only loaded attributes, so that deferred columns aren't loaded
+            state_dict = instance_state(obj).dict
+            rows.append(
+                {
+                    prop.key: state_dict[prop.key]
+                    for prop in instance_state(obj).mapper.column_attrs
+                    if prop.key in state_dict
+                }
+            )
+        return rows
+    return [tuple(row) for row in results]
+
+
+def load_results(dbsession, result_type, rows):
+    """Convert plain data from `dump_results` back to query results."""
+    kind, info = result_type
+    if kind == "objects":
+        mapper = info
+        session = dbsession.session
+        new_instance = mapper.class_manager.new_instance
+        results = []
+        for values in rows:
+            obj = new_instance()
+            for key, value in values.items():
+                set_committed_value(obj, key, value)
+            make_transient_to_detached(obj)
+            # Adds to the session without a query (returns the existing object if
+            # it was already loaded), unloaded attributes are loaded when accessed
+            results.append(session.merge(obj, load=False))
+        return results
+    return [KeyedTuple(row, info) for row in rows]
+
+
+_actions = {
+    None: lambda qs: qs.all(),
+    "count": lambda qs: qs.count(),
+    "exists": lambda qs: qs.first() is not None,
+}
+
+
+def query_cached(dbsession, qs, time=0, action=None):
+    """Run a query, using the query cache if possible.
+
+    If `action` is None, return a list of results, otherwise `action` may be
+    "count" or "exists" and the value is returned. Queries that can't be cached,
+    or queries in a session with changes to commit, go straight to the database.
+
+    """
+    run = _actions[action]
+    cache = dbsession.get_query_cache()
+    if cache is None or not dbsession.use_query_cache:
+        return run(qs)
+    result_type = ("value", None)
+    if action is None:
+        result_type = _get_result_type(qs)
+        if result_type[0] is None:
+            log.debug("query returns objects and columns, not cached")
+            return run(qs)
+
+    statement = qs.statement
+    db_name = dbsession.name
+    key = make_query_key(db_name, statement, dbsession.engine.dialect, action)
+    data = cache.get(key, None)
+    if data is not None:
+        dbsession.record_cache_hit()
+        if action is None:
+            return load_results(dbsession, result_type, data)
+        return data[0]
+
+    tags = [table_tag(db_name, table) for table in get_query_tables(statement)]
+    # Read before the query, so that tables changed while it runs invalidate the results
+    generations = cache.get_tag_generations(tags)
+    result = run(qs)
+    if action is None:
+        data = dump_results(result_type, result)
+    else:
+        data = (result,)
+    try:
+        cache.set(key, data, time=time, tags=tags, generations=generations)
+    except Exception as error:
+        log.warning("unable to cache query results (%s)", text_type(error))
+    return result
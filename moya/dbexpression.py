@@ -5,6 +5,7 @@ from .context import dataindex
 from .context.tools import to_expression
 from .compat import implements_to_string, text_type
 from .context.missing import is_missing
+from .context.expressioncache import ExpressionCache
 from .interface import unproxy
 
 from pyparsing import (
@@ -31,7 +32,6 @@ from sqlalchemy import and_, or_, func, not_
 
 import operator
 import re
-import threading
 
 
 def dbobject(obj):
@@ -505,8 +505,7 @@ expr << operatorPrecedence(
 
 @implements_to_string
 class DBExpression(object):
-    exp_cache = {}
-    _lock = threading.Lock()
+    exp_cache = ExpressionCache()
 
     def __init__(self, exp):
         self.exp = exp
@@ -538,17 +537,16 @@ class DBExpression(object):
     def compile(self):
         return self.compile_cache(self.exp)
 
+    @classmethod
+    def _parse(cls, exp):
+        try:
+            compiled_exp = expr.parseString(exp, parseAll=True)
+        except ParseException as e:
+            raise DBExpressionError(exp, text_type(e), col=e.col)
+        return compiled_exp[0].eval
+
     def compile_cache(self, exp):
-        with self._lock:
-            try:
-                return self.exp_cache[exp]
-            except KeyError:
-                try:
-                    compiled_exp = expr.parseString(exp, parseAll=True)
-                except ParseException as e:
-                    raise DBExpressionError(exp, text_type(e), col=e.col)
-                eval = self.exp_cache[exp] = compiled_exp[0].eval
-                return eval
+        return self.exp_cache.get(exp, self._parse)
 
 
 if __name__ == "__main__":
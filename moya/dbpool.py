@@ -0,0 +1,211 @@
+"""
+Connection pool configuration and statistics for database engines
+
+Pools are created from the `pool_*` settings in a [db:*] section. Each engine's pool
+is a subclass of the pool SQLAlchemy would use for the database, which records the
+time taken to check out a connection (including waiting for a connection to be
+returned, when the pool is exhausted).
+
+"""
+
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+from sqlalchemy import create_engine, event, exc, select
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.util.queue import Queue
+
+from . import errors
+from .cache.stats import LatencyHistogram
+from .elements.utils import attr_bool
+
+from time import time as get_time
+import logging
+
+startup_log = logging.getLogger("moya.startup")
+
+
+class PoolStats(object):
+    """Statistics for a connection pool"""
+
+    counters = ("checkouts", "connects", "invalidated", "timeouts")
+
+    def __init__(self, name, max_overflow=0):
+        self.name = name
+        self.max_overflow = max_overflow
+        self.checkout_latency = LatencyHistogram()
+        self.reset()
+
+    def reset(self):
+        for name in self.counters:
+            setattr(self, name, 0)
+        self.in_use = 0
+        self.peak = 0
+        self.checkout_latency.reset()
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+        self.in_use += 1
+        if self.in_use > self.peak:
+            self.peak = self.in_use
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        self.in_use = max(0, self.in_use - 1)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidated += 1
+
+
+class _LifoQueue(Queue):
+    """Returns the most recently used connection, so idle connections may time out"""
+
+    def _get(self):
+        return self.queue.pop()
+
+
+def make_pool_class(pool_class, stats, lifo=False):
+    """Make a pool class that records checkout times in `stats`."""
+
+    class InstrumentedPool(pool_class):
+        # Settings are class attributes, so they survive `recreate`
+        _moya_stats = stats
+        _moya_lifo = lifo
+
+        def __init__(self, *args, **kwargs):
+            super(InstrumentedPool, self).__init__(*args, **kwargs)
+            if self._moya_lifo and isinstance(self, QueuePool):
+                self._pool = _LifoQueue(self._pool.maxsize)
+
+        def _do_get(self):
+            start = get_time()
+            try:
+                return super(InstrumentedPool, self)._do_get()
+            except exc.TimeoutError:
+                self._moya_stats.timeouts += 1
+                raise
+            finally:
+                self._moya_stats.checkout_latency.record((get_time() - start) * 1000.0)
+
+    InstrumentedPool.__name__ = str(pool_class.__name__)
+    return InstrumentedPool
+
+
+def _ping_connection(connection, branch):
+    """Test a connection before it is used, reconnecting if it was disconnected."""
+    if branch:
+        return
+    should_close_with_result = connection.should_close_with_result
+    connection.should_close_with_result = False
+    try:
+        connection.scalar(select([1]))
+    except exc.DBAPIError as e:
+        # The pool is invalidated, so try again with a new connection
+        if e.connection_invalidated:
+            connection.scalar(select([1]))
+        else:
+            raise
+    finally:
+        connection.should_close_with_result = should_close_with_result
+
+
+def read_pool_settings(name, section):
+    """Read pool settings from a [db:*] section."""
+
+    def get_number(key, convert=int):
+        value = section.get(key, "").strip()
+        if not value:
+            return None
+        try:
+            return convert(value)
+        except ValueError:
+            raise errors.StartupFailedError(
+                "db '{}' setting '{}' should be a number (not '{}')".format(
+                    name, key, value
+                )
+            )
+
+    return {
+        "pool_size": get_number("pool_size"),
+        "max_overflow": get_number("pool_max_overflow"),
+        "timeout": get_number("pool_timeout", float),
+        "recycle": get_number("pool_recycle") or 3600,
+        "pre_ping": attr_bool(section.get("pool_pre_ping", "n")),
+        "lifo": attr_bool(section.get("pool_lifo", "n")),
+    }
+
+
+def create_pooled_engine(name, engine_name, echo=False, pool_settings=None):
+    """Create an SQLAlchemy engine with an instrumented pool.
+
+    Returns a tuple of the engine and its `PoolStats`.
+
+    """
+    pool_settings = pool_settings or {}
+    url = make_url(engine_name)
+    pool_class = url.get_dialect().get_pool_class(url)
+
+    kwargs = {"echo": echo, "pool_recycle": pool_settings.get("recycle", 3600)}
+    if url.drivername.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+    queue_settings = {
+        "pool_size": pool_settings.get("pool_size"),
+        "max_overflow": pool_settings.get("max_overflow"),
+        "pool_timeout": pool_settings.get("timeout"),
+    }
+    queue_settings = {k: v for k, v in queue_settings.items() if v is not None}
+    lifo = pool_settings.get("lifo", False)
+    if issubclass(pool_class, QueuePool):
+        kwargs.update(queue_settings)
+    elif queue_settings or lifo:
+        startup_log.warning(
+            "db '%s' uses %s, pool size, overflow, timeout and lifo settings are ignored",
+            name,
+            pool_class.__name__,
+        )
+
+    stats = PoolStats(name, max_overflow=queue_settings.get("max_overflow", 10))
+    kwargs["poolclass"] = make_pool_class(pool_class, stats, lifo=lifo)
+    engine = create_engine(engine_name, **kwargs)
+
+    event.listen(engine, "checkout", stats.on_checkout)
+    event.listen(engine, "checkin", stats.on_checkin)
+    event.listen(engine, "connect", stats.on_connect)
+    event.listen(engine, "invalidate", stats.on_invalidate)
+    if pool_settings.get("pre_ping", False):
+        event.listen(engine, "engine_connect", _ping_connection)
+    return engine, stats
+
+
+def get_pool_state(engine, stats):
+    """Get the current state and statistics of an engine's pool as a dict."""
+    pool = engine.pool
+    state = {
+        "name": stats.name,
+        "pool": type(pool).__name__,
+        "in_use": stats.in_use,
+        "peak": stats.peak,
+        "checkout_latency": stats.checkout_latency.to_dict(),
+    }
+    for name in stats.counters:
+        state[name] = getattr(stats, name)
+    if isinstance(pool, QueuePool):
+        checked_out = pool.checkedout()
+        state.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=checked_out,
+            overflow=max(0, pool.overflow()),
+        )
+        if stats.max_overflow >= 0:
+            # Proportion of the maximum number of connections in use
+            capacity = pool.size() + stats.max_overflow
+            state["capacity"] = capacity
+            state["saturation"] = (
+                round(float(checked_out) / capacity, 3) if capacity else 0.0
+            )
+    return state
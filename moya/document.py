@@ -5,7 +5,7 @@ from __future__ import absolute_import
 from .errors import ElementNotFoundError, ElementError
 from .context.expression import Expression
 from . import namespaces
-from .compat import text_type, implements_to_string, iteritems, pickle
+from .compat import text_type, implements_to_string, iteritems, itervalues, pickle
 
 from fs.path import dirname, join
 
@@ -78,7 +78,7 @@ class DocumentStructure(object):
         serialized = pickle.loads(doc_dump)
         structure = DocumentStructure(document, library, serialized["xml"])
         nodes = serialized["nodes"]
-        for node in nodes.itervalues():
+        for node in itervalues(nodes):
             node.structure = structure
         structure.nodes = nodes
         return structure
@@ -86,7 +86,7 @@ class DocumentStructure(object):
     @classmethod
     def quick_load(cls, document, library, xml, nodes):
         structure = DocumentStructure(document, library, xml)
-        for node in nodes.itervalues():
+        for node in itervalues(nodes):
             node.structure = structure
         structure.nodes = nodes
         return structure
@@ -446,7 +446,8 @@ class Document(object):
             do_finalize(self.root)
         self.document_finalized = True
 
-    def lib_finalize(self, context):
+    def lib_finalize(self, context, exclude=()):
+        """Call lib_finalize on elements, except for element types in `exclude`"""
         if self.lib_finalized:
             return
         ignore_errors = bool(context["._ignore_finalize_errors"])
@@ -454,6 +455,8 @@ class Document(object):
         def do_finalize(element):
             for child in element._children:
                 do_finalize(child)
+            if element._element_type in exclude:
+                return
             try:
                 element.lib_finalize(context)
             except:
@@ -370,6 +370,11 @@ class ElementBaseType(object):
     element_class = "default"
     xmlns = "http://moyaproject.com"
     preserve_attributes = []
+    # Set on a class if the build hooks it defines (post_build, finalize,
+    # document_finalize and lib_finalize) may run again when its document is rebuilt
+    # in place, i.e. they don't register anything outside of the element
+    rebuild_in_place = True
+    _build_hooks = ("post_build", "finalize", "document_finalize", "lib_finalize")
 
     class Meta:
         logic_skip = False
@@ -415,6 +420,17 @@ class ElementBaseType(object):
     def priority(self):
         return self.lib.priority
 
+    @classmethod
+    def can_rebuild_in_place(cls):
+        """Check if elements of this type may be rebuilt in place"""
+        for hook in cls._build_hooks:
+            for base in cls.__mro__:
+                if hook in base.__dict__:
+                    if not base.__dict__.get("rebuild_in_place", False):
+                        return False
+                    break
+        return True
+
     @classmethod
     def extract_doc_info(cls):
         """Extract information to document this tag"""
@@ -248,12 +248,49 @@ class Library(object):
 
         return import_count
 
-    def finalize(self, ignore_errors=False):
-        if self.finalized:
-            return
+    def get_document(self, location):
+        """Get a document from its location, or None if it isn't in this library"""
+        for document in self.documents:
+            if getattr(document, "location", None) == location:
+                return document
+        return None
+
+    def remove_document(self, document):
+        """Remove a document, and the elements it registered"""
+        self.documents.remove(document)
+        element_ids = set()
+        for element in document.elements.values():
+            element_ids.add(id(element))
+            if self.elements_by_name.get(element.libname) is element:
+                del self.elements_by_name[element.libname]
+        for elements in self.elements_by_type.values():
+            elements[:] = [
+                element for element in elements if id(element) not in element_ids
+            ]
+
+    def sort_elements(self):
+        """Sort elements of each type in to the order of their documents"""
+        document_order = {
+            id(document): index for index, document in enumerate(self.documents)
+        }
+
+        def get_order(element):
+            return document_order.get(id(element.document), -1)
+
+        for elements in self.elements_by_type.values():
+            elements.sort(key=get_order)
+
+    def get_finalize_context(self, ignore_errors=False):
+        """Get the context used to finalize documents"""
         context = Context({"_ignore_finalize_errors": ignore_errors})
         context.root["_lib_long_name"] = self.long_name
         context.root["lib"] = self
+        return context
+
+    def finalize(self, ignore_errors=False):
+        if self.finalized:
+            return
+        context = self.get_finalize_context(ignore_errors=ignore_errors)
         for doc in self.documents:
             doc.document_finalize(context)
         for doc in self.documents:
@@ -12,15 +12,15 @@ import logging
 
 from . import errors
 from . import tags
-from .tools import datetime_to_epoch
+from . import __version__
 from .document import Document, DocumentStructure, DocumentNode, DocumentTextNode
 from . import namespaces
 from .containers import OrderedDict
 from .cache.dictcache import DictCache
-from .compat import text_type, string_types, binary_type
+from .compat import text_type, string_types, binary_type, itervalues
 
 from fs.path import abspath
-from fs.errors import NoSysPath
+from fs.errors import FSError, NoSysPath
 
 _re_xml_namespace = re.compile(r"^(?:\{(.*?)\})*(.*)$", re.UNICODE)
 
@@ -28,6 +28,9 @@ _re_xml_namespace = re.compile(r"^(?:\{(.*?)\})*(.*)$", re.UNICODE)
 element_fromstring = etree.fromstring
 log = logging.getLogger("moya.startup")
 
+# Update for backwards incompatible changes to the document structure
+DOCUMENT_CACHE_VERSION = 1
+
 
 def extract_namespace(tag_name, _cache={}):
     """Extracts namespace and tag name in Clark's notation"""
@@ -62,6 +65,48 @@ class Parser(object):
             self.location = syspath
         self._xml = None
 
+    def get_cache_key(self):
+        """Get a key for this version of the document, or None if it can't be cached."""
+        try:
+            info = self.fs.getdetails(self.path)
+        except FSError:
+            return None
+        # The raw time (a float), so changes within the same second make a new key
+        modified = info.get("details", "modified")
+        if modified is None:
+            return None
+        if self.library is None:
+            lib = ""
+        else:
+            lib = "{}=={}".format(self.library.long_name, self.library.version)
+        return "document.{}.{}${}${}@{}:{}".format(
+            DOCUMENT_CACHE_VERSION,
+            __version__,
+            lib,
+            self.location,
+            repr(modified),
+            info.size,
+        )
+
+    def load_cached(self, document, cache_key):
+        """Load a previously parsed structure, return True if it was in the cache."""
+        cached_structure = self.cache.get(cache_key, None)
+        if cached_structure is None:
+            return False
+        try:
+            structure = DocumentStructure.load(
+                cached_structure, document, self.library
+            )
+        except Exception:
+            log.debug("unable to load cached document '%s'", self.location)
+            return False
+        add_namespace = self.archive.known_namespaces.add
+        for node in itervalues(structure.nodes):
+            if not node.text_node:
+                add_namespace(node.xmlns)
+        document.structure = structure
+        return True
+
     @property
     def xml(self):
         if self._xml is None:
@@ -82,17 +127,14 @@ class Parser(object):
         document.location = location
         default_namespace = namespaces.default
 
-        # The parser cache is disable because it only speeds up startup by around 6%
-        # Not quite ready to give up the idea and delete this code just yet - WM 11/11/2015
-
-        # if self.cache.enabled:
-        #     mtime = datetime_to_epoch(self.fs.getinfokeys(self.path, 'modified_time')['modified_time'])
-        #     cache_key = "{}.{}".format(self.fs, self.path, mtime)
-        #     cached_structure = self.cache.get(cache_key, None)
-        #     if cached_structure is not None:
-        #         document.structure = DocumentStructure.load(cached_structure, document, self.library)
-        #         self.built = False
-        #         return document
+        # Documents are cached by path and modified time, so editing a file only
+        # invalidates its own document
+        cache_key = None
+        if self.cache.enabled:
+            cache_key = self.get_cache_key()
+            if cache_key is not None and self.load_cached(document, cache_key):
+                self.built = False
+                return document
 
         xml = self.xml
         if xml.isspace() or not xml:
@@ -174,8 +216,8 @@ class Parser(object):
             stack.extend((child, doc_node.doc_id) for child in reversed(node))
         self.built = False
 
-        # if self.cache.enabled:
-        #     self.cache.set(cache_key, structure.dumps())
+        if cache_key is not None:
+            self.cache.set(cache_key, structure.dumps())
 
         return document
 
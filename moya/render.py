@@ -66,6 +66,15 @@ def render_object(obj, archive, context, target, options=None):
     return rendered
 
 
+def iter_render_object(obj, archive, context, target, options=None):
+    """Render an object in chunks, objects that can't be streamed are a single chunk"""
+    if hasattr(obj, "moya_render_iter") and target in getattr(
+        obj, "moya_render_targets", [target]
+    ):
+        return obj.moya_render_iter(archive, context, target, options or {})
+    return iter([render_object(obj, archive, context, target, options=options)])
+
+
 def render_objects(objects, archive, context, target, options=None, join="\n"):
     """Renders a sequence of objects and concatenates them together with carriage returns"""
     return HTML(
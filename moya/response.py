@@ -1,9 +1,96 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
+from .compat import text_type
+
 from webob import Response
 
+from contextlib import contextmanager
+import logging
+
+log = logging.getLogger("moya.runtime")
+
 
 class MoyaResponse(Response):
     def __repr__(self):
         return "<moyaresponse {}>".format(self.status)
+
+
+class ResponseStream(object):
+    """A response body which is generated while it is sent.
+
+    Text chunks are encoded as they are generated. Callbacks registered with
+    `on_close` are called when the server closes the response, so that anything
+    required to render the body (the context, database sessions) may be kept
+    until then. A context manager registered with `manage` is entered while each
+    chunk is generated (e.g. to make the request current again).
+
+    """
+
+    def __init__(self, chunks, charset="utf-8"):
+        self.chunks = chunks
+        self.charset = charset
+        self.closed = False
+        self._callbacks = []
+        self._manager = None
+
+    def __repr__(self):
+        return "<responsestream>"
+
+    @contextmanager
+    def _managed(self):
+        if self._manager is None:
+            yield
+        else:
+            manager, args = self._manager
+            with manager(*args):
+                yield
+
+    def __iter__(self):
+        charset = self.charset
+        chunks = iter(self.chunks)
+        try:
+            while 1:
+                # The server may iterate after the request was handled, or in another thread
+                with self._managed():
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                if isinstance(chunk, text_type):
+                    chunk = chunk.encode(charset)
+                if chunk:
+                    yield chunk
+        except Exception:
+            # Headers have been sent, all we can do is truncate the response
+            log.exception("error streaming response")
+            raise
+
+    def manage(self, manager, *args):
+        """Generate each chunk in the context manager returned by `manager(*args)`."""
+        self._manager = (manager, args)
+
+    def on_close(self, callback, *args):
+        """Call `callback(*args)` when the response is closed."""
+        self._callbacks.append((callback, args))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            close = getattr(self.chunks, "close", None)
+            if close is not None:
+                with self._managed():
+                    close()
+        finally:
+            for callback, args in self._callbacks:
+                try:
+                    callback(*args)
+                except Exception:
+                    log.exception("error closing response stream")
+            del self._callbacks[:]
+
+
+def is_streaming(response):
+    """Check if a response has a streamed body."""
+    return isinstance(getattr(response, "app_iter", None), ResponseStream)
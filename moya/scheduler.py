@@ -1,6 +1,8 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
+from .compat import number_types
+
 from threading import Thread, RLock, Event
 from datetime import datetime, timedelta
 
@@ -112,7 +114,7 @@ class Scheduler(Thread):
 
     def add_repeat_task(self, name, callable, repeat):
         """Add a task to be invoked every `repeat` seconds"""
-        if isinstance(repeat, (int, long, float)):
+        if isinstance(repeat, number_types):
             repeat = timedelta(seconds=repeat)
         run_time = datetime.utcnow() + repeat
         task = Task(name, callable, run_time=run_time, repeat=repeat)
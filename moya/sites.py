@@ -2,7 +2,8 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 from .interface import AttributeExposer
-from .compat import iteritems, implements_to_string, text_type
+from .compat import iteritems, implements_to_string, text_type, string_types
+from .containers import LRUCache
 from .settings import SettingsContainer
 from .context.expression import Expression
 
@@ -155,6 +156,13 @@ class SiteInstance(AttributeExposer):
     def __repr__(self):
         return "Site('{}')".format(self._site.domain)
 
+    def copy(self):
+        """Copy the instance, with its own copy of the (mutable) custom data"""
+        site_instance = self.__class__.__new__(self.__class__)
+        site_instance.__dict__.update(self.__dict__)
+        site_instance._data = self._data.copy()
+        return site_instance
+
     def __moyarepr__(self, context):
         return """<site '{}'>""".format(self._site.domain)
 
@@ -178,7 +186,7 @@ class Site(object):
         if site_data is None:
             site_data = {}
         if custom_data is None:
-            custom_data = None
+            custom_data = {}
 
         if "priority" in site_data:
             _priority = site_data["priority"]
@@ -205,9 +213,18 @@ class Site(object):
                 for v in custom_data.values():
                     Expression.extract(v)
 
+        # Keys with values that need substituting for each request
+        self.dynamic_site_keys = self._get_dynamic_keys(site_data)
+        self.dynamic_custom_keys = self._get_dynamic_keys(custom_data)
+
+        # True if the domain has no wildcards
+        self.exact = True
+
         tokens = []
         for token in self._re_domain.split(domain):
             if token:
+                if token == "*" or self._re_named_match(token):
+                    self.exact = False
                 if self._re_named_match(token):
                     name = token[1:-1]
                     if name.startswith("*"):
@@ -240,6 +257,18 @@ class Site(object):
             self.domain, context.to_expr(self.site_data)
         )
 
+    @classmethod
+    def _get_dynamic_keys(cls, data):
+        if not data:
+            return ()
+        return tuple(
+            sorted(
+                k
+                for k, v in data.items()
+                if not isinstance(v, string_types) or "${" in v
+            )
+        )
+
     def match(self, domain):
         match = self._match(domain)
         if match is None:
@@ -270,10 +299,14 @@ class Sites(object):
         ("theme", "default"),
     ]
 
-    def __init__(self):
+    def __init__(self, cache_size=1000):
         self._defaults = {}
         self._sites = []
         self._order = 0
+        self._exact_sites = {}
+        self._wildcard_sites = []
+        self._indexed = False
+        self._instances = LRUCache(cache_size)
 
     def __repr__(self):
         return repr(self._sites)
@@ -281,9 +314,30 @@ class Sites(object):
     def clear(self):
         """Clear all site information"""
         del self._sites[:]
+        self._invalidate()
+
+    def _invalidate(self):
+        self._indexed = False
+        self._instances.clear()
+
+    def get_cache_stats(self):
+        """Get statistics for the cache of site instances"""
+        return self._instances.get_stats()
+
+    def _index(self, _order_key=attrgetter("order")):
+        """Sort sites and index the domains without wildcards"""
+        sites = sorted(self._sites, key=_order_key, reverse=True)
+        exact_sites = {}
+        for site in sites:
+            if site.exact:
+                exact_sites.setdefault(site.domain, site)
+        self._exact_sites = exact_sites
+        self._wildcard_sites = [site for site in sites if not site.exact]
+        self._indexed = True
 
     def set_defaults(self, section):
         self._defaults = {k: section.get(k, default) for k, default in self._site_keys}
+        self._invalidate()
 
     def add_from_section(self, domains, section):
         """Add a site from a named section in settings"""
@@ -303,6 +357,7 @@ class Sites(object):
             )
             self._order += 1
             self._sites.append(site)
+        self._invalidate()
 
     def add(self, domains, **data):
         if isinstance(domains, text_type):
@@ -312,13 +367,21 @@ class Sites(object):
             site = Site(domain, self._order, custom_data=data)
             self._order += 1
             self._sites.append(site)
-
-    def _match(self, domain, _order_key=attrgetter("order")):
-        self._sites.sort(key=_order_key, reverse=True)
-        for site in self._sites:
+        self._invalidate()
+
+    def _match(self, domain):
+        if not self._indexed:
+            self._index()
+        exact_site = self._exact_sites.get(domain, None)
+        for site in self._wildcard_sites:
+            if exact_site is not None and exact_site.order > site.order:
+                break
             site_data, custom_data = site.match(domain)
             if site_data is not None:
                 return SiteMatch(site, site_data, custom_data)
+        if exact_site is not None:
+            site_data, custom_data = exact_site.match(domain)
+            return SiteMatch(exact_site, site_data, custom_data)
         return None
 
     def match(self, domain, context=None):
@@ -328,15 +391,33 @@ class Sites(object):
         site, site_data, custom_data = site_match
         if context is None:
             return custom_data
-        sub = context.sub
 
-        # TODO: This takes ~0.5ms May be optimzable
-        with context.data_frame(site_data):
-            new_site_data = {k: sub(v) for k, v in site_data.items()}
-        with context.data_frame(custom_data):
-            new_custom_data = {k: sub(v) for k, v in custom_data.items()}
-
-        return SiteInstance(site, new_site_data, new_custom_data)
+        # Only values containing substitutions need to be evaluated per request, the
+        # site instance is cached for requests where those values are the same (and
+        # copied, as requests may modify the site data)
+        dynamic_values = self._sub_dynamic(
+            context, site_data, site.dynamic_site_keys
+        ) + self._sub_dynamic(context, custom_data, site.dynamic_custom_keys)
+
+        instance_key = (site, domain, dynamic_values)
+        site_instance = self._instances.get(instance_key, None)
+        if site_instance is None:
+            new_site_data = site_data.copy()
+            new_site_data.update(dynamic_values[: len(site.dynamic_site_keys)])
+            new_custom_data = custom_data.copy()
+            new_custom_data.update(dynamic_values[len(site.dynamic_site_keys) :])
+            site_instance = SiteInstance(site, new_site_data, new_custom_data)
+            self._instances[instance_key] = site_instance
+        return site_instance.copy()
+
+    @classmethod
+    def _sub_dynamic(cls, context, data, keys):
+        """Substitute values in data, return a tuple of (<key>, <value>)"""
+        if not keys:
+            return ()
+        sub = context.sub
+        with context.data_frame(data):
+            return tuple((k, sub(data[k])) for k in keys)
 
     def __contains__(self, domain):
         return self.match(domain) is not None
@@ -0,0 +1,53 @@
+"""
+Base for compilers that generate Python source
+
+Used by the expression compiler (`moya.context.expressioncompiler`) and the template
+compiler (`moya.template.compiler`). Objects referenced by the generated source are
+bound to names in a namespace, which is passed to a factory function defined in the
+source, so the compiled code doesn't need to look anything up at runtime.
+
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+import logging
+
+
+log = logging.getLogger("moya.runtime")
+
+
+class SourceCompiler(object):
+    """Binds objects to names, and compiles the generated source."""
+
+    def __init__(self):
+        self.namespace = {}
+        self._names = {}
+
+    def bind(self, obj, prefix="_v"):
+        """Make an object available to the compiled code, and return its name."""
+        key = (prefix, id(obj))
+        try:
+            return self._names[key]
+        except KeyError:
+            name = self._names[key] = "{}{}".format(prefix, len(self.namespace))
+            self.namespace[name] = obj
+            return name
+
+    def exec_source(self, source, filename, factory, flags=0):
+        """Compile source, and return the result of calling `factory` with the namespace."""
+        code = compile(source, filename, "exec", flags, True)
+        scope = {}
+        exec(code, scope)
+        return scope[factory](**self.namespace)
+
+
+def compile_or_none(compile_function, description, logger=log):
+    """Call `compile_function`, or return None if it fails."""
+    try:
+        return compile_function()
+    except Exception:
+        # Deeply nested source may exceed the limits of the Python compiler, callers
+        # should fall back to interpreting
+        logger.debug("unable to compile %s", description, exc_info=True)
+        return None
@@ -86,6 +86,8 @@ Hello, World!
     class Meta:
         logic_skip = True
 
+    rebuild_in_place = True
+
     def document_finalize(self, context):
         self._synopsis = self.synopsis(context)
         self._doc = None
@@ -458,6 +458,8 @@ class Choices(ElementBase):
             <get-choices choices="#choices.markup" dst="choices" />
         """
 
+    rebuild_in_place = True
+
     def finalize(self, context):
         self.choices = choices = []
         append = choices.append
@@ -643,7 +645,11 @@ class Handle(LogicElement):
         default=None,
     )
 
-    def lib_finalize(self, context):
+    # Handlers are added again when a document is rebuilt in place
+    rebuild_in_place = True
+
+    def get_handlers(self, context):
+        """Get a list of (<signal name>, <element ref>, <sender>) for this handler"""
         sender, signals = self.get_parameters(context, "sender", "signal")
         senders = []
         if sender:
@@ -651,12 +657,18 @@ class Handle(LogicElement):
                 sender = self.document.qualify_element_ref(_sender, lib=self.lib)
                 app, element = self.get_element(sender)
                 senders.append(element.libid)
+        handlers = []
         for signal in signals:
             if senders:
                 for sender in senders:
-                    self.archive.signals.add_handler(signal, self.libid, sender)
+                    handlers.append((signal, self.libid, sender))
             else:
-                self.archive.signals.add_handler(signal, self.libid, None)
+                handlers.append((signal, self.libid, None))
+        return handlers
+
+    def lib_finalize(self, context):
+        for signal, element_ref, sender in self.get_handlers(context):
+            self.archive.signals.add_handler(signal, element_ref, sender)
 
 
 class Fire(LogicElement):
@@ -271,6 +271,8 @@ class ContentElement(ContextElementBase):
         #     print (repr(app), repr(node), node.template)
         return chain
 
+    rebuild_in_place = True
+
     def post_build(self, context):
         # self.template = self.template(context)
         self.extends = self.extends(context)
@@ -560,6 +562,18 @@ class ServeContent(LogicElement, ContentElementMixin):
     withscope = Attribute("Use current scope?", default=False, type="boolean")
     template = Attribute("Template", required=False, default=None)
     status = Attribute("Status code", type="httpstatus", required=False, default=200)
+    stream = Attribute(
+        "Send the response while the content is rendering?",
+        type="boolean",
+        required=False,
+        default=False,
+    )
+    chunk_size = Attribute(
+        "Size of streamed chunks (in characters)",
+        type="integer",
+        required=False,
+        default=None,
+    )
 
     class Meta:
         is_call = True
@@ -594,6 +608,8 @@ class ServeContent(LogicElement, ContentElementMixin):
 
         content_obj = context["_content"]
         content_obj.http_status = self.status(context)
+        content_obj.stream = self.stream(context)
+        content_obj.stream_chunk_size = self.chunk_size(context)
         raise logic.EndLogic(content_obj)
 
 
@@ -872,6 +888,8 @@ class Template(RenderBase):
         "Markup", required=False, default="html", choices=get_installed_markups
     )
 
+    rebuild_in_place = True
+
     def finalize(self, context):
         self.template = MoyaTemplate(self.text, self._location)
 
@@ -7,10 +7,13 @@ from ..context import Context, Expression
 from ..context.expressiontime import ExpressionDateTime, TimeSpan
 from ..context import dataindex
 from ..context.errors import ContextKeyError
+from ..context.missing import is_missing
 from ..containers import OrderedDict
 from ..render import render_object
 from ..progress import Progress
-from ..tools import make_cache_key
+from ..tools import make_cache_key, make_cache_tags
+from ..cache.prefetch import CacheKeys, get_prefetched
+from ..cache.stampede import CacheFill
 from .. import namespaces
 from ..logic import (
     DeferNodeContents,
@@ -514,6 +517,8 @@ class LetStr(DataSetter):
     _reserved_attribute_names = ["if"]
     preserve_attributes = ["expressions"]
 
+    rebuild_in_place = True
+
     def post_build(self, context):
         self.expressions = []
         append = self.expressions.append
@@ -2370,6 +2375,8 @@ class Macro(ContextElementBase):
         </macro>
         """
 
+    rebuild_in_place = True
+
     def lib_finalize(self, context):
         for signature in self.children("signature"):
             self.validator = signature.validator
@@ -2640,11 +2647,25 @@ class CacheReturn(ContextElementBase):
     local = Attribute(
         "Should the value be cached for this tag only?", type="boolean", default=True
     )
+    stale = Attribute(
+        "Time to return an expired value for, while it is recalculated",
+        required=False,
+        default=0,
+        type="timespan",
+    )
+    tags = Attribute(
+        "Cache tags, used to invalidate the value with [tag]invalidate-cache[/tag]",
+        type="expression",
+        required=False,
+        default=None,
+    )
 
     class Meta:
         is_call = True
         one_of = [("key", "keydata")]
 
+    _cache_keys = None
+
     def logic(self, context):
         (
             cache_name,
@@ -2652,24 +2673,51 @@ class CacheReturn(ContextElementBase):
             cache_key,
             cache_key_data,
             cache_local,
-        ) = self.get_parameters(context, "cache", "for", "key", "keydata", "local")
+            cache_stale,
+            cache_tags,
+        ) = self.get_parameters(
+            context, "cache", "for", "key", "keydata", "local", "stale", "tags"
+        )
         if cache_key is None:
             cache_key = make_cache_key(cache_key_data)
         if cache_local:
             cache_key = "{}--{}".format(self.libid, cache_key)
 
         cache = self.archive.get_cache(cache_name)
-        cache_result = cache.get(cache_key, Ellipsis)
+        # Read keys used in previous calls, the first time this tag runs in a request
+        if self._cache_keys is None:
+            self._cache_keys = CacheKeys()
+        else:
+            prefetched_elements = context.root.setdefault(
+                "_cache_prefetched_elements", set()
+            )
+            if self.libid not in prefetched_elements:
+                prefetched_elements.add(self.libid)
+                self._cache_keys.prefetch(context, self.archive.get_cache)
+        self._cache_keys.add(cache_name, cache_key)
+        fill = CacheFill(
+            cache,
+            cache_key,
+            time=int(cache_time),
+            stale=int(cache_stale),
+            read=lambda: get_prefetched(context, cache_name, cache, cache_key),
+            tags=make_cache_tags(cache_tags),
+        )
+        cache_result = fill.get(Ellipsis)
         if cache_result is Ellipsis:
             call = context.get(".call", {})
-            yield DeferNodeContents(self)
+            try:
+                yield DeferNodeContents(self)
+            except:
+                fill.release()
+                raise
             if "_return" in call:
                 value = _return = call["_return"]
                 if hasattr(_return, "get_return_value"):
                     value = _return.get_return_value()
             else:
                 value = None
-            cache.set(cache_key, value, time=int(cache_time))
+            fill.set(value)
             context["_return"] = ReturnContainer(value=value)
             raise Unwind()
 
@@ -2678,6 +2726,124 @@ class CacheReturn(ContextElementBase):
             raise Unwind()
 
 
+class InvalidateCache(ContextElementBase):
+    """
+    Invalidate cached values by tag.
+
+    Values cached with [tag]cache-return[/tag] or the [c]{% cache %}[/c] template tag may be given a list of [i]tags[/i]. This tag invalidates every value stored with any of the given tags, so that it will be re-calculated the next time it is needed.
+
+    For example, the following caches a blog post in a template:
+
+    [code moyatemplate]
+    {% cache for 1d key post.id tags ['post-' + post.id, 'posts'] %}
+    <div class="post">${post.text}</div>
+    {% endcache %}
+    [/code]
+
+    When the post is edited, the following will invalidate the cached html for that post:
+
+    [code xml]
+    <invalidate-cache tags="['post-' + post.id]"/>
+    [/code]
+
+    """
+
+    class Help:
+        synopsis = "invalidate cached values with tags"
+
+    cache = Attribute(
+        "Cache name(s)",
+        type="commalist",
+        required=False,
+        default="fragment,runtime",
+        evaldefault=True,
+    )
+    tags = Attribute("Tag or list of tags", type="expression", required=True)
+
+    def logic(self, context):
+        cache_names, tags = self.get_parameters(context, "cache", "tags")
+        tags = make_cache_tags(tags)
+        if not tags:
+            return
+        for cache_name in cache_names:
+            self.archive.get_cache(cache_name).invalidate_tags(tags)
+
+
+class GetCacheStats(DataSetterBase):
+    """
+    Get statistics for caches.
+
+    Sets [c]dst[/c] to a dict that maps cache names on to their statistics; hit and miss counts, hit ratio, bytes read and written, evictions, get and set latency, and an estimate of the most frequently read keys ([i]hot_keys[/i]).
+
+    [code xml]
+    <get-cache-stats cache="fragment" dst="stats"/>
+    <echo>Hit ratio: ${stats.fragment.hit_ratio}</echo>
+    [/code]
+
+    """
+
+    class Help:
+        synopsis = "get cache statistics"
+
+    cache = Attribute(
+        "Cache name(s), or omit for all caches", type="commalist", required=False
+    )
+    top = Attribute("Number of hot keys to return", type="integer", default=10)
+    reset = Attribute(
+        "Reset statistics after reading them?", type="boolean", default=False
+    )
+
+    def logic(self, context):
+        cache_names, top, reset = self.get_parameters(context, "cache", "top", "reset")
+        caches = sorted(self.archive.caches.items())
+        cache_names = [cache_name for cache_name in cache_names or [] if cache_name]
+        if cache_names:
+            # Caches that haven't been used yet are not created
+            caches = [cache for cache in caches if cache[0] in cache_names]
+        stats = OrderedDict()
+        for cache_name, cache in caches:
+            if cache.enabled and hasattr(cache, "get_stats"):
+                stats[cache_name] = cache.get_stats(top=top)
+                if reset:
+                    cache.reset_stats()
+        self.set_context(context, self.dst(context), stats)
+
+
+class GetLRUStats(DataSetterBase):
+    """
+    Get statistics for the in-memory caches that Moya uses internally.
+
+    Sets [c]dst[/c] to a dict with the size, hit and miss counts, hit ratio, evictions and expired items for the cache of matched URL routes ([i]routes[/i]), signal handlers ([i]signals[/i]), site instances ([i]sites[/i]), and template libraries ([i]template_libs[/i]).
+
+    [code xml]
+    <get-lru-stats dst="stats"/>
+    <echo>Route hit ratio: ${stats.routes.hit_ratio}</echo>
+    [/code]
+
+    """
+
+    class Meta:
+        tag_name = "get-lru-stats"
+
+    class Help:
+        synopsis = "get statistics for internal caches"
+
+    server = Attribute(
+        "Server containing URL routes",
+        type="expression",
+        default=".server",
+        evaldefault=True,
+    )
+
+    def logic(self, context):
+        server = self.server(context)
+        if is_missing(server):
+            # Not serving a request, so there are no routes
+            server = None
+        stats = self.archive.get_lru_stats(server=server)
+        self.set_context(context, self.dst(context), stats)
+
+
 class Done(ContextElementBase):
     """Exists the current callable immediately with no return value. Note, this is not equivalent to [tag]return[/tag] which returns [c]None[/c]."""
 
@@ -6,6 +6,7 @@ from ..elements.elementbase import ElementBase, Attribute
 from .. import logic
 from .. import errors
 from ..db import wrap_db_errors, dbobject
+from ..dbcache import query_cached
 from .. import interface
 from ..context import Context
 from ..logic import DeferNodeContents, SkipNext
@@ -52,7 +53,14 @@ from sqlalchemy import (
 )
 
 from sqlalchemy.sql import text
-from sqlalchemy.orm import mapper, relationship, backref
+from sqlalchemy.orm import (
+    mapper,
+    relationship,
+    backref,
+    class_mapper,
+    joinedload,
+    subqueryload,
+)
 from sqlalchemy.orm.exc import (
     NoResultFound,
     MultipleResultsFound,
@@ -122,6 +130,12 @@ class DBMixin(object):
         else:
             return session
 
+    def get_query_cache_time(self, params):
+        """Get the time to cache query results for, or None if they shouldn't be cached."""
+        if params.forupdate or not (params.cache or params.cachefor is not None):
+            return None
+        return int(params.cachefor or 0)
+
 
 @implements_bool
 class MoyaQuerySet(interface.AttributeExposer):
@@ -219,6 +233,47 @@ class MoyaQuerySet(interface.AttributeExposer):
             raise TypeError("Can only add query sets to query sets")
 
 
+@implements_bool
+class CachedQuerySet(MoyaQuerySet):
+    """A query set with results from the query cache"""
+
+    def __init__(self, qs, table_class, session, results):
+        super(CachedQuerySet, self).__init__(qs, table_class, session)
+        self._results = results
+        self._count = len(results)
+
+    def __repr__(self):
+        return "{} (cached)>".format(super(CachedQuerySet, self).__repr__()[:-1])
+
+    def __iter__(self):
+        return iter(self._results)
+
+    def slice(self, start, stop, step=None):
+        qs = super(CachedQuerySet, self).slice(start, stop, step)
+        return CachedQuerySet(
+            qs._qs, self.table_class, self.dbsession, self._results[start:stop]
+        )
+
+    def __bool__(self):
+        return bool(self._results)
+
+    @property
+    def first(self):
+        return self._results[0] if self._results else None
+
+    @property
+    def last(self):
+        return self._results[-1] if self._results else None
+
+    @property
+    def list(self):
+        return list(self._results)
+
+    @property
+    def exists(self):
+        return bool(self._results)
+
+
 class DBElement(ElementBase):
     xmlns = namespaces.db
 
@@ -1914,6 +1969,8 @@ class GetOrCreate(DBDataSetter):
         dst = params.dst
         let_map = self.get_let_map(context, check_missing=True)
         query = Get._get_attributes_query(self, context, table_class, let_map)
+        # Read from the primary, since the object may be created
+        dbsession.use_primary()
         qs = dbsession.query(table_class).filter(*query)
         if params.forupdate:
             qs = qs.with_for_update()
@@ -2131,6 +2188,21 @@ class Get(DBDataSetter):
     forupdate = Attribute(
         "Issue a select FOR UPDATE?", type="boolean", required=False, default=False
     )
+    cache = Attribute(
+        "Cache the result in the query cache (until the table changes)?",
+        type="boolean",
+        required=False,
+        default=False,
+    )
+    cachefor = Attribute(
+        "Time to cache the result for (implies cache)",
+        type="timespan",
+        required=False,
+        default=None,
+    )
+
+    # Number of rows to fetch when the result is cached
+    cache_limit = 1
 
     @classmethod
     def _get_attributes_query(cls, element, context, table_class, let_map):
@@ -2202,6 +2274,7 @@ For example **let:{k}="name or 'anonymous'"**
             qs = dbsession.query(table_class).filter(*query)
 
         if params.forupdate:
+            dbsession.use_primary()
             qs = qs.with_for_update()
 
         if filter is not None:
@@ -2213,7 +2286,12 @@ For example **let:{k}="name or 'anonymous'"**
                 self, qs, self.archive, context, table_class, params.orderby, app=app
             )
 
-        value = self.get_value(context, qs)
+        cache_time = self.get_query_cache_time(params)
+        if cache_time is None:
+            value = self.get_value(context, qs)
+        else:
+            results = query_cached(dbsession, qs.limit(self.cache_limit), cache_time)
+            value = self.get_cached_value(context, results)
         self.check_value(context, value)
 
         self.set_context(context, self.dst(context), value)
@@ -2227,6 +2305,9 @@ For example **let:{k}="name or 'anonymous'"**
         except Exception as error:
             self.throw("db.error", "failed to query database; {}".format(error))
 
+    def get_cached_value(self, context, results):
+        return results[0] if results else None
+
     def check_value(self, context, value):
         pass
 
@@ -2241,6 +2322,9 @@ class GetOne(Get):
         synopsis = "get precisely one matching object"
         example = None
 
+    # Fetch two rows, to detect multiple results
+    cache_limit = 2
+
     def get_value(self, context, qs):
         try:
             result = qs.one()
@@ -2251,6 +2335,13 @@ class GetOne(Get):
         else:
             return result
 
+    def get_cached_value(self, context, results):
+        if not results:
+            self.throw("db.no-result", "there was no matching result")
+        if len(results) > 1:
+            self.throw("db.multiple-results", "multiple objects were returned")
+        return results[0]
+
 
 class IfExists(ContextElementBase, DBMixin):
     """Execute the enclosed block if a object exists in the db."""
@@ -2444,6 +2535,40 @@ class Inspect(DBDataSetter):
         self.set_context(context, params.dst, model_proxy)
 
 
+class GetPoolStats(DBDataSetter):
+    """
+    Get the state of database connection pools.
+
+    Sets [c]dst[/c] to a dict that maps pool names (the db name, or [c]<db>:replica<n>[/c] for replicas) on to the current state of the pool (connections checked in and out, overflow and saturation), and statistics (checkouts, new connections, timeouts and checkout latency).
+
+    """
+
+    class Help:
+        synopsis = """get database pool statistics"""
+        example = """
+            <db:get-pool-stats dst="pools" />
+        """
+
+    xmlns = namespaces.db
+
+    db = Attribute("Database, or omit for all databases", required=False, default=None)
+
+    def logic(self, context):
+        params = self.get_parameters(context)
+        engines = self.archive.database_engines
+        if params.db:
+            if params.db not in engines:
+                self.throw(
+                    "db.no-db", "no database called '{}'".format(params.db)
+                )
+            engines = {params.db: engines[params.db]}
+        pools = OrderedDict()
+        for _name, engine in sorted(engines.items()):
+            for state in engine.get_pool_state():
+                pools[state["name"]] = state
+        self.set_context(context, params.dst, pools)
+
+
 class GetDefaults(DataSetter):
     xmlns = namespaces.db
 
@@ -2705,6 +2830,58 @@ class Query(DBDataSetter):
     forupdate = Attribute(
         "Issue a select FOR UPDATE?", type="boolean", required=False, default=False
     )
+    cache = Attribute(
+        "Cache the results in the query cache (until the table changes)?",
+        type="boolean",
+        required=False,
+        default=False,
+    )
+    cachefor = Attribute(
+        "Time to cache the results for (implies cache)",
+        type="timespan",
+        required=False,
+        default=None,
+    )
+    prefetch = Attribute(
+        "Relationships to load with one additional query each (e.g. \"author, tags, comments.author\")",
+        type="commalist",
+        required=False,
+        default=None,
+    )
+    joinload = Attribute(
+        "Relationships to load in the same query, with a join",
+        type="commalist",
+        required=False,
+        default=None,
+    )
+
+    def _get_load_options(self, table_class, paths, loader):
+        """Get loader options for a list of relationship paths."""
+        options = []
+        for path in paths:
+            path = path.strip()
+            if not path:
+                continue
+            mapper = class_mapper(table_class)
+            option = None
+            for key in path.split("."):
+                prop = mapper.relationships.get(key, None)
+                if prop is None:
+                    self.throw(
+                        "db.bad-relationship",
+                        "'{}' is not a relationship of {}".format(
+                            key, mapper.class_._model
+                        ),
+                        diagnosis="Relationships are created by foreign-key, one-to-one, relationship and many-to-many fields (and backrefs).",
+                    )
+                attribute = getattr(mapper.class_, key)
+                if option is None:
+                    option = loader(attribute)
+                else:
+                    option = getattr(option, loader.__name__)(attribute)
+                mapper = prop.mapper
+            options.append(option)
+        return options
 
     @classmethod
     def _get_order(
@@ -2824,6 +3001,7 @@ class Query(DBDataSetter):
                 qs = dbsession.query()
 
         if params.forupdate:
+            dbsession.use_primary()
             qs = qs.with_for_update()
 
         if params.columns is not None:
@@ -2899,6 +3077,29 @@ class Query(DBDataSetter):
                     diagnosis="Specfiy the 'model' or use the 'filter' attribute",
                 )
 
+        if params.prefetch or params.joinload:
+            if table_class is None:
+                self.throw(
+                    "bad-value.model-required",
+                    "Moya can't load relationships without a model",
+                    diagnosis="Specify the 'model' attribute to use 'prefetch' or 'joinload'",
+                )
+            if self.get_query_cache_time(params) is not None and params.action not in (
+                "count",
+                "exists",
+            ):
+                # Cached results are stored without their relationships
+                self.throw(
+                    "bad-value.cache-eager-load",
+                    "Moya can't load relationships for results from the query cache",
+                    diagnosis="Remove 'prefetch' and 'joinload', or 'cache' and 'cachefor'. Relationships of cached results are loaded lazily, when they are accessed.",
+                )
+            # Avoids a query for each object when relationships are accessed
+            options = self._get_load_options(
+                table_class, params.prefetch or [], subqueryload
+            ) + self._get_load_options(table_class, params.joinload or [], joinedload)
+            qs = qs.options(*options)
+
         if params.orderby:
             qs = Query._make_order(
                 self,
@@ -2922,35 +3123,51 @@ class Query(DBDataSetter):
             self.set_context(context, params.dst, qs.delete())
             return
 
+        cache_time = self.get_query_cache_time(params)
+
         if params.action == "count":
-            self.set_context(context, params.dst, qs.count())
+            if cache_time is None:
+                count = qs.count()
+            else:
+                count = query_cached(dbsession, qs, cache_time, action="count")
+            self.set_context(context, params.dst, count)
             return
 
         if params.action == "exists":
-            self.set_context(context, params.dst, qs.first() is not None)
+            if cache_time is None:
+                exists = qs.first() is not None
+            else:
+                exists = query_cached(dbsession, qs, cache_time, action="exists")
+            self.set_context(context, params.dst, exists)
             return
 
+        results = qs
+        if cache_time is not None:
+            results = query_cached(dbsession, qs, cache_time)
+
         if params.flat:
-            qs = list(query_flatten(qs))
+            qs = list(query_flatten(results))
 
         elif params.collect:
             if params.collect == "list":
                 collectkey = params.collectkey
                 if collectkey:
-                    qs = [getattr(result, collectkey, None) for result in qs]
+                    qs = [getattr(result, collectkey, None) for result in results]
                 else:
-                    qs = list(qs)
+                    qs = list(results)
             elif params.collect == "set":
-                qs = set(qs)
+                qs = set(results)
             elif params.collect == "dict":
                 collectkey = params.collectkey
                 qs = OrderedDict(
                     (getattr(obj, collectkey), obj)
-                    for obj in qs
+                    for obj in results
                     if hasattr(obj, collectkey)
                 )
             elif params.collect == "dict_sequence":
-                qs = OrderedDict(qs)
+                qs = OrderedDict(results)
+        elif cache_time is not None:
+            qs = CachedQuerySet(qs, table_class, dbsession, results)
         else:
             qs = MoyaQuerySet(qs, table_class, dbsession)
 
@@ -3227,6 +3444,7 @@ class Atomic(DBContextElement):
     @wrap_db_errors
     def logic(self, context):
         dbsession = self.get_session(context, self.db(context))
+        dbsession.use_primary()
 
         if dbsession.engine.driver == "pysqlite":
             log.warning("sqlite driver does not support <atomic>")
@@ -6,8 +6,8 @@ from ..tags.context import DataSetter
 from ..template.rendercontainer import RenderContainer
 from ..template.moyatemplates import Template
 from ..logic import DeferNodeContents, EndLogic
-from ..render import render_object
-from ..response import MoyaResponse
+from ..render import render_object, iter_render_object
+from ..response import MoyaResponse, ResponseStream
 from ..compat import py2bytes, text_type
 
 
@@ -62,17 +62,39 @@ class ServeTemplate(RenderTemplate):
 
     content_type = Attribute("Mime Type", required=False, default=None)
     status = Attribute("Status code", type="httpstatus", required=False, default=200)
+    stream = Attribute(
+        "Send the response while the template is rendering?",
+        type="boolean",
+        required=False,
+        default=False,
+    )
+    chunk_size = Attribute(
+        "Size of streamed chunks (in characters)",
+        type="integer",
+        required=False,
+        default=None,
+    )
 
     class Help:
         synopsis = """render and serve a template"""
 
     def on_value(self, context, value):
         content_type = self.content_type(context)
-        html = render_object(value, self.archive, context, self.format(context))
         response = MoyaResponse(charset=py2bytes("utf8"), status=self.status(context))
         if content_type:
             response.content_type = py2bytes(content_type)
-        response.text = html
+        if self.stream(context):
+            chunks = iter_render_object(
+                value,
+                self.archive,
+                context,
+                self.format(context),
+                {"chunk_size": self.chunk_size(context)},
+            )
+            response.app_iter = ResponseStream(chunks)
+        else:
+            html = render_object(value, self.archive, context, self.format(context))
+            response.text = html
         raise EndLogic(response)
 
 
@@ -8,7 +8,7 @@ from ..tags.context import ContextElementBase, DataSetter
 from .. import logic
 from ..urlmapper import URLMapper, MissingURLParameter, RouteError
 from ..context.expressiontime import ExpressionDateTime
-from ..render import render_object
+from ..render import render_object, iter_render_object
 from .. import http
 from ..http import StatusCode, standard_response, RespondWith
 from .. import errors
@@ -25,7 +25,7 @@ from ..context.tools import to_expression, set_dynamic
 from ..sites import LocaleProxy
 from ..compat import text_type, itervalues, py2bytes, iteritems
 from .. import db
-from ..response import MoyaResponse
+from ..response import MoyaResponse, ResponseStream, is_streaming
 from ..request import ReplaceRequest
 from ..urltools import urlencode as moya_urlencode
 from .. import tools
@@ -70,6 +70,9 @@ class Mountpoint(LogicElement):
     )
     preserve_attributes = ["urlmapper", "middleware", "name"]
 
+    # The archive keeps the url mappers when the document is rebuilt in place
+    rebuild_in_place = True
+
     def post_build(self, context):
         self.urlmapper = URLMapper(self.libid)
         self.middleware = dict(request=URLMapper(), response=URLMapper())
@@ -113,6 +116,9 @@ class URL(LogicElement):
         "Ignore further URLs if this route matches?", type="boolean", default=False
     )
 
+    # Routes are mapped again when a document is rebuilt in place
+    rebuild_in_place = True
+
     def lib_finalize(self, context):
         if not self.check(context):
             return
@@ -213,6 +219,9 @@ class Middleware(LogicElement):
     macro = Attribute("Macro to call", required=False, default=None)
     name = Attribute("An optional name", required=False, default=None)
 
+    # Routes are mapped again when a document is rebuilt in place
+    rebuild_in_place = True
+
     def lib_finalize(self, context):
         if not self.check(context):
             return
@@ -688,8 +697,18 @@ class Server(LogicElement):
         if not isinstance(result, Response):
             status = int(getattr(result, "http_status", None) or status)
             response = MoyaResponse(charset=py2bytes("utf8"), status=status)
-            html = render_object(result, archive, context, "html")
-            response.text = html
+            if getattr(result, "stream", False):
+                chunks = iter_render_object(
+                    result,
+                    archive,
+                    context,
+                    "html",
+                    {"chunk_size": getattr(result, "stream_chunk_size", None)},
+                )
+                response.app_iter = ResponseStream(chunks)
+            else:
+                html = render_object(result, archive, context, "html")
+                response.text = html
         else:
             response = result
         return self.process_response(context, response)
@@ -867,6 +886,7 @@ class Server(LogicElement):
         context.safe_delete("._callstack", ".call")
 
         response = None
+        streaming = False
         try:
             for result in self._dispatch_mapper(
                 archive, context, self.urlmapper, url, method, breakpoint=breakpoint
@@ -874,12 +894,15 @@ class Server(LogicElement):
                 response = self._dispatch_result(archive, context, request, result)
                 if response:
                     response = response_middleware(response)
-                    db.commit_sessions(context)
+                    # A streamed response renders after dispatch, and may need the db
+                    streaming = is_streaming(response)
+                    db.commit_sessions(context, close=not streaming)
                     return response
                 else:
                     db.commit_sessions(context)
 
         except Exception as e:
+            streaming = False
             db.rollback_sessions(context, close=False)
             return self.handle_error(archive, context, request, e, sys.exc_info())
 
@@ -887,7 +910,10 @@ class Server(LogicElement):
             for thread in context.get("._threads", []):
                 thread.wait()
             context.safe_delete("._threads")
-            db.close_sessions(context)
+            if streaming:
+                response.app_iter.on_close(db.close_sessions, context)
+            else:
+                db.close_sessions(context)
 
         root["_urltrace"] = []
 
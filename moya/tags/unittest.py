@@ -32,6 +32,8 @@ class Suite(LogicElement):
     )
     group = Attribute("Test group", default=None, map_to="_group")
 
+    rebuild_in_place = True
+
     def finalize(self, context):
         self.description = self._description(context)
         self.slow = self._slow(context)
@@ -195,6 +197,8 @@ class Case(LogicElement):
     description = Attribute("Short description of test suite")
     slow = Attribute("Is this test slow?", type="boolean", default=False)
 
+    rebuild_in_place = True
+
     def finalize(self, context):
         self.description = self.description(context)
 
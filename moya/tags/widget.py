@@ -308,6 +308,8 @@ class AttributeTag(ElementBase):
         required=False,
     )
 
+    rebuild_in_place = True
+
     def post_build(self, context):
         self.doc = context.sub(self.text.strip())
 
@@ -349,6 +351,8 @@ class ArgumentTag(ElementBase):
         "A value to use if the argument is not supplied", type="function", default=None
     )
 
+    rebuild_in_place = True
+
     def post_build(self, context):
         self.doc = context.sub(self.text.strip())
 
@@ -511,6 +515,8 @@ class Signature(ElementBase):
     def get_validator(self, context):
         return ArgumentValidator(context, self)
 
+    rebuild_in_place = True
+
     def finalize(self, context):
         if self.parent._element_type in (
             (namespaces.default, "macro"),
@@ -0,0 +1,184 @@
+"""
+Compile Moya templates to native Python render functions
+
+The template interpreter (`Template._render_frame`) is a stack machine, which pushes
+and pops every node and generator, and type-checks every item it pops. The compiler
+here generates a single Python function per template, which appends text to the
+output directly.
+
+Blocks and extends are resolved at compile time, so a compiled function belongs to
+the template it was compiled for (not the base template). Nodes that know how to
+compile themselves implement `compile_python`, anything else is rendered with the
+interpreter, so the output is identical.
+
+"""
+from __future__ import unicode_literals
+from __future__ import print_function
+from __future__ import absolute_import
+
+from ..compat import string_types
+from ..sourcecompiler import SourceCompiler, compile_or_none
+
+import __future__
+import contextlib
+import logging
+
+
+log = logging.getLogger("moya.template")
+
+_compile_flags = (
+    __future__.unicode_literals.compiler_flag
+    | __future__.print_function.compiler_flag
+    | __future__.absolute_import.compiler_flag
+)
+
+
+class TemplateCompiler(SourceCompiler):
+    """Generates Python source for a template."""
+
+    def __init__(self, template, environment):
+        super(TemplateCompiler, self).__init__()
+        self.template = template
+        self.environment = environment
+        self._lines = []
+        self._text = []
+        self._indent = 2
+        self._count = 0
+
+    def new_name(self, prefix):
+        """Get a unique name for a local variable."""
+        self._count += 1
+        return "{}{}".format(prefix, self._count)
+
+    def write(self, line):
+        """Write a line of source."""
+        self.flush_text()
+        self._lines.append("    " * self._indent + line)
+
+    def flush_text(self):
+        """Write any pending text in a single append."""
+        if self._text:
+            text = "".join(self._text)
+            del self._text[:]
+            self._lines.append(
+                "{}append({})".format("    " * self._indent, self.bind(text, "_t"))
+            )
+
+    def text(self, text):
+        """Output text, consecutive text is combined."""
+        if text:
+            self._text.append(text)
+
+    @contextlib.contextmanager
+    def indent(self):
+        """Indent a block of code."""
+        self.flush_text()
+        start = len(self._lines)
+        self._indent += 1
+        yield
+        self.flush_text()
+        if len(self._lines) == start:
+            self.write("pass")
+        self._indent -= 1
+
+    def set_current_node(self, node):
+        """Set the node used in error reports."""
+        self.write("frame.current_node = {}".format(self.bind(node, "_n")))
+
+    def compile_nodes(self, nodes):
+        """Compile a list of nodes and strings."""
+        for node in nodes:
+            if isinstance(node, string_types):
+                self.text(node)
+            else:
+                node.compile_python(self)
+
+    def compile_substitute(self, node, text):
+        """Output text with ${} substitutions."""
+        self.set_current_node(node)
+        self.write("append(sub({}, sub_escape))".format(self.bind(text, "_t")))
+
+    def compile_render(self, node):
+        """Render a node with the interpreter."""
+        self.write(
+            "append(render_node(frame, environment, context, sub_escape, {}))".format(
+                self.bind(node, "_n")
+            )
+        )
+
+    def compile_loop(self, node, render, *child_lists):
+        """Compile a generator that yields a list of child nodes for each iteration.
+
+        The generator is pushed on to the frame stack, so that it is in error reports
+        and is closed if rendering fails.
+
+        """
+        self.set_current_node(node)
+        generator = self.new_name("_g")
+        children = self.new_name("_children")
+        self.write(
+            "{} = NodeGenerator({}, {}(environment, context, template, sub_escape))".format(
+                generator, self.bind(node, "_n"), self.bind(render, "_r")
+            )
+        )
+        self.write("push({})".format(generator))
+        self.write("for {} in {}:".format(children, generator))
+        with self.indent():
+            if len(child_lists) == 1:
+                self.compile_nodes(child_lists[0])
+            else:
+                for index, child_list in enumerate(child_lists):
+                    if index == len(child_lists) - 1:
+                        self.write("else:")
+                    else:
+                        self.write(
+                            "{} {} is {}:".format(
+                                "if" if index == 0 else "elif",
+                                children,
+                                self.bind(child_list, "_l"),
+                            )
+                        )
+                    with self.indent():
+                        self.compile_nodes(child_list)
+        self.write("pop()")
+
+    def build_source(self, root):
+        """Generate the source for a render function factory."""
+        self.compile_nodes([root])
+        self.flush_text()
+        from .moyatemplates import NodeGenerator
+
+        self.namespace["NodeGenerator"] = NodeGenerator
+        names = sorted(self.namespace)
+        lines = [
+            "def _make_render({}):".format(", ".join(names)),
+            "    def _render(template, frame, environment, context, sub_escape, append):",
+            "        stack = frame.stack",
+            "        push = stack.append",
+            "        pop = stack.pop",
+            "        sub = context.sub",
+            "        render_node = template._render_node",
+        ]
+        lines.extend(self._lines)
+        lines.append("    return _render")
+        return "\n".join(lines)
+
+    def compile(self):
+        """Compile the template to a render function."""
+        root = self.template.get_root_node(self.environment)
+        source = self.build_source(root)
+        return self.exec_source(
+            source,
+            "<template '{}'>".format(self.template.path),
+            "_make_render",
+            _compile_flags,
+        )
+
+
+def compile_template(template, environment):
+    """Get a render function for a template, or None if it could not be compiled."""
+    return compile_or_none(
+        lambda: TemplateCompiler(template, environment).compile(),
+        "template '{}'".format(template.path),
+        log,
+    )
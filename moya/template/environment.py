@@ -20,7 +20,7 @@ TEMPLATE_VERSION = 11
 class Environment(object):
     name = "moya"
 
-    def __init__(self, template_fs, archive=None, cache=None):
+    def __init__(self, template_fs, archive=None, cache=None, compile=False):
         if isinstance(template_fs, string_types):
             template_fs = open_fs(template_fs)
         self.template_fs = template_fs
@@ -34,6 +34,8 @@ class Environment(object):
             self.cache = cache
         self.templates = {}
         self._caches = {}
+        # Compile templates to Python functions
+        self.compile = compile
 
     @classmethod
     def make_default(self):
@@ -27,7 +27,9 @@ from ..compat import (
     with_metaclass,
     implements_bool,
 )
-from ..tools import make_cache_key, nearest_word
+from ..tools import make_cache_key, make_cache_tags, nearest_word
+from ..cache.prefetch import CacheKeys, get_prefetched
+from ..cache.stampede import CacheFill
 from .. import tools
 from ..compat import urlencode, PY2
 from . import lorem
@@ -48,6 +50,9 @@ import logging
 
 log = logging.getLogger("moya.template")
 
+# Default size (in characters) of chunks when streaming a template
+STREAM_CHUNK_SIZE = 16384
+
 TranslatableText = namedtuple(
     "TranslatableText", ["text", "location", "comment", "plural", "context"]
 )
@@ -60,7 +65,7 @@ class MoyaTemplateEngine(TemplateEngine):
         super(MoyaTemplateEngine, self).__init__(archive, fs, settings)
         from .environment import Environment
 
-        self.env = Environment(fs, archive)
+        self.env = Environment(fs, archive, compile=settings.get("compile", False))
 
     def __repr__(self):
         return "<moyatemplates>"
@@ -82,6 +87,39 @@ class MoyaTemplateEngine(TemplateEngine):
 
         if isinstance(paths, Template):
             return self.render_template(paths, data, base_context=base_context, **tdata)
+        template = self.find_template(paths)
+        return self.render_template(
+            template, data, base_context=base_context, app=app, **tdata
+        )
+
+    def render_iter(
+        self,
+        paths,
+        data,
+        base_context=None,
+        app=None,
+        chunk_size=None,
+        **tdata
+    ):
+        """Render a template, and return an iterator of chunks"""
+        if isinstance(paths, Template):
+            template = paths
+        else:
+            template = self.find_template(paths)
+        if base_context is None:
+            base_context = Context(name="base_context")
+        data = data.copy()
+        data.update(tdata, app=app)
+        return template.render_iter(
+            data,
+            context=base_context,
+            environment=self.env,
+            app=app,
+            chunk_size=chunk_size or STREAM_CHUNK_SIZE,
+        )
+
+    def find_template(self, paths):
+        """Get the first template that exists in a list of paths"""
         if isinstance(paths, string_types):
             paths = [paths]
         if not paths:
@@ -98,10 +136,7 @@ class MoyaTemplateEngine(TemplateEngine):
                 break
         if template is None:
             raise errors.MissingTemplateError(paths[-1])
-
-        return self.render_template(
-            template, data, base_context=base_context, app=app, **tdata
-        )
+        return template
 
     def render_template(self, template, data, base_context=None, **tdata):
         if base_context is None:
@@ -368,6 +403,10 @@ class NodeType(object):
     def render(self, environment, context, template, text_escape):
         yield iter(self.children)
 
+    def compile_python(self, compiler):
+        """Generate Python code to render this node (see compiler.py)"""
+        compiler.compile_render(self)
+
     def on_clause(self, clause):
         pass
 
@@ -430,6 +469,9 @@ class TextNode(Node):
     def render(self, env, context, template, text_escape):
         return context.sub(self.text, text_escape)
 
+    def compile_python(self, compiler):
+        compiler.compile_substitute(self, self.text)
+
 
 class MinifyCSSNode(Node):
     tag_name = "minify"
@@ -646,6 +688,9 @@ class PremailerNode(Node):
 class RootNode(Node):
     tag_name = "root"
 
+    def compile_python(self, compiler):
+        compiler.compile_nodes(self.children)
+
 
 class BlockNode(Node):
     tag_name = "block"
@@ -664,6 +709,14 @@ class BlockNode(Node):
         # with template.block(context, self) as frame:
         yield chain.from_iterable(node.children for node in nodes)
 
+    def compile_python(self, compiler):
+        # Blocks are resolved at compile time
+        nodes = compiler.template.get_render_block(
+            compiler.environment, self.block_name
+        )
+        for node in nodes:
+            compiler.compile_nodes(node.children)
+
 
 class EmptyBlockNode(BlockNode):
     tag_name = "emptyblock"
@@ -681,6 +734,9 @@ class DefNode(Node):
     def render(self, environment, context, template, text_escape):
         return ""
 
+    def compile_python(self, compiler):
+        pass
+
 
 class CallNode(Node):
     tag_name = "call"
@@ -786,6 +842,24 @@ class IfNode(Node):
                     yield iter(children)
                     break
 
+    def compile_python(self, compiler):
+        compiler.set_current_node(self)
+        clauses = [(self.if_expression, self.true_children)]
+        clauses.extend(self.else_children)
+        for index, (condition, children) in enumerate(clauses):
+            if index and isinstance(condition, TrueExpression):
+                compiler.write("else:")
+            else:
+                compiler.write(
+                    "{} {}(context):".format(
+                        "elif" if index else "if", compiler.bind(condition.eval, "_e")
+                    )
+                )
+            with compiler.indent():
+                compiler.compile_nodes(children)
+            if index and isinstance(condition, TrueExpression):
+                break
+
 
 class WithNode(Node):
     tag_name = "with"
@@ -820,6 +894,9 @@ class WithNode(Node):
         finally:
             scopes.pop()
 
+    def compile_python(self, compiler):
+        compiler.compile_loop(self, self.render, self.children)
+
 
 class ElseNode(Node):
     tag_name = "else"
@@ -869,6 +946,9 @@ class WhileNode(Node):
                 break
             yield iter(self.children)
 
+    def compile_python(self, compiler):
+        compiler.compile_loop(self, self.render, self.children)
+
 
 _last_value = object()
 
@@ -908,6 +988,19 @@ class ForNode(Node):
         self.reverse_expression = exp_map.get("reverse", FalseExpression())
 
     def render(self, environment, context, template, text_escape):
+        for children in self.iter_children(environment, context, template, text_escape):
+            yield iter(children)
+
+    def compile_python(self, compiler):
+        if self.empty_children:
+            compiler.compile_loop(
+                self, self.iter_children, self.children, self.empty_children
+            )
+        else:
+            compiler.compile_loop(self, self.iter_children, self.children)
+
+    def iter_children(self, environment, context, template, text_escape):
+        """Yield the list of children for each iteration (or the empty clause)"""
         sequence = self.sequence.eval(context)
         assign = self.assign
         children = self.children
@@ -948,7 +1041,7 @@ class ForNode(Node):
                         context_set(assign, value)
                         if if_eval(context):
                             empty = False
-                            yield iter(children)
+                            yield children
                             forloop["first"] = False
                         value = next_value
                 else:
@@ -960,13 +1053,13 @@ class ForNode(Node):
                             context_set(name, subvalue)
                         if if_eval(context):
                             empty = False
-                            yield iter(children)
+                            yield children
                             forloop["first"] = False
                         value = next_value
             if empty and self.empty_children:
-                yield iter(self.empty_children)
+                yield self.empty_children
 
-        except:
+        except Exception:
             self.render_error(
                 "unable to iterate over {}".format(context.to_expr(sequence))
             )
@@ -992,6 +1085,9 @@ class EmitNode(Node):
     def render(self, environment, context, template, text_escape):
         yield self.emit_text
 
+    def compile_python(self, compiler):
+        compiler.text(self.emit_text)
+
 
 class ExtendsNode(Node):
     """Extends a base template"""
@@ -1435,8 +1531,7 @@ class IncludeNode(Node):
                 break
 
         with template.block(context, self) as frame:
-            frame.stack.append(template.get_root_node(environment))
-            yield template._render_frame(frame, environment, context, text_escape)
+            yield template._render_root(frame, environment, context, text_escape)
 
 
 class InsertNode(Node):
@@ -1531,11 +1626,13 @@ class CacheNode(Node):
 
     def on_create(self, environment, parser):
         self.node_index = parser.node_index
-        words = ["for", "key", "in", "if"]
+        words = ["for", "key", "in", "if", "stale", "tags"]
         self.for_expression = None
         self.key_expression = DefaultExpression("")
         self.in_expression = DefaultExpression("fragment")
         self.if_expression = DefaultExpression(True)
+        self.stale_expression = DefaultExpression(None)
+        self.tags_expression = DefaultExpression(None)
         while words:
             word = parser.expect_word_or_end(*words)
             if word is None:
@@ -1549,6 +1646,10 @@ class CacheNode(Node):
                 self.in_expression = parser.expect_expression()
             elif word == "if":
                 self.if_expression = parser.expect_expression()
+            elif word == "stale":
+                self.stale_expression = parser.expect_expression()
+            elif word == "tags":
+                self.tags_expression = parser.expect_expression()
         if self.for_expression is None:
             parser.syntax_error("FOR clause expected here")
         parser.expect_end()
@@ -1563,7 +1664,19 @@ class CacheNode(Node):
         in_cache = text_type(self.in_expression.eval(context))
         cache_key = "{}.{}.{}".format(template.raw_path, self.node_index, key)
         cache = environment.get_cache(in_cache)
-        cached_html = cache.get(cache_key, None)
+        template.cache_keys.add(in_cache, cache_key)
+
+        for_ms = self._get_timespan(self.for_expression, context, "FOR")
+        stale_ms = self._get_timespan(self.stale_expression, context, "STALE")
+        fill = CacheFill(
+            cache,
+            cache_key,
+            time=for_ms,
+            stale=stale_ms,
+            read=lambda: get_prefetched(context, in_cache, cache, cache_key),
+            tags=make_cache_tags(self.tags_expression.eval(context)),
+        )
+        cached_html = fill.get(None)
 
         if isinstance(cached_html, text_type):
             return cached_html
@@ -1572,20 +1685,24 @@ class CacheNode(Node):
                 # Appears to happen with memcache
                 log.warning("cache returned non-unicode! %r", cached_html)
 
-        html = self.render_contents(environment, context, template, text_escape)
-
-        for_timespan = self.for_expression.eval(context)
-        if for_timespan is None:
-            for_ms = None
-        else:
-            try:
-                for_ms = int(for_timespan) if for_timespan is not None else None
-            except ValueError:
-                self.render_error("FOR clause must be a number")
-
-        cache.set(cache_key, html, time=for_ms)
+        try:
+            html = self.render_contents(environment, context, template, text_escape)
+        except:
+            fill.release()
+            raise
+        fill.set(html)
         return html
 
+    def _get_timespan(self, expression, context, clause):
+        """Get a timespan in milliseconds"""
+        timespan = expression.eval(context)
+        if timespan is None:
+            return 0
+        try:
+            return int(timespan)
+        except ValueError:
+            self.render_error("{} clause must be a number".format(clause))
+
 
 class TransNode(Node):
     tag_name = "trans"
@@ -2065,6 +2182,7 @@ class NodeGenerator(object):
 class Template(object):
 
     re_special = re.compile(r"\{\%((?:\".*?\"|\'.*?\'|.|\s)*?)\%\}|(\{\#)|(\#\})")
+    _cache_keys = None
 
     def __init__(self, source, path="?", raw_path=None, lib=None):
         self.source = source or ""
@@ -2084,15 +2202,29 @@ class Template(object):
         self.expressions = set()
         self._root_node = None
         self.translatable_text = []
+        self.compiled = False
+        self._render_function = None
+        self._cache_keys = None
 
     def __repr__(self):
         return "Template(path={!r})".format(self.path)
 
+    @property
+    def cache_keys(self):
+        """Keys read by cache tags in this template, prefetched when rendered."""
+        if self._cache_keys is None:
+            self._cache_keys = CacheKeys()
+        return self._cache_keys
+
     def dump(self, environment):
         if self.parsed and not self.valid:
             return None
         self.parse(environment)
         state = self.__dict__.copy()
+        # Render functions can't be pickled, and may depend on other templates
+        state["compiled"] = False
+        state["_render_function"] = None
+        state["_cache_keys"] = None
 
         def compile(exp):
             try:
@@ -2543,6 +2675,134 @@ class Template(object):
         finally:
             self._finalize_stack(stack)
 
+    def _render_node(
+        self,
+        frame,
+        environment,
+        context,
+        sub_escape,
+        node,
+        _isinstance=isinstance,
+        _next=next,
+        _text_type=text_type,
+        _Node=Node,
+    ):
+        """Render a single node with the interpreter (used by compiled templates)"""
+        output = []
+        output_text = output.append
+
+        node_render = NodeGenerator.render
+        stack = frame.stack
+        pop = stack.pop
+        push = stack.append
+        base = len(stack)
+
+        push(node)
+        while len(stack) > base:
+            node = pop()
+            if _isinstance(node, _text_type):
+                output_text(node)
+            elif _isinstance(node, _Node):
+                frame.current_node = node
+                push(node_render(node, environment, context, self, sub_escape))
+            else:
+                new_node = _next(node, None)
+                if new_node is not None:
+                    push(node)
+                    push(new_node)
+        return "".join(output)
+
+    def _render_compiled(self, render_function, frame, environment, context, sub_escape):
+        output = []
+        try:
+            render_function(self, frame, environment, context, sub_escape, output.append)
+            return "".join(output)
+
+        except errors.TemplateError:
+            raise
+
+        except Exception as exc:
+            self.on_error(context, frame.current_node, exc)
+
+        finally:
+            self._finalize_stack(frame.stack)
+
+    def get_render_function(self, environment):
+        """Get a compiled render function, or None to use the interpreter"""
+        if environment is None or not environment.compile:
+            return None
+        if not getattr(self, "compiled", False):
+            from .compiler import compile_template
+
+            self._render_function = compile_template(self, environment)
+            self.compiled = True
+        return self._render_function
+
+    def _render_root(self, frame, environment, context, sub_escape):
+        """Render the template in a frame"""
+        if self._cache_keys is not None:
+            self._cache_keys.prefetch(context, environment.get_cache)
+        render_function = self.get_render_function(environment)
+        if render_function is not None:
+            return self._render_compiled(
+                render_function, frame, environment, context, sub_escape
+            )
+        frame.stack.append(self.get_root_node(environment))
+        return self._render_frame(frame, environment, context, sub_escape)
+
+    def _iter_render_frame(
+        self,
+        frame,
+        environment,
+        context,
+        sub_escape,
+        chunk_size,
+        _isinstance=isinstance,
+        _next=next,
+        _text_type=text_type,
+        _len=len,
+        _Node=Node,
+    ):
+        """Like _render_frame, but yields output in chunks of at least `chunk_size`"""
+        output = []
+        output_text = output.append
+        size = 0
+
+        node_render = NodeGenerator.render
+        stack = frame.stack
+        pop = stack.pop
+        push = stack.append
+
+        try:
+            while stack:
+                node = pop()
+                if _isinstance(node, _text_type):
+                    output_text(node)
+                    size += _len(node)
+                    if size >= chunk_size:
+                        yield "".join(output)
+                        del output[:]
+                        size = 0
+                elif _isinstance(node, _Node):
+                    frame.current_node = node
+                    push(node_render(node, environment, context, self, sub_escape))
+                else:
+                    new_node = _next(node, None)
+                    if new_node is not None:
+                        push(node)
+                        push(new_node)
+            if output:
+                yield "".join(output)
+
+        except errors.TemplateError:
+            raise
+
+        except Exception as exc:
+            self.on_error(context, frame.current_node, exc)
+
+        finally:
+            self._finalize_stack(stack)
+
     def on_error(self, context, current_node, exc):
         frames = []
         t_stack = context["._t_stack"]
@@ -2658,10 +2918,43 @@ class Template(object):
         self.parse(environment)
         self.check_extend(environment)
 
+        with self.frame(context, data=data, app=app) as frame:
+            return self._render_root(frame, environment, context, self._sub_escape)
+
+    def render_iter(
+        self,
+        data=None,
+        context=None,
+        environment=None,
+        app=None,
+        chunk_size=STREAM_CHUNK_SIZE,
+    ):
+        """Render the template, and yield the output in chunks.
+
+        Chunks are at least `chunk_size` characters (apart from the last), but
+        included templates are output in a single chunk. Streamed templates are
+        always rendered by the interpreter.
+
+        """
+        if environment is None:
+            from .environment import Environment
+
+            environment = Environment.make_default()
+        if context is None:
+            context = Context()
+
+        self.parse(environment)
+        self.check_extend(environment)
+
         root = self.get_root_node(environment)
+        if self._cache_keys is not None:
+            self._cache_keys.prefetch(context, environment.get_cache)
         with self.frame(context, data=data, app=app) as frame:
             frame.stack.append(root)
-            return self._render_frame(frame, environment, context, self._sub_escape)
+            for chunk in self._iter_render_frame(
+                frame, environment, context, self._sub_escape, chunk_size
+            ):
+                yield chunk
 
 
 if __name__ == "__main__":
@@ -26,3 +26,13 @@ class RenderContainer(dict):
         if target == "html":
             return HTML(rendered)
         return rendered
+
+    def moya_render_iter(self, archive, context, target, options):
+        engine = archive.get_template_engine("moya")
+        return engine.render_iter(
+            self._meta["template"],
+            self,
+            base_context=context,
+            app=self._app,
+            chunk_size=options.get("chunk_size"),
+        )
@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 import unittest
 import time
+import os
 
 from fs.memoryfs import MemoryFS
 
@@ -79,6 +80,37 @@ class CacheTests(object):
         self.assert_(not self.cache.contains("key"))
         self.assert_("key" not in self.cache)
 
+    def test_tags(self):
+        """Test invalidating values by tag"""
+        self.cache.set("key1", "foo", tags=["a", "b"])
+        self.cache.set("key2", "bar", tags=["b"])
+        self.cache.set_many({"key3": "baz"}, tags=["c"])
+        self.assertEqual(self.cache.get("key1"), "foo")
+        self.cache.invalidate_tag("a")
+        self.assertEqual(self.cache.get("key1"), None)
+        self.assertEqual(self.cache.get("key2"), "bar")
+        self.cache.invalidate_tags(["b", "c"])
+        self.assertEqual(
+            self.cache.get_many(["key2", "key3"]), {"key2": None, "key3": None}
+        )
+        self.cache.set("key2", "bar", tags=["b"])
+        self.assertEqual(self.cache.get("key2"), "bar")
+
+    def test_many(self):
+        """Test get_many / set_many / delete_many"""
+        self.cache.set_many({"key1": ["hello"], "key2": "world"})
+        self.assertEqual(
+            self.cache.get_many(["key1", "key2", "nokey"]),
+            {"key1": ["hello"], "key2": "world", "nokey": None},
+        )
+        self.assertEqual(self.cache.get_many(["nokey"], Ellipsis), {"nokey": Ellipsis})
+        self.cache.delete_many(["key1", "key2", "nokey"])
+        self.assertEqual(
+            self.cache.get_many(["key1", "key2"]), {"key1": None, "key2": None}
+        )
+        with self.assertRaises(ValueError):
+            self.cache.set_many({"key1": None})
+
 
 class NamespacesTests(object):
     """For caches that share storage"""
@@ -118,6 +150,38 @@ class TestFileCache(unittest.TestCase, CacheTests, NamespacesTests):
         self.fs.close()
         self.fs = None
 
+    def test_sharded(self):
+        """Test files are stored in sharded directories"""
+        self.cache.set("key", "foo")
+        path = self.cache.make_path(self.cache.get_key("key"))
+        self.assertEqual(path.count("/"), 2)
+        self.assertTrue(self.fs.isfile("ns1/" + path))
+        self.assertEqual(
+            [name for name in self.fs.listdir("ns1/" + path.rsplit("/", 1)[0])],
+            [path.rsplit("/", 1)[1]],
+        )
+
+    def test_evict(self):
+        """Test evict removes expired files"""
+        self.cache.expire_period = 0.01
+        self.cache.set("expires", "foo", time=10)
+        self.cache.set("permanent", "bar")
+        time.sleep(0.05)
+        self.cache.evict()
+        self.assertFalse(self.cache.contains("expires"))
+        self.assertTrue(self.cache.contains("permanent"))
+        self.assertEqual(self.fs.listdir("ns1/" + self.cache.expire_dir), [])
+
+    def test_trim(self):
+        """Test evict trims the cache to its maximum size"""
+        self.cache.max_size = 4096
+        for n in range(100):
+            self.cache.set("key{}".format(n), "x" * 100)
+        self.cache.evict()
+        total_size = sum(size for _, size, _ in self.cache._iter_files())
+        self.assertTrue(total_size <= 4096)
+        self.assertTrue(self.cache.contains("key99"))
+
 
 class TestMemcacheCache(unittest.TestCase, CacheTests, NamespacesTests):
 
@@ -149,6 +213,98 @@ class TestDictCompressCache(unittest.TestCase, CacheTests):
         )
 
 
+class TestMarshalCache(unittest.TestCase, CacheTests):
+    """Test with a different serializer and compressor"""
+
+    __test__ = True
+
+    def setUp(self):
+        self.cache = cache.memorycache.MemoryCache(
+            "test", "", compress=True, compress_min=1
+        )
+        self.cache.set_format("marshal", "zlib", 1)
+
+
+class TestCacheSerializers(unittest.TestCase):
+    def setUp(self):
+        self.cache = cache.memorycache.MemoryCache("test", "", compress_min=1)
+
+    def test_formats(self):
+        """Test all serializers and compressors encode and decode values"""
+        from moya.cache import serializers
+        from moya.cache.stampede import CachedValue
+
+        values = [
+            "hello",
+            ["hello", "world"],
+            {"a": 1},
+            CachedValue("<b>fragment</b>", 123.0, 0.5),
+            CachedValue("<b>fragment</b>", None, 0),
+        ]
+        for serializer in serializers.serializers:
+            for compressor, compressor_cls in serializers.compressors.items():
+                if not compressor_cls.available:
+                    continue
+                self.cache.set_format(serializer, compressor)
+                for value in values:
+                    encoded = self.cache.encode_value(value)
+                    self.assertEqual(self.cache.decode_value(encoded), value)
+                    self.assertEqual(
+                        type(self.cache.decode_value(encoded)), type(value)
+                    )
+
+    def test_text(self):
+        """Test the text serializer stores text without pickling"""
+        self.cache.set_format("text", "none")
+        encoded = self.cache.encode_value("<p>hello</p>")
+        self.assertEqual(encoded, b"\x01tnT<p>hello</p>")
+        # Falls back to pickle
+        encoded = self.cache.encode_value([1, 2])
+        self.assertEqual(encoded[:3], b"\x01pn")
+        self.assertEqual(self.cache.decode_value(encoded), [1, 2])
+
+    def test_text_tagged(self):
+        """Test the text serializer stores tagged text without pickling"""
+        from moya.cache.stampede import CachedValue, TaggedValue
+
+        self.cache.set_format("text", "none")
+        generations = (("._tag.a", "1f2e"), ("._tag.b", "3d4c"))
+        for value in (
+            TaggedValue("<p>hello</p>", generations),
+            TaggedValue(CachedValue("<p>hello</p>", 123.0, 0.5), generations),
+        ):
+            encoded = self.cache.encode_value(value)
+            self.assertEqual(encoded[:3], b"\x01tn")
+            self.assertEqual(self.cache.decode_value(encoded), value)
+        self.cache.set("key", CachedValue("<p>hello</p>", None, 0), tags=["a"])
+        self.assertEqual(self.cache.get("key").value, "<p>hello</p>")
+
+    def test_previous_format(self):
+        """Test values encoded without a header can be read"""
+        import pickle
+        import zlib
+
+        value = ["hello", "world"]
+        dump = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.assertEqual(self.cache.decode_value(dump), value)
+        self.assertEqual(self.cache.decode_value(zlib.compress(dump) + b"ZZ"), value)
+
+    def test_settings(self):
+        """Test serializer settings"""
+        from moya.settings import SettingsSectionContainer
+        from moya import errors
+
+        settings = SettingsSectionContainer(
+            {"type": "memory", "serializer": "marshal", "compress_level": "9"}
+        )
+        memory_cache = cache.Cache.create("test", settings)
+        self.assertEqual(memory_cache.serializer.name, "marshal")
+        self.assertEqual(memory_cache.compressor.level, 9)
+        settings = SettingsSectionContainer({"type": "memory", "serializer": "nope"})
+        with self.assertRaises(errors.StartupFailedError):
+            cache.Cache.create("test", settings)
+
+
 class TestDebugWrapper(unittest.TestCase, CacheTests):
 
     __test__ = True
@@ -158,6 +314,178 @@ class TestDebugWrapper(unittest.TestCase, CacheTests):
         self.cache = cache.base.DebugCacheWrapper(self._cache)
 
 
+class TestTieredCache(unittest.TestCase, CacheTests):
+
+    __test__ = True
+
+    def setUp(self):
+        self.cache = cache.tieredcache.TieredCache("test", "")
+
+    def test_generation(self):
+        """Test deleting a key invalidates other tiered caches"""
+        l2 = cache.dictcache.DictCache("test", "")
+        cache1 = cache.tieredcache.TieredCache("test", "", l2=l2, generation_check=0)
+        cache2 = cache.tieredcache.TieredCache("test", "", l2=l2, generation_check=0)
+        cache1.set("key", "foo")
+        self.assertEqual(cache2.get("key"), "foo")
+        self.assertIn("key", cache2.l1)
+        cache1.delete("key")
+        self.assertEqual(cache2.get("key"), None)
+        self.assertNotIn("key", cache2.l1)
+
+    def test_add(self):
+        """Test keys set with add bypass the in-memory cache"""
+        lock_key = "key" + cache.stampede.CacheFill.lock_suffix
+        self.assertTrue(self.cache.add(lock_key, 1))
+        self.assertFalse(self.cache.add(lock_key, 1))
+        self.assertNotIn(lock_key, self.cache.l1)
+        generation = self.cache._generation
+        self.cache.delete(lock_key)
+        self.assertEqual(self.cache._generation, generation)
+        self.assertTrue(self.cache.add(lock_key, 1))
+
+
+class TestSharedCache(unittest.TestCase, CacheTests):
+
+    __test__ = True
+
+    def setUp(self):
+        import tempfile
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "test.shm")
+        self.cache = cache.sharedcache.SharedCache(
+            "test", "", path=self.path, size=64 * 1024, slot_size=1024
+        )
+
+    def tearDown(self):
+        import shutil
+
+        self.cache.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_shared(self):
+        """Test values are shared by caches that use the same file"""
+        self.cache.set("key", "foo")
+        cache2 = cache.sharedcache.SharedCache(
+            "test", "", path=self.path, size=64 * 1024, slot_size=1024
+        )
+        try:
+            self.assertEqual(cache2.get("key"), "foo")
+            cache2.delete("key")
+            self.assertEqual(self.cache.get("key"), None)
+        finally:
+            cache2.close()
+
+    def test_different_settings(self):
+        """Test a file in use is never resized for different settings"""
+        from moya import errors
+
+        self.cache.set("key", "foo")
+        with self.assertRaises(errors.StartupFailedError):
+            cache.sharedcache.SharedCache(
+                "test", "", path=self.path, size=128 * 1024, slot_size=1024
+            )
+        self.assertEqual(os.path.getsize(self.path), 64 + 64 * 1024)
+        self.assertEqual(self.cache.get("key"), "foo")
+
+    def test_location_required(self):
+        """Test a shared cache requires a location"""
+        from moya.settings import SettingsSectionContainer
+        from moya import errors
+
+        with self.assertRaises(errors.StartupFailedError):
+            cache.Cache.create(
+                "test", SettingsSectionContainer({"type": "shared"})
+            )
+
+    def test_full(self):
+        """Test values are evicted when the cache is full"""
+        for n in range(1000):
+            self.cache.set("key{}".format(n), n)
+        self.assertEqual(self.cache.get("key999"), 999)
+        stored = sum(
+            1 for n in range(1000) if self.cache.get("key{}".format(n)) is not None
+        )
+        self.assertTrue(stored <= self.cache.slot_count)
+
+    def test_too_large(self):
+        """Test values too large for a slot are not cached"""
+        self.cache.set("key", "small")
+        self.cache.set("key", os.urandom(2048))
+        self.assertEqual(self.cache.get("key"), None)
+
+
+class TestSQLiteCache(unittest.TestCase, CacheTests):
+
+    __test__ = True
+
+    def setUp(self):
+        import tempfile
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "test.sqlite")
+        self.cache = cache.sqlitecache.SQLiteCache("test", "", path=self.path)
+
+    def tearDown(self):
+        import shutil
+
+        self.cache.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_shared(self):
+        """Test values are shared by caches (and threads) that use the same file"""
+        import threading
+
+        self.cache.set("key", "foo")
+        cache2 = cache.sqlitecache.SQLiteCache("test", "", path=self.path)
+        self.assertEqual(cache2.get("key"), "foo")
+        results = []
+        thread = threading.Thread(target=lambda: results.append(cache2.get("key")))
+        thread.start()
+        thread.join()
+        self.assertEqual(results, ["foo"])
+        cache2.close()
+
+    def test_location_required(self):
+        """Test an sqlite cache requires a location"""
+        from moya.settings import SettingsSectionContainer
+        from moya import errors
+
+        with self.assertRaises(errors.StartupFailedError):
+            cache.Cache.create(
+                "test", SettingsSectionContainer({"type": "sqlite"})
+            )
+        sqlite_cache = cache.Cache.create(
+            "test",
+            SettingsSectionContainer(
+                {"type": "sqlite", "location": os.path.join(self.temp_dir, "cache")}
+            ),
+        )
+        sqlite_cache.close()
+        self.assertTrue(
+            os.path.exists(os.path.join(self.temp_dir, "cache", "test.sqlite"))
+        )
+
+    def test_evict(self):
+        """Test expired values are deleted, and the cache is trimmed"""
+        self.cache.evict_batch_size = 3
+        for n in range(10):
+            self.cache.set("expires{}".format(n), "foo", time=1)
+        self.cache.set("permanent", "bar")
+        time.sleep(0.01)
+        self.assertEqual(self.cache.evict(), 10)
+        self.assertEqual(self.cache.get("permanent"), "bar")
+
+        self.cache.max_size = 1024
+        for n in range(20):
+            self.cache.set("key{}".format(n), "x" * 100)
+        self.assertTrue(self.cache.evict() > 0)
+        connection = self.cache._get_connection()
+        (size,) = connection.execute(self.cache.size_sql).fetchone()
+        self.assertTrue(size <= 1024)
+
+
 class TetstDisabledCache(unittest.TestCase):
 
     __test__ = True
@@ -173,3 +501,303 @@ class TetstDisabledCache(unittest.TestCase):
         self.assert_(not self.cache.contains("key"))
         self.assertEqual(self.cache.get("key", None), None)
         self.cache.delete("key")
+
+
+class TestCacheConcurrency(unittest.TestCase):
+    def test_thread_safe(self):
+        """Test backends declare their concurrency"""
+        self.assertIsNone(cache.dictcache.DictCache("test", "")._call_lock)
+        self.assertIsNotNone(cache.base.CacheType("test", "")._call_lock)
+        self.assertIsNone(cache.base.CacheType("test", "", thread_safe=True)._call_lock)
+
+    def test_memory_threads(self):
+        """Test memory cache size is consistent when used from multiple threads"""
+        import threading
+
+        memory_cache = cache.memorycache.MemoryCache("test", "", size=4096)
+
+        def worker(offset):
+            for n in range(500):
+                key = "key{}".format((n + offset) % 50)
+                memory_cache.set(key, "x" * 100)
+                memory_cache.get(key)
+                if n % 7 == 0:
+                    memory_cache.delete(key)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            memory_cache.size,
+            sum(len(entry.value) for entry in memory_cache.entries.values()),
+        )
+        self.assertTrue(memory_cache.size <= 4096)
+
+
+class TestCacheEvict(unittest.TestCase):
+    def _test_evict(self, test_cache, values):
+        test_cache.set("expires", "foo", time=10)
+        test_cache.set("reset", "bar", time=10)
+        test_cache.set("permanent", "baz")
+        test_cache.set("reset", "bar", time=60000)
+        time.sleep(0.02)
+        self.assertEqual(test_cache.evict(), 1)
+        self.assertEqual(len(values), 2)
+        self.assertEqual(test_cache.get("reset"), "bar")
+        self.assertEqual(test_cache.get("permanent"), "baz")
+        self.assertEqual(test_cache.evict(), 0)
+
+    def test_dict(self):
+        """Test dict cache evicts expired values"""
+        dict_cache = cache.dictcache.DictCache("test", "")
+        self._test_evict(dict_cache, dict_cache.values)
+
+    def test_memory(self):
+        """Test memory cache evicts expired values"""
+        memory_cache = cache.memorycache.MemoryCache("test", "")
+        self._test_evict(memory_cache, memory_cache.entries)
+        self.assertEqual(
+            memory_cache.size,
+            sum(len(entry.value) for entry in memory_cache.entries.values()),
+        )
+
+    def test_evict_caches(self):
+        """Test caches are evicted according to their interval"""
+        from moya.archive import Archive
+        from moya.settings import SettingsSectionContainer
+
+        archive = Archive()
+        archive.init_cache(
+            "test", SettingsSectionContainer({"type": "dict", "evict_interval": "1h"})
+        )
+        archive.init_cache("files", SettingsSectionContainer({"type": "disabled"}))
+        test_cache = archive.get_cache("test")
+        self.assertEqual(archive.get_cache_evict_interval(), 60 * 60)
+        test_cache.set("key", "foo", time=1)
+        time.sleep(0.01)
+        archive.evict_caches()
+        self.assertFalse(test_cache.values)
+        test_cache.set("key", "foo", time=1)
+        time.sleep(0.01)
+        # Not due to be evicted again
+        archive.evict_caches()
+        self.assertTrue(test_cache.values)
+
+        self.assertEqual(test_cache.get_stats()["evictions"], 1)
+
+
+class TestCacheStats(unittest.TestCase):
+    def setUp(self):
+        self.cache = cache.memorycache.MemoryCache("test", "", size=1024)
+
+    def test_counters(self):
+        """Test cache stats count hits, misses and sets"""
+        test_cache = self.cache
+        test_cache.set("foo", "bar")
+        test_cache.set_many({"a": 1, "b": 2})
+        self.assertEqual(test_cache.get("foo"), "bar")
+        self.assertEqual(test_cache.get("nothere", "default"), "default")
+        self.assertEqual(
+            test_cache.get_many(["a", "b", "c"]), {"a": 1, "b": 2, "c": None}
+        )
+        test_cache.delete("foo")
+        stats = test_cache.get_stats()
+        self.assertEqual(stats["name"], "test")
+        self.assertEqual(stats["type"], "memory")
+        self.assertEqual(stats["hits"], 3)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["sets"], 3)
+        self.assertEqual(stats["deletes"], 1)
+        self.assertEqual(stats["hit_ratio"], 0.6)
+        self.assertTrue(stats["bytes_written"] > 0)
+        self.assertTrue(stats["bytes_read"] > 0)
+        self.assertEqual(stats["get_latency"]["count"], 3)
+        self.assertEqual(stats["set_latency"]["count"], 2)
+        test_cache.reset_stats()
+        self.assertEqual(test_cache.get_stats()["hits"], 0)
+
+    def test_tagged_miss(self):
+        """Test values with invalidated tags are counted as misses"""
+        test_cache = self.cache
+        test_cache.set("foo", "bar", tags=["t"])
+        self.assertEqual(test_cache.get("foo"), "bar")
+        test_cache.invalidate_tag("t")
+        self.assertEqual(test_cache.get("foo"), None)
+        stats = test_cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_evictions(self):
+        """Test values reclaimed from a full cache are counted as evictions"""
+        test_cache = self.cache
+        for n in range(10):
+            test_cache.set("key{}".format(n), "x" * 200)
+        self.assertTrue(test_cache.get_stats()["evictions"] > 0)
+
+    def test_hot_keys(self):
+        """Test the most read keys are tracked"""
+        test_cache = self.cache
+        test_cache.stats.hot_keys = cache.stats.HotKeys(capacity=4, sample_interval=1)
+        test_cache.set("hot", "foo")
+        for n in range(100):
+            test_cache.get("hot")
+            test_cache.get("cold{}".format(n))
+        hot_keys = test_cache.get_stats(top=2)["hot_keys"]
+        self.assertEqual(len(hot_keys), 2)
+        self.assertEqual(hot_keys[0], ["hot", 100])
+
+    def test_latency_histogram(self):
+        """Test latency percentiles"""
+        histogram = cache.stats.LatencyHistogram()
+        for ms in [0.05] * 90 + [3.0] * 9 + [2000.0]:
+            histogram.record(ms)
+        self.assertEqual(histogram.percentile(50), 0.1)
+        self.assertEqual(histogram.percentile(99), 5.0)
+        self.assertEqual(histogram.percentile(100), 2000.0)
+        self.assertEqual(histogram.to_dict()["count"], 100)
+
+    def test_debug_wrapper(self):
+        """Test the debug wrapper shares the stats of the wrapped cache"""
+        debug_cache = cache.base.DebugCacheWrapper(self.cache)
+        debug_cache.get("foo")
+        self.assertEqual(debug_cache.get_stats()["misses"], 1)
+
+
+class TestCachePrefetch(unittest.TestCase):
+    def test_prefetch(self):
+        """Test remembered cache keys are read in a single call"""
+        from moya.cache.prefetch import CacheKeys, get_prefetched
+        from moya.context import Context
+
+        class CountingCache(cache.dictcache.DictCache):
+            gets = 0
+
+            def _get(self, key, default):
+                self.gets += 1
+                return super(CountingCache, self)._get(key, default)
+
+        counting_cache = CountingCache("test", "")
+        counting_cache.set("a", "A")
+        cache_keys = CacheKeys(min_renders=2)
+        get_cache = lambda name: counting_cache
+        cache_keys.add("test", "a")
+        cache_keys.add("test", "b")
+        # Keys are only prefetched once they have been read on two renders
+        self.assertEqual(cache_keys.prefetch(Context(), get_cache), 0)
+        cache_keys.add("test", "a")
+        cache_keys.add("test", "b")
+        cache_keys.add("test", "c")
+        context = Context()
+        self.assertEqual(cache_keys.prefetch(context, get_cache), 2)
+        self.assertEqual(counting_cache.gets, 0)
+        self.assertEqual(get_prefetched(context, "test", counting_cache, "a"), "A")
+        self.assertEqual(get_prefetched(context, "test", counting_cache, "b", 1), 1)
+        self.assertEqual(counting_cache.gets, 0)
+        # Prefetched values are only used once
+        self.assertEqual(get_prefetched(context, "test", counting_cache, "a"), "A")
+        self.assertEqual(counting_cache.gets, 1)
+
+        # Keys that weren't read on the previous render are not prefetched
+        cache_keys.add("test", "a")
+        self.assertEqual(cache_keys.prefetch(Context(), get_cache), 1)
+        self.assertEqual(cache_keys.prefetch(Context(), get_cache), 0)
+
+    def test_prefetch_writes(self):
+        """Test prefetched values are discarded when the cache is written to"""
+        from moya.cache.prefetch import CacheKeys, get_prefetched
+        from moya.context import Context
+
+        dict_cache = cache.dictcache.DictCache("test", "")
+        dict_cache.set("a", "A", tags=["t"])
+        dict_cache.set("b", "B")
+        dict_cache.set("c", "C")
+        cache_keys = CacheKeys(min_renders=1)
+        for key in "abc":
+            cache_keys.add("test", key)
+        get_cache = lambda name: dict_cache
+
+        context = Context()
+        cache_keys.prefetch(context, get_cache)
+        dict_cache.set("b", "B2")
+        self.assertEqual(get_prefetched(context, "test", dict_cache, "b"), "B2")
+
+        context = Context()
+        cache_keys.prefetch(context, get_cache)
+        dict_cache.delete("c")
+        self.assertEqual(get_prefetched(context, "test", dict_cache, "c"), None)
+
+        context = Context()
+        cache_keys.prefetch(context, get_cache)
+        dict_cache.invalidate_tag("t")
+        self.assertEqual(get_prefetched(context, "test", dict_cache, "a"), None)
+
+
+class TestCacheFill(unittest.TestCase):
+    def setUp(self):
+        self.cache = cache.dictcache.DictCache("test", "")
+
+    def test_single_flight(self):
+        """Test only one thread computes a missing value"""
+        import threading
+        from moya.cache.stampede import CacheFill
+
+        computed = []
+        results = []
+
+        def worker():
+            fill = CacheFill(self.cache, "key", time=60000)
+            value = fill.get(None)
+            if value is None:
+                time.sleep(0.1)
+                computed.append(1)
+                value = "value"
+                fill.set(value)
+            results.append(value)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(results, ["value"] * 8)
+        self.assertFalse(self.cache.contains("key._lock"))
+
+    def test_stale(self):
+        """Test stale values are returned while a value is recomputed"""
+        from moya.cache.stampede import CacheFill
+
+        fill = CacheFill(self.cache, "key", time=10, stale=60000)
+        self.assertEqual(fill.get(None), None)
+        fill.set("old")
+        time.sleep(0.02)
+        refresh = CacheFill(self.cache, "key", time=10, stale=60000)
+        self.assertEqual(refresh.get(None), None)
+        # Another request gets the stale value
+        self.assertEqual(
+            CacheFill(self.cache, "key", time=10, stale=60000).get(None), "old"
+        )
+        refresh.set("new")
+        self.assertEqual(CacheFill(self.cache, "key", time=10).get(None), "new")
+
+    def test_release(self):
+        """Test a released lock may be acquired again"""
+        from moya.cache.stampede import CacheFill
+
+        fill = CacheFill(self.cache, "key", time=60000)
+        self.assertEqual(fill.get(None), None)
+        fill.release()
+        fill = CacheFill(self.cache, "key", time=60000)
+        self.assertTrue(fill.acquire())
+        fill.release()
+
+    def test_invalidated_while_computing(self):
+        """Test a value computed while its tags were invalidated isn't returned"""
+        from moya.cache.stampede import CacheFill
+
+        fill = CacheFill(self.cache, "key", tags=["t"])
+        self.assertEqual(fill.get(None), None)
+        self.cache.invalidate_tag("t")
+        fill.set("old")
+        self.assertEqual(CacheFill(self.cache, "key", tags=["t"]).get(None), None)
@@ -28,6 +28,33 @@ class TestCalls(unittest.TestCase):
         self.assert_(self.context.root["called"])
         self.assertEqual(self.context[".result"], 123)
 
+    def test_cache_tags(self):
+        """Test invalidating cached return values"""
+        self.archive("moya.tests#test_cache_tags", self.context, None)
+        self.assertEqual(self.context[".first"], 1)
+        self.assertEqual(self.context[".second"], 1)
+        self.assertEqual(self.context[".third"], 1)
+        self.assertEqual(self.context[".fourth"], 2)
+
+    def test_cache_stats(self):
+        """Test getting cache statistics"""
+        self.archive("moya.tests#test_cache_stats", self.context, None)
+        stats = self.context[".stats"]
+        self.assertEqual(list(stats.keys()), ["runtime"])
+        self.assertEqual(stats["runtime"]["hits"], 1)
+        self.assertTrue(stats["runtime"]["misses"] >= 1)
+        self.assertTrue(len(stats["runtime"]["hot_keys"]) <= 1)
+
+    def test_lru_stats(self):
+        """Test getting statistics for internal caches"""
+        self.archive.get_template_lib("notatemplate")
+        self.archive("moya.tests#test_lru_stats", self.context, None)
+        stats = self.context[".lru_stats"]
+        # No server in this context, so there are no route statistics
+        self.assertEqual(list(stats.keys()), ["signals", "sites", "template_libs"])
+        self.assertEqual(stats["template_libs"]["misses"], 1)
+        self.assertIn("hit_ratio", stats["signals"])
+
     def test_moya_call_lazy(self):
         """Test lazy moya calls"""
         self.archive("moya.tests#test_moya_call_lazy", self.context, None)
@@ -0,0 +1,62 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import unittest
+import time
+
+from moya.containers import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_lru(self):
+        """Test least recently used items are discarded"""
+        cache = LRUCache(3)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache["c"] = 3
+        self.assertEqual(cache["a"], 1)
+        cache["d"] = 4
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn("b", cache)
+        self.assertEqual(sorted(cache.keys()), ["a", "c", "d"])
+        self.assertEqual(cache.get("b", "missing"), "missing")
+        stats = cache.get_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_bounded(self):
+        """Test caches are always bounded"""
+        cache = LRUCache()
+        self.assertEqual(cache.cache_size, LRUCache.default_size)
+        cache = LRUCache(1000, shards=8)
+        for n in range(5000):
+            cache[n] = n
+        self.assertTrue(len(cache) <= 1000)
+        self.assertEqual(cache[4999], 4999)
+        with self.assertRaises(ValueError):
+            LRUCache(0)
+
+    def test_ttl(self):
+        """Test items expire"""
+        cache = LRUCache(10, ttl=0.01)
+        cache["a"] = 1
+        self.assertEqual(cache["a"], 1)
+        time.sleep(0.02)
+        self.assertNotIn("a", cache)
+        with self.assertRaises(KeyError):
+            cache["a"]
+        self.assertEqual(cache.get_stats()["expired"], 1)
+
+    def test_dict(self):
+        """Test dictionary methods"""
+        cache = LRUCache(10)
+        cache["a"] = 1
+        cache["a"] = 2
+        self.assertEqual(cache.items(), [("a", 2)])
+        self.assertEqual(cache.pop("a"), 2)
+        self.assertEqual(cache.pop("a", None), None)
+        self.assertFalse(cache)
+        cache["b"] = 3
+        del cache["b"]
+        self.assertEqual(len(cache), 0)
@@ -439,6 +439,84 @@ class TestContext(unittest.TestCase):
             for expression, result in tests:
                 self.assertEqual(c.eval(expression), result)
 
+    def test_compiled_expressions(self):
+        """Test expressions compiled to Python match the evaluator tree"""
+        from moya.context.expression import Expression
+        from moya.context.expressioncompiler import PythonCompiler
+
+        c = Context()
+        c["foo"] = dict(a=1, b=[1, 2, 3], c=dict(d="deep"))
+        c["word"] = "apples"
+        c["n"] = 5
+        c["filter"] = dict(double=lambda v: v * 2)
+
+        tests = [
+            "1+2*3",
+            "-n",
+            "not n",
+            "n > 3",
+            "n >= 10",
+            "1 < 2 < 3",
+            "3 > 2 > 1",
+            "'a' + 'b' + word",
+            "word * 2",
+            "n / 2",
+            "n // 2",
+            "n % 3",
+            "n bitand 1",
+            "foo.b[1]",
+            "foo.b[1:]",
+            "foo.b[::-1]",
+            "foo['c']['d']",
+            "foo.c.d[0]",
+            "(foo).c.d",
+            "word::'>10'",
+            "n ? 'yes' : 'no'",
+            "True ? n : 0",
+            "[1, n, 3]",
+            "{'a': n}",
+            "a=1, b=n",
+            "upper:word",
+            "len:foo.b",
+            "list:1..n",
+            "list:1...n",
+            "`n + 1`(n=3)",
+            "n is None",
+            "n is not None",
+            "n in foo.b",
+            "1 in foo.b",
+            "'5' instr [1, 5]",
+            "word matches /^app/",
+            "'x.html' fnmatches '*.html'",
+            "n or 0",
+            "0 or n",
+            "n and 0 and 1",
+            "n|filter.double",
+            "3|filter.double|filter.double",
+            "1h",
+            "$$",
+            "missing:nothere",
+        ]
+
+        compile_python = Expression.compile_python
+        try:
+            for expression in tests:
+                Expression.compile_python = False
+                tree_result = Expression(expression).eval(c)
+                Expression.compile_python = True
+                compiled_result = Expression(expression).eval(c)
+                self.assertEqual(tree_result, compiled_result)
+        finally:
+            Expression.compile_python = compile_python
+
+        # Constant expressions are folded at compile time
+        for expression, result in [("1+2*3", 7), ("'a' + 'b'", "ab"), ("1<2", True)]:
+            compiled_exp = Expression.compile_cache(expression)
+            compiler = PythonCompiler(expression)
+            source = compiled_exp[0].compile_python(compiler)
+            self.assert_(compiler.is_const(source))
+            self.assertEqual(compiler.constants[source], result)
+
     def test_set_lazy(self):
         """Test lazy evaluation"""
         c = Context()
@@ -552,3 +630,68 @@ class TestContext(unittest.TestCase):
         value = c.pop_stack("content")
         self.assertEqual(value, "foo")
         self.assert_(c[".content"] is None)
+
+
+class TestExpressionCache(unittest.TestCase):
+    def test_bounded(self):
+        """Test expression cache discards old items"""
+        from moya.context.expressioncache import ExpressionCache
+
+        cache = ExpressionCache(max_size=3)
+        for n in range(5):
+            self.assertEqual(cache.get(n, lambda k: k * 2), n * 2)
+        self.assertEqual(len(cache), 3)
+        self.assert_(0 not in cache)
+        self.assert_(4 in cache)
+        self.assertEqual(cache.get(4, lambda k: None), 8)
+        stats = cache.get_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 5)
+        self.assertEqual(stats["evictions"], 2)
+
+    def test_file(self):
+        """Test saving and mapping an expression cache file"""
+        import os
+        import shutil
+        import tempfile
+        from moya.context.expressioncache import ExpressionCache
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "expressions.bin")
+            cache = ExpressionCache()
+            self.assertFalse(cache.open_file(path, 1))
+            cache.get("foo", lambda k: [k, 1])
+            cache.get("bar", lambda k: [k, 2])
+            self.assertEqual(cache.save_file(path, 1), 2)
+
+            cache = ExpressionCache()
+            self.assertFalse(cache.open_file(path, 2))
+            self.assert_(cache.open_file(path, 1))
+            self.assertEqual(cache.get("foo", lambda k: None), ["foo", 1])
+            self.assertEqual(cache.get_stats()["loads"], 1)
+            # Unused expressions in the mapped file are kept when saving
+            self.assertEqual(cache.save_file(path, 1), 2)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_expression_file(self):
+        """Test expressions are loaded from a cache file"""
+        import os
+        import shutil
+        import tempfile
+        from moya.context.expression import Expression
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "expressions.bin")
+            Expression.compile_cache("1 + 2 + _cached")
+            self.assert_(Expression.dump_file(path))
+            Expression.exp_cache.clear()
+            Expression.python_cache.clear()
+            self.assert_(Expression.load_file(path))
+            c = Context({"_cached": 3})
+            self.assertEqual(c.eval("1 + 2 + _cached"), 6)
+        finally:
+            Expression.exp_cache.close_file()
+            shutil.rmtree(tmp_dir)
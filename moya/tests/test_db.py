@@ -7,12 +7,20 @@ from moya.build import build_server
 from moya import db
 
 import os
+import shutil
 from os.path import dirname, join, abspath
 
 curdir = dirname(abspath(__file__))
 
 from moya.console import Console
 from moya import pilot
+from moya import dbpool
+from moya import errors
+
+import sqlite3
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
 
 
 class TestDB(unittest.TestCase):
@@ -66,6 +74,200 @@ class TestDB(unittest.TestCase):
         obj = self.archive.call("dbtest#get_by_title", context, None, title="Zen 2")
         self.assertEqual(obj.id, 2)
 
+    def test_lazy_sessions(self):
+        """Test sessions are only ended if used, and only committed with writes"""
+        context = self.context
+        dbsession = context["._dbsessions"]["example"]
+        self.assertFalse(dbsession.used)
+        self.assertEqual(db.commit_sessions(context), 0)
+        self.assertFalse(dbsession.used)
+
+        obj = self.archive.call("dbtest#get_by_id", context, None, id=1)
+        self.assertTrue(dbsession.used)
+        self.assertTrue(dbsession.active)
+        self.assertFalse(dbsession.has_writes)
+        stats = db.get_session_stats(context)["example"]
+        self.assertEqual(stats["begins"], 1)
+        self.assertTrue(stats["queries"] >= 1)
+        self.assertEqual(db.commit_sessions(context), 0)
+        self.assertFalse(dbsession.used)
+
+        obj = self.archive.call("dbtest#get_by_id", context, None, id=1)
+        obj.title = "Changed"
+        self.assertTrue(dbsession.has_writes)
+        self.assertEqual(db.commit_sessions(context), 1)
+        obj = self.archive.call("dbtest#get_by_id", context, None, id=1)
+        self.assertEqual(obj.title, "Changed")
+
+    def test_savepoints(self):
+        """Test writes are committed after a savepoint is released or rolled back"""
+        call = self.archive.call
+
+        def get_context():
+            context = self.base_context.clone()
+            context.root["_dbsessions"] = db.get_session_map(self.archive)
+            return context
+
+        context = get_context()
+        dbsession = context["._dbsessions"]["example"]
+        obj = call("dbtest#get_by_id", context, None, id=1)
+        obj.title = "Outer"
+        dbsession.flush()
+        dbsession.begin_nested()
+        obj = call("dbtest#get_by_id", context, None, id=2)
+        obj.title = "Released"
+        dbsession.commit()
+        self.assertTrue(dbsession.active)
+        self.assertTrue(dbsession.has_writes)
+        self.assertTrue(dbsession.end())
+
+        context = get_context()
+        dbsession = context["._dbsessions"]["example"]
+        self.assertEqual(call("dbtest#get_by_id", context, None, id=1).title, "Outer")
+        self.assertEqual(
+            call("dbtest#get_by_id", context, None, id=2).title, "Released"
+        )
+        obj = call("dbtest#get_by_id", context, None, id=3)
+        obj.title = "Outer"
+        dbsession.flush()
+        dbsession.begin_nested()
+        obj = call("dbtest#get_by_id", context, None, id=4)
+        obj.title = "Rolled back"
+        dbsession.flush()
+        dbsession.rollback()
+        self.assertTrue(dbsession.active)
+        self.assertTrue(dbsession.has_writes)
+        self.assertTrue(dbsession.end())
+
+        context = get_context()
+        self.assertEqual(call("dbtest#get_by_id", context, None, id=3).title, "Outer")
+        self.assertEqual(call("dbtest#get_by_id", context, None, id=4).title, "Zen 4")
+        db.commit_sessions(context)
+
+    def test_query_cache(self):
+        """Test query results are cached, until a table changes"""
+        call = self.archive.call
+
+        def get_context():
+            context = self.base_context.clone()
+            context.root["_dbsessions"] = db.get_session_map(self.archive)
+            return context
+
+        context = get_context()
+        obj = call("dbtest#cached_get_by_id", context, None, id=1)
+        self.assertEqual(obj.title, "Zen 1")
+        results, count, titles = call("dbtest#cached_query", context, None)
+        self.assertEqual(count, 6)
+        self.assertEqual(db.get_session_stats(context)["example"]["cache_hits"], 0)
+        db.commit_sessions(context)
+
+        context = get_context()
+        obj = call("dbtest#cached_get_by_id", context, None, id=1)
+        self.assertEqual(obj.title, "Zen 1")
+        results, count, titles = call("dbtest#cached_query", context, None)
+        self.assertEqual([result.id for result in results], [1, 2, 3, 4, 5, 6])
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results.first.title, "Zen 1")
+        self.assertEqual(count, 6)
+        self.assertEqual(titles[-1], "Zen 6")
+        stats = db.get_session_stats(context)["example"]
+        self.assertEqual(stats["cache_hits"], 4)
+        self.assertEqual(stats["begins"], 0)
+        # Cached objects are in the session, and may be changed
+        obj.title = "Changed"
+        self.assertEqual(db.commit_sessions(context), 1)
+
+        context = get_context()
+        obj = call("dbtest#cached_get_by_id", context, None, id=1)
+        self.assertEqual(obj.title, "Changed")
+        call("dbtest#create_zen", context, None, title="Zen 7")
+        db.commit_sessions(context)
+
+        context = get_context()
+        results, count, titles = call("dbtest#cached_query", context, None)
+        self.assertEqual(count, 7)
+        self.assertEqual(titles[-1], "Zen 7")
+        self.assertEqual(db.get_session_stats(context)["example"]["cache_hits"], 0)
+        db.commit_sessions(context)
+
+    @unittest.skipUnless(
+        db.LAZY_LOAD_DETECTION, "lazy loads can't be detected with this SQLAlchemy"
+    )
+    def test_prefetch(self):
+        """Test relationships are loaded without a query per object"""
+        context = self.context
+        call = self.archive.call
+        for _ in range(3):
+            call("dbtest#make_post", context, None)
+
+        def get_lazy_loads(**let):
+            context = self.base_context.clone()
+            context.root["_dbsessions"] = db.get_session_map(self.archive)
+            dbsession = context["._dbsessions"]["example"]
+            dbsession.lazy_load_warn = 2
+            image_names = call("dbtest#get_posts", context, None, **let)
+            self.assertEqual(image_names, ["images1"] * 3)
+            lazy_loads = dbsession.get_lazy_loads()
+            db.commit_sessions(context)
+            return lazy_loads
+
+        relationship = "moya.test.dbtest#Post.images"
+        self.assertEqual(get_lazy_loads(prefetch="", joinload=""), {relationship: 3})
+        self.assertEqual(
+            get_lazy_loads(prefetch="images", joinload=""), {relationship: 1}
+        )
+        self.assertEqual(get_lazy_loads(prefetch="", joinload="images"), {})
+
+    def test_prefetch_bad_relationship(self):
+        """Test loading an unknown relationship throws"""
+        with self.assertRaises(errors.LogicError):
+            self.archive.call(
+                "dbtest#get_posts", self.context, None, prefetch="nope", joinload=""
+            )
+
+    def test_prefetch_cached(self):
+        """Test loading relationships may not be combined with the query cache"""
+        with self.assertRaises(errors.LogicError) as raised:
+            self.archive.call("dbtest#get_posts_cached", self.context, None)
+        self.assertEqual(raised.exception.original.type, "bad-value.cache-eager-load")
+
+    def test_query_cache_savepoints(self):
+        """Test cached queries are invalidated on the outermost commit only"""
+        call = self.archive.call
+
+        def get_context():
+            context = self.base_context.clone()
+            context.root["_dbsessions"] = db.get_session_map(self.archive)
+            return context
+
+        context = get_context()
+        call("dbtest#cached_get_by_id", context, None, id=5)
+        db.commit_sessions(context)
+
+        context = get_context()
+        dbsession = context["._dbsessions"]["example"]
+        obj = call("dbtest#get_by_id", context, None, id=5)
+        obj.title = "Changed"
+        dbsession.flush()
+        dbsession.begin_nested()
+        obj = call("dbtest#get_by_id", context, None, id=6)
+        obj.title = "Rolled back"
+        dbsession.flush()
+        dbsession.rollback()
+        dbsession.begin_nested()
+        obj = call("dbtest#get_by_id", context, None, id=4)
+        obj.title = "Released"
+        dbsession.commit()
+        # Not invalidated until the changes are committed
+        self.assertTrue(dbsession.session.info["tables"])
+        self.assertTrue(dbsession.end())
+
+        context = get_context()
+        obj = call("dbtest#cached_get_by_id", context, None, id=5)
+        self.assertEqual(obj.title, "Changed")
+        self.assertEqual(db.get_session_stats(context)["example"]["cache_hits"], 0)
+        db.commit_sessions(context)
+
     def test_owner(self):
         """Test object ownership"""
         context = self.context
@@ -128,3 +330,157 @@ class TestDB(unittest.TestCase):
 
             images = call("dbtest#get_images", context, None, name="images1")
             assert not images, "images should have been deleted"
+
+
+class TestDBReplicas(unittest.TestCase):
+    # SQLite paths are relative to the project
+    paths = [
+        join(curdir, "dbtest", filename)
+        for filename in (
+            "dbtest_primary.sqlite",
+            "dbtest_replica1.sqlite",
+            "dbtest_replica2.sqlite",
+        )
+    ]
+
+    def setUp(self):
+        self.tearDown()
+        build_result = build_server(join(curdir, "dbtest/"), "replicas.ini")
+        self.archive = archive = build_result.archive
+        self.base_context = build_result.context
+        archive.populate_context(self.base_context)
+        db.sync_all(archive, Console())
+        context = self.get_context()
+        archive.call("dbtest#setup", context, None, id=1)
+        db.commit_sessions(context)
+        # Simulate replication
+        for replica_path in self.paths[1:]:
+            shutil.copyfile(self.paths[0], replica_path)
+
+    def tearDown(self):
+        for path in self.paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_context(self):
+        context = self.base_context.clone()
+        context.root["_dbsessions"] = db.get_session_map(self.archive)
+        return context
+
+    def test_choose_replica(self):
+        """Test replicas are chosen round robin"""
+        engine = self.archive.database_engines["example"]
+        self.assertEqual(len(engine.replicas), 2)
+        first = engine.choose_replica()
+        second = engine.choose_replica()
+        self.assertNotEqual(first, second)
+        self.assertEqual(engine.choose_replica(), first)
+        engine.replica_select = "leastload"
+        self.assertIn(engine.choose_replica(), engine.replicas)
+
+    def test_routing(self):
+        """Test reads go to a replica until there is a write"""
+        call = self.archive.call
+
+        # Change the primary only
+        context = self.get_context()
+        dbsession = context["._dbsessions"]["example"]
+        dbsession.use_primary()
+        obj = call("dbtest#get_by_id", context, None, id=1)
+        obj.title = "Primary"
+        self.assertEqual(db.commit_sessions(context), 1)
+
+        context = self.get_context()
+        dbsession = context["._dbsessions"]["example"]
+        self.assertFalse(call("dbtest#get_by_title", context, None, title="Primary"))
+        self.assertFalse(dbsession.using_primary)
+
+        # Read after write goes to the primary
+        obj = call("dbtest#get_by_id", context, None, id=2)
+        obj.title = "Changed"
+        dbsession.flush()
+        self.assertTrue(dbsession.using_primary)
+        self.assertTrue(call("dbtest#get_by_title", context, None, title="Primary"))
+        self.assertEqual(db.commit_sessions(context), 1)
+
+        context = self.get_context()
+        self.assertFalse(call("dbtest#get_by_title", context, None, title="Changed"))
+        db.commit_sessions(context)
+
+    def test_pool_state(self):
+        """Test pool state is reported for the primary and replicas"""
+        engine = self.archive.database_engines["example"]
+        states = engine.get_pool_state()
+        self.assertEqual(
+            [state["name"] for state in states],
+            ["example", "example:replica1", "example:replica2"],
+        )
+        self.assertTrue(states[0]["checkouts"] >= 1)
+        self.assertTrue(states[0]["connects"] >= 1)
+        self.assertEqual(states[0]["in_use"], 0)
+
+
+class TestDBPool(unittest.TestCase):
+    def make_pool(self, lifo=False):
+        stats = dbpool.PoolStats("test", max_overflow=0)
+        pool_class = dbpool.make_pool_class(QueuePool, stats, lifo=lifo)
+        pool = pool_class(
+            lambda: sqlite3.connect(":memory:"), pool_size=2, max_overflow=0, timeout=0.01
+        )
+        return pool, stats
+
+    def test_read_pool_settings(self):
+        """Test reading pool settings"""
+        settings = dbpool.read_pool_settings(
+            "test", {"pool_size": "5", "pool_timeout": "2.5", "pool_lifo": "yes"}
+        )
+        self.assertEqual(settings["pool_size"], 5)
+        self.assertEqual(settings["timeout"], 2.5)
+        self.assertEqual(settings["max_overflow"], None)
+        self.assertEqual(settings["recycle"], 3600)
+        self.assertTrue(settings["lifo"])
+        self.assertFalse(settings["pre_ping"])
+        with self.assertRaises(errors.StartupFailedError):
+            dbpool.read_pool_settings("test", {"pool_size": "lots"})
+
+    def test_timeout(self):
+        """Test checkout timeouts are counted"""
+        pool, stats = self.make_pool()
+        connections = [pool.connect(), pool.connect()]
+        with self.assertRaises(exc.TimeoutError):
+            pool.connect()
+        self.assertEqual(stats.timeouts, 1)
+        self.assertEqual(stats.checkout_latency.count, 3)
+        for connection in connections:
+            connection.close()
+
+    def test_lifo(self):
+        """Test a lifo pool returns the most recently used connection"""
+        for lifo in (False, True):
+            pool, stats = self.make_pool(lifo=lifo)
+            first = pool.connect()
+            second = pool.connect()
+            first_dbapi = first.connection
+            second_dbapi = second.connection
+            first.close()
+            second.close()
+            connection = pool.connect()
+            self.assertIs(
+                connection.connection, second_dbapi if lifo else first_dbapi
+            )
+            connection.close()
+
+    def test_engine(self):
+        """Test creating an engine with pool statistics"""
+        engine, stats = dbpool.create_pooled_engine("test", "sqlite://")
+        connection = engine.connect()
+        state = dbpool.get_pool_state(engine, stats)
+        self.assertEqual(state["in_use"], 1)
+        self.assertEqual(state["checkouts"], 1)
+        self.assertEqual(state["connects"], 1)
+        connection.close()
+        state = dbpool.get_pool_state(engine, stats)
+        self.assertEqual(state["in_use"], 0)
+        self.assertEqual(state["peak"], 1)
@@ -7,6 +7,7 @@ from fs.opener import open_fs
 from moya.context import Context
 from moya.archive import Archive
 from moya.console import Console
+from moya.cache.dictcache import DictCache
 
 from moya.tags import context, config
 
@@ -113,3 +114,45 @@ class TestLogic(unittest.TestCase):
         call = self.archive.call
         result = call("moya.tests#bf", context, None, program=BF_HELLO)
         self.assertEqual(result, "Hello World!\n")
+
+
+class _CountingCache(DictCache):
+    hits = 0
+
+    def _get(self, key, default):
+        value = super(_CountingCache, self)._get(key, default)
+        if value is not default:
+            self.hits += 1
+        return value
+
+
+class TestCachedLogic(TestLogic):
+    """Run the logic tests with documents loaded from the parser cache"""
+
+    def setUp(self):
+        path = os.path.abspath(os.path.dirname(__file__))
+        self.fs = open_fs(path)
+        self.context = Context()
+        self.context["console"] = Console()
+        parser_cache = _CountingCache("parser", "")
+        for _ in range(2):
+            self.archive = Archive()
+            self.archive.caches["parser"] = parser_cache
+            import_fs = self.fs.opendir("archivetest")
+            self.archive.load_library(import_fs)
+            self.archive.finalize()
+        self.assertTrue(parser_cache.values)
+        self.assertEqual(parser_cache.hits, len(parser_cache.values))
+
+    def test_cache_key(self):
+        """Test documents modified within the same second have a new cache key"""
+        from fs.memoryfs import MemoryFS
+        from moya.parser import Parser
+
+        mem_fs = MemoryFS()
+        mem_fs.settext("doc.xml", "<moya/>")
+        mem_fs.setinfo("doc.xml", {"details": {"modified": 1000000000.25}})
+        parser = Parser(self.archive, mem_fs, "doc.xml")
+        cache_key = parser.get_cache_key()
+        mem_fs.setinfo("doc.xml", {"details": {"modified": 1000000000.5}})
+        self.assertNotEqual(parser.get_cache_key(), cache_key)
@@ -77,3 +77,101 @@ class TestProject(unittest.TestCase):
             var="FOO",
         )
         assert "TEMPLATE VAR FOO" in html
+
+    def test_stream(self):
+        """Test a streamed response is rendered with the request's context"""
+        from webob import Request
+
+        request = Request.blank("/stream/")
+        response = request.get_response(self.application)
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(
+            response.text.strip(),
+            "<p>2016-03-14</p><p>&lt;streamer #1&gt;</p><p>streamer</p>",
+        )
+
+
+class TestRebuild(unittest.TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        _path = os.path.abspath(os.path.dirname(__file__))
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "testproject")
+        shutil.copytree(os.path.join(_path, "testproject"), self.path)
+        self.application = WSGIApplication(
+            self.path,
+            "settings.ini",
+            strict=True,
+            validate_db=False,
+            disable_autoreload=True,
+        )
+        db.sync_all(self.application.archive, Console())
+
+    def tearDown(self):
+        import shutil
+
+        del self.application
+        shutil.rmtree(self.temp_dir)
+
+    def _edit(self, path, old, new):
+        path = os.path.join(self.path, path)
+        with open(path, "rt") as f:
+            xml = f.read()
+        with open(path, "wt") as f:
+            f.write(xml.replace(old, new))
+        return path
+
+    def _get(self, url):
+        from webob import Request
+
+        return Request.blank(url).get_response(self.application)
+
+    def test_rebuild_documents(self):
+        """Test modified documents are rebuilt without rebuilding the project"""
+        archive = self.application.archive
+        self.assertEqual(self._get("/hello/").status_int, 404)
+        views_path = self._edit(
+            "site/logic/views.xml",
+            "</moya>",
+            """
+    <view libname="view.hello">
+        <serve-json obj="'hello'"/>
+    </view>
+    <handle signal="test.rebuilt" libname="handle.rebuilt"/>
+</moya>""",
+        )
+        mountpoints_path = self._edit(
+            "site/logic/mountpoints.xml",
+            "</mountpoint>",
+            """<url route="/hello/" view="#view.hello" name="hello" />
+    </mountpoint>""",
+        )
+        self.assertTrue(
+            self.application.rebuild_documents([views_path, mountpoints_path])
+        )
+        self.assertIs(self.application.archive, archive)
+
+        response = self._get("/hello/")
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.json, "hello")
+        # Existing routes still work
+        self.assertEqual(self._get("/stream/").status_int, 200)
+        self.assertEqual(
+            archive.signals.filter_handlers("test.rebuilt", None),
+            ["site.tests#handle.rebuilt"],
+        )
+
+    def test_rebuild_models(self):
+        """Test a document with models requires the project to be rebuilt"""
+        models_path = self._edit(
+            "site/logic/models.xml",
+            "</moya>",
+            """
+    <model libname="Rebuilt" xmlns="http://moyaproject.com/db">
+        <string name="name" length="30" />
+    </model>
+</moya>""",
+        )
+        self.assertFalse(self.application.rebuild_documents([models_path]))
@@ -0,0 +1,60 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import unittest
+from moya.context import Context
+from moya.sites import Sites
+
+
+class TestSites(unittest.TestCase):
+    def setUp(self):
+        self.sites = Sites()
+        self.sites.set_defaults({})
+        self.sites.add_from_section("{sub}.example.org", {"data-name": "${sub}"})
+        self.sites.add_from_section("www.example.org", {"data-name": "www"})
+        self.sites.add_from_section(
+            "admin.example.org", {"data-name": "admin", "priority": "-1"}
+        )
+        self.sites.add_from_section(
+            "*.example.com", {"data-name": "com", "priority": "1"}
+        )
+        self.sites.add_from_section("api.example.com", {"data-name": "api"})
+        self.context = Context()
+        self.context[".request"] = {"host_url": "http://example.org"}
+
+    def test_match(self):
+        """Test matching sites by domain"""
+        self.assertEqual(self.sites.match("www.example.org")["name"], "www")
+        self.assertEqual(self.sites.match("blog.example.org")["sub"], "blog")
+        # Lower priority than the wildcard
+        self.assertEqual(self.sites.match("admin.example.org")["sub"], "admin")
+        # Higher priority wildcard
+        self.assertEqual(self.sites.match("api.example.com")["name"], "com")
+        self.assertEqual(self.sites.match("example.net"), None)
+
+    def test_site_instance(self):
+        """Test site instances are substituted, and copied for each request"""
+        site = self.sites.match("blog.example.org", context=self.context)
+        self.assertEqual(site._data["name"], "blog")
+        self.assertEqual(site.host, "http://example.org")
+        site._data["name"] = "changed"
+        site2 = self.sites.match("blog.example.org", context=self.context)
+        self.assertIsNot(site2, site)
+        self.assertIsNot(site2._data, site._data)
+        self.assertEqual(site2._data["name"], "blog")
+        self.assertIs(site2.locale, site.locale)
+        self.assertEqual(
+            self.sites.match("news.example.org", context=self.context)._data["name"],
+            "news",
+        )
+        self.context[".request"] = {"host_url": "https://example.org"}
+        site = self.sites.match("blog.example.org", context=self.context)
+        self.assertEqual(site.host, "https://example.org")
+
+    def test_invalidate(self):
+        """Test adding sites invalidates the index"""
+        self.assertEqual(self.sites.match("www.example.net"), None)
+        self.sites.add("www.example.net", name="net")
+        self.assertEqual(self.sites.match("www.example.net")["name"], "net")
+        self.sites.clear()
+        self.assertEqual(self.sites.match("www.example.org"), None)
@@ -147,7 +147,102 @@ class TestTemplates(unittest.TestCase):
         result_html = "<ul><li>1</li><li>2</li><li>3</li></ul>"
         self.assertEqual(html, result_html)
 
+    def test_cache_tags(self):
+        """Test invalidating cached blocks by tag"""
+        html = self._render("cachetags.html", post_id="1", text="foo")
+        self.assertEqual(html, "foo")
+        html = self._render("cachetags.html", post_id="1", text="bar")
+        self.assertEqual(html, "foo")
+        self.archive.get_cache("fragment").invalidate_tag("post-2")
+        html = self._render("cachetags.html", post_id="1", text="bar")
+        self.assertEqual(html, "foo")
+        self.archive.get_cache("fragment").invalidate_tag("post-1")
+        html = self._render("cachetags.html", post_id="1", text="bar")
+        self.assertEqual(html, "bar")
+
     def test_whitespace(self):
         """Test syntax for whitespace removal"""
         html = self._render("whitespace.html")
         self.assertEqual(html, "12345")
+
+    def test_render_iter(self):
+        """Test streaming templates"""
+        from moya.template.moyatemplates import Template
+
+        template = Template("{% for n in 1..5 %}${n}{% endfor %}")
+        self.assertEqual(list(template.render_iter(chunk_size=1)), list("12345"))
+        self.assertEqual(list(template.render_iter(chunk_size=2)), ["12", "34", "5"])
+        fruits = ["apples", "oranges", "carrot", "pears"]
+        chunks = self.engine.render_iter("for.html", {"fruits": fruits}, chunk_size=1)
+        self.assertEqual("".join(chunks), "I like apples, oranges, pears")
+        chunks = list(self.engine.render_iter("extendsappend.html", {}))
+        self.assertEqual(chunks, ["A\nB\n"])
+
+    def test_response_stream(self):
+        """Test closing a streamed response"""
+        from moya.response import ResponseStream
+
+        closed = []
+        stream = ResponseStream(
+            self.engine.render_iter("escape.html", {"text": "\u2603"}, chunk_size=1)
+        )
+        stream.on_close(closed.append, True)
+        self.assertEqual(b"".join(stream), "\u2603".encode("utf-8"))
+        stream.close()
+        stream.close()
+        self.assertEqual(closed, [True])
+
+
+class TestCompiledTemplates(TestTemplates):
+    """Run the template tests with templates compiled to Python"""
+
+    def setUp(self):
+        super(TestCompiledTemplates, self).setUp()
+        self.engine = MoyaTemplateEngine(self.archive, self.fs, {"compile": True})
+
+    def _render(self, *template_paths, **kwargs):
+        html = self.engine.render(template_paths, kwargs)
+        template = self.engine.env.get_template(template_paths[0])
+        self.assertTrue(template.compiled)
+        self.assertIsNotNone(template._render_function)
+        return html
+
+    def test_nested(self):
+        """Test compiled loops, conditionals and fallback nodes"""
+        from moya.template.moyatemplates import Template
+        from moya.template.environment import Environment
+
+        source = """{% for row in rows %}<tr>{% for c in row if c %}{% if c == 2 %}<b>${c}</b>{% elif c == 3 %}three{% else %}${c}{% endif %}{% endfor %}</tr>{% empty %}no rows{% endfor %}{% with n=5 %}${n}{% endwith %}{% let x=1 %}${x}"""
+        data = {"rows": [[1, 2, 0], [3, "<"]]}
+        interpreted = Template(source).render(
+            data, environment=Environment.make_default()
+        )
+        environment = Environment.make_default()
+        environment.compile = True
+        template = Template(source)
+        compiled = template.render(data, environment=environment)
+        self.assertIsNotNone(template._render_function)
+        self.assertEqual(
+            interpreted, "<tr>1<b>2</b></tr><tr>three&lt;</tr>51",
+        )
+        self.assertEqual(compiled, interpreted)
+        self.assertEqual(
+            template.render({"rows": []}, environment=environment), "no rows51"
+        )
+
+    def test_error(self):
+        """Test errors in compiled templates"""
+        from moya.template.moyatemplates import Template
+        from moya.template.environment import Environment
+        from moya.template.errors import TemplateError
+        from moya.context import Context
+
+        environment = Environment.make_default()
+        environment.compile = True
+        template = Template("{% for n in 1..3 %}\n${n / 0}{% endfor %}")
+        context = Context()
+        with self.assertRaises(TemplateError):
+            template.render(context=context, environment=environment)
+        self.assertEqual(context["._t_stack"], [])
+        self.assertEqual(context["._for_stack"], [])
+        self.assertNotIn("._for", context)
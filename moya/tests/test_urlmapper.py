@@ -97,3 +97,37 @@ class TestURLMapper(unittest.TestCase):
             self.mapper.get_route("/page/moya/edit/", "POST"),
             RouteMatch(dict(page="moya"), "editform", None),
         )
+
+    def testPriority(self):
+        """Test priority and final are respected by the route index"""
+        mapper = urlmapper.URLMapper()
+        mapper.map("/{*path}", "catchall")
+        mapper.map("/blog/{slug}/", "post")
+        mapper.map("/blog/new/", "new", priority=1, final=True)
+        mapper.map("/blog/post-{id}/", "shortlink")
+        self.assertEqual(
+            [match.target for match in mapper.iter_routes("/blog/new/")], ["new"]
+        )
+        self.assertEqual(
+            [match.target for match in mapper.iter_routes("/blog/post-5/")],
+            ["catchall", "post", "shortlink"],
+        )
+        self.assertEqual(
+            [match.target for match in mapper.iter_routes("/blog/")], ["catchall"]
+        )
+
+    def testIndex(self):
+        """Test routes added after a lookup are indexed"""
+        self.assertEqual(self.mapper.get_route("/about/"), None)
+        self.mapper.map("/about/", "about")
+        self.assertEqual(self.mapper.get_route("/about/"), RouteMatch({}, "about", None))
+        self.assertEqual(
+            self.mapper.get_route("/wiki/page/moya/"),
+            RouteMatch({"slug": "moya"}, "wikipage", None),
+        )
+        for n in range(500):
+            self.mapper.map("/section{}/{{integer:id}}/".format(n), n)
+        self.assertEqual(
+            self.mapper.get_route("/section250/7/"), RouteMatch({"id": 7}, 250, None)
+        )
+        self.assertEqual(self.mapper.get_route("/section250/seven/"), None)
@@ -336,6 +336,15 @@ def make_cache_key(key_data):
     return ".".join(key)
 
 
+def make_cache_tags(tags_data):
+    """Make a list of cache tags from a string, or a list of objects"""
+    if tags_data is None:
+        return []
+    if not isinstance(tags_data, (list, tuple, set)):
+        tags_data = [tags_data]
+    return sorted({make_cache_key(tag) for tag in tags_data})
+
+
 # http://en.wikibooks.org/wiki/Algorithm_Implementation/Strings/Levenshtein_distance#Python
 def levenshtein(seq1, seq2):
     """Levenshtein word distance"""
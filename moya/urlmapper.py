@@ -12,7 +12,7 @@ from .context.tools import to_expression
 import re
 import threading
 from collections import namedtuple, defaultdict
-from operator import attrgetter
+from operator import attrgetter, itemgetter
 from .compat import quote
 
 from pyparsing import Literal, QuotedString, Word, OneOrMore, printables, ParseException
@@ -356,16 +356,59 @@ class _NamedURLs(object):
         return len(params) - len(path_matched), url
 
 
+class _RouteIndex(object):
+    """A prefix tree of routes, keyed on the static path segments of each route.
+
+    A route can only match a URL that starts with the static text at the start of
+    the route (up to the first parameter or wildcard), so only routes on the path
+    through the tree for the URL's segments need to be parsed.
+
+    """
+
+    def __init__(self, routes):
+        # Each node is a tuple of (<child nodes>, <list of (position, route)>)
+        self.root = ({}, [])
+        for position, route in enumerate(routes):
+            node = self.root
+            for segment in route.static_prefix.split("/")[:-1]:
+                node = node[0].setdefault(segment, ({}, []))
+            node[1].append((position, route))
+
+    def __repr__(self):
+        return "<routeindex>"
+
+    def get_candidates(self, url, _get_position=itemgetter(0)):
+        """Get routes which may match the url, in the order they should be tried."""
+        children, routes = self.root
+        candidates = routes
+        for segment in url.split("/"):
+            try:
+                children, routes = children[segment]
+            except KeyError:
+                break
+            if routes:
+                if candidates:
+                    candidates = sorted(candidates + routes, key=_get_position)
+                else:
+                    candidates = routes
+        return [
+            route for _, route in candidates if url.startswith(route.static_prefix)
+        ]
+
+
 class URLMapper(object):
     def __init__(self, name=""):
         self.name = name
         self._routes = []
+        self._index = None
         self._route_cache = LRUCache(1000)
         self._named_routes = defaultdict(list)
         self._named_urls = None
         self._proxy = None
         self._insert_order = 0
         self._finalized = False
+        # Serializes changes to routes, which may happen while requests are served
+        self._lock = threading.Lock()
 
     def __repr__(self):
         if self.name:
@@ -396,11 +439,45 @@ class URLMapper(object):
 
     def finalize(self, _get_order=attrgetter("order")):
         """Finalize the url mapper (does sorting)"""
-        if not self._finalized:
-            self._finalized = True
-            self._routes.sort(key=_get_order)
+        if self._finalized:
+            return
+        with self._lock:
+            if self._finalized:
+                return
+            # Build in locals, so other threads never see a partial index
+            routes = sorted(self._routes, key=_get_order)
+            named_routes = defaultdict(list)
             for k, v in iteritems(self._named_routes):
-                v.sort(key=_get_order)
+                named_routes[k] = sorted(v, key=_get_order)
+            index = _RouteIndex(routes)
+            self._routes = routes
+            self._named_routes = named_routes
+            self._index = index
+            self._route_cache.clear()
+            self._finalized = True
+
+    def replace_routes(self, mapper, mappers=None):
+        """Replace the routes with those from another mapper.
+
+        `mappers` may map mounted mappers on to the mappers that should replace them.
+
+        """
+        routes = mapper._routes
+        for route in routes:
+            route.mapper = self
+            if mappers and route.partial:
+                route.target = mappers.get(route.target, route.target)
+        with self._lock:
+            self._routes = routes
+            self._named_routes = mapper._named_routes
+            self._insert_order = mapper._insert_order
+            self._named_urls = None
+            self._finalized = False
+
+    def clear_cache(self):
+        """Clear matched routes and named urls, if a mounted mapper has changed"""
+        self._route_cache.clear()
+        self._named_urls = None
 
     @property
     def named_urls(self):
@@ -436,10 +513,11 @@ class URLMapper(object):
             route.re_route
         except ParseException as e:
             raise ValueError("failed to parse route, {}".format(text_type(e).lower()))
-        self._routes.append(route)
-        if name is not None:
-            self._named_routes[name].append(route)
-        self._finalized = False
+        with self._lock:
+            self._routes.append(route)
+            if name is not None:
+                self._named_routes[name].append(route)
+            self._finalized = False
         return route
 
     def mount(self, url, mapper, defaults=None, name=None, priority=0):
@@ -459,10 +537,11 @@ class URLMapper(object):
             name=name,
             order=self._get_order(priority),
         )
-        if name is not None:
-            self._named_routes[name].append(route)
-        self._routes.append(route)
-        self._finalized = False
+        with self._lock:
+            if name is not None:
+                self._named_routes[name].append(route)
+            self._routes.append(route)
+            self._finalized = False
         return route
 
     def get_routes(self, name, default=Ellipsis):
@@ -477,19 +556,22 @@ class URLMapper(object):
             return route_match
         return None
 
+    def get_cache_stats(self):
+        """Get statistics for the cache of matched routes"""
+        return self._route_cache.get_stats()
+
     def iter_routes(self, url, method="GET", handler=None):
         """Yield any routes that match the url"""
 
         route_key = (url, method, handler)
+        self.finalize()
 
-        if route_key in self._route_cache:
+        try:
             route_matches = self._route_cache.lookup(route_key)
-
-        else:
-            self.finalize()
+        except KeyError:
             route_matches = []
             add_route_match = route_matches.append
-            for route in self._routes:
+            for route in self._index.get_candidates(url):
                 if route.match_method(method, handler):
                     if route.partial:
                         remaining_url, url_data = route.partial_parse(url)
@@ -582,6 +664,7 @@ class Route(object):
         self.handlers = [int(handler) for handler in self.handlers]
         self._tokens = None
         self._re_route = None
+        self._static_prefix = None
 
         self._lock = threading.Lock()
 
@@ -598,6 +681,18 @@ class Route(object):
             )
         return self._tokens
 
+    @property
+    def static_prefix(self):
+        """The text a URL must start with to match this route."""
+        if self._static_prefix is None:
+            prefix = []
+            for token_type, token in self.tokens:
+                if token_type == "extract" or token == "*":
+                    break
+                prefix.append(token)
+            self._static_prefix = "".join(prefix)
+        return self._static_prefix
+
     @classmethod
     def _split_pattern_name(cls, token):
         if ":" in token:
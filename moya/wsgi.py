@@ -14,12 +14,12 @@ from .tools import timer, lazystr
 from .logic import debug_lock, is_debugging
 from .logic import notify
 from .request import MoyaRequest, ReplaceRequest
-from .response import MoyaResponse
+from .response import MoyaResponse, is_streaming
 from . import http
 from .compat import text_type, itervalues, py2bytes
 from . import namespaces
 from .loggingconf import init_logging_fs
-from .context.expression import Expression
+from .scheduler import Scheduler
 
 
 from webob import Response
@@ -32,7 +32,7 @@ import io
 import gc
 import random
 from time import time, clock, sleep
-from threading import RLock
+from threading import RLock, Lock
 import weakref
 from collections import defaultdict
 from textwrap import dedent
@@ -90,14 +90,23 @@ if watchdog:
 
         def on_any_event(self, event):
             ext = splitext(event.src_path)[1].lower()
+            dest_path = getattr(event, "dest_path", None)
+            if dest_path:
+                dest_ext = splitext(dest_path)[1].lower()
+                if dest_ext in self.watch_types:
+                    # Editors may save by moving a temporary file over the original
+                    rebuild_all = ext in self.watch_types or dest_ext != ".xml"
+                    self.app.on_change(dest_path, rebuild_all=rebuild_all)
+                    return
             if ext not in self.watch_types:
                 return
-
-            if not self.app.rebuild_required:
-                log.info(
-                    "detected modification to project, rebuild will occur on next request"
-                )
-                self.app.rebuild_required = True
+            # A modified document may be rebuilt on its own, anything else requires
+            # the whole project to be rebuilt
+            rebuild_all = ext != ".xml" or event.event_type not in (
+                "modified",
+                "created",
+            )
+            self.app.on_change(event.src_path, rebuild_all=rebuild_all)
 
         @property
         def app(self):
@@ -176,6 +185,10 @@ class WSGIApplication(object):
         self.watching_fs = None
         self.rebuild_required = False
         self._new_build_lock = RLock()
+        self._changes_lock = Lock()
+        self._changed_documents = set()
+        self._rebuild_all = False
+        self._evict_lock = Lock()
         self.archive = None
         self._self = weakref.ref(self, self.on_close)
         self.simulate_slow_network = simulate_slow_network
@@ -219,6 +232,20 @@ class WSGIApplication(object):
                 )
                 self.watcher = ReloadChangeWatcher(open_fs(watch_location), self)
 
+        self.scheduler = None
+        evict_interval = self.archive.get_cache_evict_interval()
+        if evict_interval:
+            # Expired values are removed in the background, rather than waiting
+            # for them to be read again
+            self.scheduler = Scheduler()
+            self.scheduler.daemon = True
+            self.scheduler.add_repeat_task(
+                "evict-caches",
+                self.evict_caches,
+                repeat=max(Scheduler.poll_seconds, evict_interval),
+            )
+            self.scheduler.start()
+
     @classmethod
     def on_close(cls, application_weakref):
         # Called prior to Python finalizing the WSGIApplication, but before __del__
@@ -228,6 +255,18 @@ class WSGIApplication(object):
     def close(self):
         if self.watcher is not None:
             self.watcher.close()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    def evict_caches(self):
+        """Called by the scheduler to evict expired values from caches."""
+        # Skip if the previous eviction hasn't finished
+        if not self._evict_lock.acquire(False):
+            return
+        try:
+            self.archive.evict_caches()
+        finally:
+            self._evict_lock.release()
 
     def __repr__(self):
         return """<wsgiapplication {} {}>""".format(self.settings_path, self.server_ref)
@@ -244,6 +283,7 @@ class WSGIApplication(object):
                 master_settings=self.master_settings,
                 test_build=self.test_build,
                 develop=self.develop,
+                load_expression_cache=self.load_expression_cache,
             )
         if build_result is None:
             msg = "Failed to build project"
@@ -253,12 +293,6 @@ class WSGIApplication(object):
         self.archive.finalize()
         self.server = build_result.server
 
-        if self.load_expression_cache:
-            if self.archive.has_cache("parser"):
-                parser_cache = self.archive.get_cache("parser")
-                if Expression.load(parser_cache):
-                    log.debug("expression cache loaded")
-
         if self.post_build_hook is not None:
             try:
                 self.post_build_hook(self)
@@ -290,11 +324,48 @@ class WSGIApplication(object):
             fs=self.archive.get_context_filesystems(),
         )
 
+    def on_change(self, path, rebuild_all=False):
+        """Called by the watcher when a file in the project changes."""
+        with self._changes_lock:
+            if rebuild_all:
+                self._rebuild_all = True
+            else:
+                self._changed_documents.add(os.path.abspath(path))
+        if not self.rebuild_required:
+            log.info(
+                "detected modification to project, rebuild will occur on next request"
+            )
+            self.rebuild_required = True
+
+    def rebuild_documents(self, locations):
+        """Rebuild modified documents in place, return True if they were rebuilt."""
+        try:
+            with self._new_build_lock:
+                return self.archive.rebuild_documents(locations, server=self.server)
+        except Exception:
+            log.exception("failed to rebuild modified documents")
+            return False
+
     def do_rebuild(self):
         self.archive.console.div(
             "Re-building project due to changes", bold=True, fg="blue"
         )
 
+        with self._changes_lock:
+            changed_documents = self._changed_documents
+            rebuild_all = self._rebuild_all
+            self._changed_documents = set()
+            self._rebuild_all = False
+
+        if not rebuild_all and changed_documents:
+            if self.rebuild_documents(changed_documents):
+                self.rebuild_required = False
+                self.archive.console.div(
+                    "Modified documents rebuilt successfully", bold=True, fg="green"
+                )
+                return
+            log.info("unable to rebuild modified documents, rebuilding project")
+
         error_text = None
         try:
             new_build = build_server(
@@ -455,6 +526,10 @@ class WSGIApplication(object):
                 for k, v in root["headers"].items():
                     response.headers[k.encode("utf-8")] = v.encode("utf-8")
 
+            if is_streaming(response):
+                # The body is rendered after this block exits
+                response.app_iter.manage(pilot.manage_request, request, context)
+
         fire(
             context, "request.response", data={"request": request, "response": response}
         )
@@ -463,7 +538,11 @@ class WSGIApplication(object):
 
     def slow_iter(self, response_iter):
         """A generator that yields data slowly."""
-        response_file = io.BytesIO(b"".join(response_iter))
+        try:
+            response_file = io.BytesIO(b"".join(response_iter))
+        finally:
+            if hasattr(response_iter, "close"):
+                response_iter.close()
         while 1:
             chunk = response_file.read(16384)
             if not chunk:
@@ -471,6 +550,11 @@ class WSGIApplication(object):
             sleep(0.1)
             yield chunk
 
+    def end_request(self, context, response):
+        """Called when a response has been sent."""
+        self.archive.fire(context, "request.end", data={"response": response})
+        context.root = {}
+
     @memory_tracker
     def __call__(self, environ, start_response):
         """Build the request."""
@@ -506,17 +590,24 @@ class WSGIApplication(object):
             taken_ms,
         )
 
+        app_iter = response.app_iter
+        streaming = is_streaming(response)
         try:
             if request.method == "HEAD":
                 return []
             else:
                 if slow:
-                    return self.slow_iter(response.app_iter)
+                    return self.slow_iter(app_iter)
                 else:
-                    return response.app_iter
+                    return app_iter
         finally:
-            self.archive.fire(context, "request.end", data={"response": response})
-            context.root = {}
+            if streaming:
+                # The context is required until the response has been rendered
+                app_iter.on_close(self.end_request, context, response)
+                if request.method == "HEAD":
+                    app_iter.close()
+            else:
+                self.end_request(context, response)
 
 
 Application = WSGIApplication